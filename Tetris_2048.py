@@ -10,13 +10,29 @@ import tile
 from lib.picture import Picture  # used for displaying an image on the game menu
 from lib.color import Color  # used for coloring the game menu
 import os  # the os module is used for file and directory operations
-from game_grid import GameGrid  # the class for modeling the game grid
+import time  # used for timing the autosaves
+from game_grid import GameGrid, Journal  # the class for modeling the game grid
 from tetromino import Tetromino  # the class for modeling the tetrominoes
 import random  # used for creating tetrominoes with random types (shapes)
 import numpy as np
 from point import Point # used for tile positions
 from tile import Tile  # used for modeling each tile on the tetrominoes
 import pygame as pg # ONLY FOR MUSICS AND SOUND EFFECTS
+import replay  # used for recording the games to replay them later
+from rewind import RewindBuffer, REWIND_KEY  # used for the practice mode
+import autosave  # used for saving the game in progress to resume it later
+from leaderboard import leaderboard, DIFFICULTIES  # history of the finished games
+from telemetry import telemetry_log  # the log of the gameplay events
+from autoplayer import new_player, BUDGET_SECONDS  # the bot of the autoplay mode
+import argparse  # used for the command line options
+from collections import namedtuple  # used for the undo records
+
+# the bot that plays the games instead of the keyboard in autoplay mode (None
+# when the games are played with the keyboard)
+autoplay = None
+# the search and the time budget of a move (in seconds) of the bot (set from
+# the command line, also used when autoplay is turned on in the menu)
+autoplay_options = {"search": "greedy", "budget": BUDGET_SECONDS}
 
 # The main function where this program starts execution
 def start():
@@ -40,14 +56,28 @@ def start():
    # by using the display_game_menu function defined below
    display_game_menu(grid)
 
-def update(grid):
-   # Resetting grid
-   grid = GameGrid(grid.grid_height, grid.grid_width)
-   # Creating the first and next tetromino and assigning them to appropriate variables
-   current_tetromino = create_tetromino()
-   next_tetromino = create_tetromino()
-   grid.current_tetromino = current_tetromino
-   grid.next_tetromino = next_tetromino
+# Runs a game session; in practice mode the game can be rewound lock by lock
+# with REWIND_KEY, and the score and the replay of the game are not saved.
+# The saved game (see autosave.SavedGame) is continued when it is given.
+def update(grid, practice=False, saved_game=None):
+   if saved_game is None:
+      # Resetting grid
+      grid = GameGrid(grid.grid_height, grid.grid_width)
+      # Creating the first and next tetromino and assigning them to appropriate variables
+      current_tetromino = create_tetromino(grid.rng)
+      next_tetromino = create_tetromino(grid.rng)
+      grid.current_tetromino = current_tetromino
+      grid.next_tetromino = next_tetromino
+      # record the actions of the game to replay it later
+      recorder = replay.ReplayRecorder(grid.seed, grid.grid_height,
+                                       grid.grid_width, grid.player.getDiff())
+      tick = 0
+      # the new game replaces the saved game
+      autosave.discard()
+   else:
+      # continue the saved game (and its replay) where it was saved
+      grid, recorder, tick = saved_game.resume(grid.grid_height, grid.grid_width)
+      practice = saved_game.practice
    # Initializing Game Music
    current_dir = os.path.dirname(os.path.realpath(__file__))
    game_music_file = current_dir + "/sounds/tetris-theme.wav"
@@ -57,9 +87,21 @@ def update(grid):
    if (grid.player.getMusicCondition()):
       # Playing Menu Music Forever
       pg.mixer.music.play(-1)
+   # store the state of the game at each lock to rewind it in practice mode
+   if practice:
+      grid.rewind = RewindBuffer()
+      grid.rewind.push(grid.snapshot())
    # the main game loop
    music_paused = False
+   next_autosave = time.monotonic() + autosave.AUTOSAVE_SECONDS
+   start_time = time.monotonic()
+   # log the gameplay events (appended to the log file in batches)
+   grid.telemetry = telemetry_log
+   telemetry_log.tick = tick
+   telemetry_log.session(grid.seed, grid.player.getDiff(), practice)
+   telemetry_log.spawn(grid.current_tetromino)
    while True:
+      frame_start = time.perf_counter()
       if stddraw.mousePressed():
          mouse_x, mouse_y = stddraw.mouseX(), stddraw.mouseY() #get the coordinates of mouse that has been clicked
          # check if these coordinates are inside the pause button
@@ -67,93 +109,72 @@ def update(grid):
             if mouse_y >= 10.5 and mouse_y <= 11.5:
                playClickSound(grid.player)
                pg.mixer.music.set_volume(0)
+               # save the game, so it can be resumed if the game is exited
+               autosave.save(grid, tick, recorder, practice)
+               telemetry_log.flush()
                display_pause_menu(grid)
                pg.mixer.music.set_volume(grid.player.getVolume() / 100)
       # check for any user interaction via the keyboard
+      key_typed = None
       if stddraw.hasNextKeyTyped():  # check if the user has pressed a key
          key_typed = stddraw.nextKeyTyped()  # the most recently pressed key
-         # if the left arrow key has been pressed
-         if key_typed == "left":
-            # move the active tetromino left by one
-            current_tetromino.move(key_typed, grid)
-         # if the right arrow key has been pressed
-         elif key_typed == "right":
-            # move the active tetromino right by one
-            current_tetromino.move(key_typed, grid)
-         # if the down arrow key has been pressed
-         elif key_typed == "down":
-            # move the active tetromino down by one
-            # (soft drop: causes the tetromino to fall down faster)
-            current_tetromino.move(key_typed, grid)
-         elif key_typed == "r" or key_typed == "up":
-            # Rotates the tetromino when R key or up key pressed
-            current_tetromino.rotate(grid)
-         elif key_typed == "space":
-            # hard drop: causes the tetromino to fall down to the bottom
-            while current_tetromino.can_be_moved("down", grid):
-               current_tetromino.move("down", grid)
-
          # clear the queue of the pressed keys for a smoother interaction
          stddraw.clearKeysTyped()
 
-      # move the active tetromino down by one at each iteration (auto fall)
-      success = current_tetromino.move("down", grid)
-      game_over = grid.game_over
-
+      # go back to the previous lock in practice mode
+      if grid.rewind is not None and key_typed == REWIND_KEY:
+         grid.restore(grid.rewind.step_back())
+         if autoplay is not None:
+            autoplay.reset()  # plan the restored tetromino again
+         grid.display()
+         continue
+      # in autoplay mode the bot moves the tetromino instead of the keyboard
+      if autoplay is not None:
+         key_typed = autoplay.next_key(grid)
+
+      # apply the pressed key and move the active tetromino down by one
+      recorder.record(tick, key_typed)
+      current_tetromino = grid.current_tetromino
+      telemetry_log.tick = tick
+      logic_start = time.perf_counter()
+      game_over = game_tick(grid, key_typed)
+      logic_time = time.perf_counter() - logic_start
+      tick += 1
+      # store keyframes for seeking in the replay
+      if not game_over and grid.current_tetromino is not current_tetromino:
+         recorder.record_lock(tick, grid)
+         telemetry_log.lock(current_tetromino, grid.score)
+         telemetry_log.spawn(grid.current_tetromino)
+         if grid.rewind is not None:
+            grid.rewind.push(grid.snapshot())
+      # end the main game loop if the game is over
       if game_over:
          break
-
-      # lock the active tetromino onto the grid when it cannot go down anymore
-      if not success:
-         # get the tile matrix of the tetromino without empty rows and columns
-         # and the position of the bottom left cell in this matrix
-         tiles, pos = current_tetromino.get_min_bounded_tile_matrix(True)
-         # update the game grid by locking the tiles of the landed tetromino
-         game_over = grid.update_grid(tiles, pos)
-         # end the main game loop if the game is over
-         if game_over:
-            break
-         # check for merges when tetromino stopped
-         apply_merge(grid)
-         grid.clear_tiles()
-         # Assigning the next tetromino to current tetromino to be able to draw it on the game grid
-         current_tetromino = grid.next_tetromino
-         grid.current_tetromino = current_tetromino
-         # Modifying next_tetromino with a new random tetromino
-         grid.next_tetromino = create_tetromino()
-
-         # Keep row information if they are completely filled or not
-         row_count = is_full(grid.grid_height, grid.grid_width, grid)
-         index = 0
-         # Shift down the rows
-         while index < grid.grid_height:
-            while row_count[index]:
-               shift_down(row_count, grid)
-               row_count = is_full(grid.grid_height, grid.grid_width, grid)
-            index += 1
-
-         # Assign labels to each tile using 4-component labeling
-         labels, num_labels = connected_component_labeling(grid.tile_matrix, grid.grid_width, grid.grid_height)
-         # Find free tiles and drop down the ones not connected to others
-         free_tiles = [[False for v in range(grid.grid_width)] for b in range(grid.grid_height)]
-         free_tiles, num_free = search_free_tiles(grid.grid_height, grid.grid_width, labels, free_tiles)
-         grid.move_free_tiles(free_tiles)
-
-         # Drops down tiles that don't connect any other tiles until there is no tile to drop down
-         while num_free != 0:
-            labels, num_labels = connected_component_labeling(grid.tile_matrix, grid.grid_width, grid.grid_height)
-            free_tiles = [[False for v in range(grid.grid_width)] for b in range(grid.grid_height)]
-            free_tiles, num_free = search_free_tiles(grid.grid_height, grid.grid_width, labels, free_tiles)
-            grid.move_free_tiles(free_tiles)
-
-         labels, num_labels = connected_component_labeling(grid.tile_matrix, grid.grid_width, grid.grid_height)
-         grid.clear_tiles()
+      # save the game in progress regularly (written in the background)
+      if time.monotonic() >= next_autosave:
+         autosave.save(grid, tick, recorder, practice)
+         next_autosave = time.monotonic() + autosave.AUTOSAVE_SECONDS
 
       # display the game grid with the current tetromino
       grid.display()
-
-   # Updating high score after game is over
-   if (grid.score > grid.player.getHighScore()):
+      telemetry_log.frame(logic_time, time.perf_counter() - frame_start)
+
+   # the game is over, so there is nothing to resume anymore
+   autosave.discard()
+   telemetry_log.end(grid.score)
+   # Saving the replay of the game (rewound games cannot be replayed)
+   if not practice:
+      recorder.finish(tick, grid.score)
+      replay_path = replay.new_replay_path(grid.seed)
+      recorder.save(replay_path)
+      # store the game in the leaderboard (written in the background)
+      max_tile = max([tile.number for tile in grid.tile_matrix.flat
+                      if tile is not None] or [0])
+      leaderboard.record_game(grid.score, max_tile, recorder.locks,
+                              time.monotonic() - start_time,
+                              grid.player.getDiff(), grid.seed, replay_path)
+   # Updating high score after game is over (not in practice mode)
+   if (not practice and grid.score > grid.player.getHighScore()):
       grid.player.setHighScore(grid.score)
    # Updating save file
    grid.player.updateOnClose()
@@ -161,14 +182,167 @@ def update(grid):
    display_game_over_menu(grid)
 
 
+# Applies a user action (a key name) to the active tetromino on the game grid
+def apply_action(grid, key_typed):
+   current_tetromino = grid.current_tetromino
+   # if the left arrow key has been pressed
+   if key_typed == "left":
+      # move the active tetromino left by one
+      current_tetromino.move(key_typed, grid)
+   # if the right arrow key has been pressed
+   elif key_typed == "right":
+      # move the active tetromino right by one
+      current_tetromino.move(key_typed, grid)
+   # if the down arrow key has been pressed
+   elif key_typed == "down":
+      # move the active tetromino down by one
+      # (soft drop: causes the tetromino to fall down faster)
+      current_tetromino.move(key_typed, grid)
+   elif key_typed == "r" or key_typed == "up":
+      # Rotates the tetromino when R key or up key pressed
+      current_tetromino.rotate(grid)
+   elif key_typed == "space":
+      # hard drop: causes the tetromino to fall down to the bottom
+      while current_tetromino.can_be_moved("down", grid):
+         current_tetromino.move("down", grid)
+
+# Advances the game by one iteration of the main game loop without drawing
+# anything: applies the given action (None for no action), moves the active
+# tetromino down by one and locks it when it cannot go down anymore.
+# Returns True when the game is over and False otherwise.
+def game_tick(grid, key_typed=None):
+   if key_typed is not None:
+      apply_action(grid, key_typed)
+   # move the active tetromino down by one at each iteration (auto fall)
+   success = grid.current_tetromino.move("down", grid)
+   if grid.game_over:
+      return True
+   # lock the active tetromino onto the grid when it cannot go down anymore
+   if not success:
+      # end the game if the tetromino is locked above the game grid
+      if lock_tetromino(grid, grid.current_tetromino):
+         return True
+      # Assigning the next tetromino to current tetromino to be able to draw it on the game grid
+      grid.current_tetromino = grid.next_tetromino
+      # Modifying next_tetromino with a new random tetromino
+      grid.next_tetromino = create_tetromino(grid.rng)
+   return False
+
+# Locks the given landed tetromino onto the game grid and resolves the merges,
+# the full rows and the free tiles that follow (the lock cascade).
+# Returns True when the game is over and False otherwise.
+def lock_tetromino(grid, tetromino):
+   # get the tile matrix of the tetromino without empty rows and columns
+   # and the position of the bottom left cell in this matrix
+   tiles, pos = tetromino.get_min_bounded_tile_matrix(True)
+   # update the game grid by locking the tiles of the landed tetromino
+   game_over = grid.update_grid(tiles, pos)
+   if game_over:
+      return True
+   resolve_cascade(grid)
+   return False
+
+# Resolves the merges, the full rows and the free tiles that follow the tiles
+# locked on the game grid (the lock cascade) and returns the number of merges
+# and the number of cleared rows
+def resolve_cascade(grid):
+   # check for merges when tetromino stopped
+   merges = apply_merge(grid)
+   cleared = grid.clear_tiles()
+
+   # Keep row information if they are completely filled or not
+   row_count = is_full(grid.grid_height, grid.grid_width, grid)
+   index = 0
+   # Shift down the rows
+   while index < grid.grid_height:
+      while row_count[index]:
+         shift_down(row_count, grid)
+         cleared += 1
+         row_count = is_full(grid.grid_height, grid.grid_width, grid)
+      index += 1
+
+   # Assign labels to each tile using 4-component labeling
+   labels, num_labels = connected_component_labeling(grid.tile_matrix, grid.grid_width, grid.grid_height)
+   # Find free tiles and drop down the ones not connected to others
+   free_tiles = [[False for v in range(grid.grid_width)] for b in range(grid.grid_height)]
+   free_tiles, num_free = search_free_tiles(grid.grid_height, grid.grid_width, labels, free_tiles)
+   grid.move_free_tiles(free_tiles)
+
+   # Drops down tiles that don't connect any other tiles until there is no tile to drop down
+   while num_free != 0:
+      labels, num_labels = connected_component_labeling(grid.tile_matrix, grid.grid_width, grid.grid_height)
+      free_tiles = [[False for v in range(grid.grid_width)] for b in range(grid.grid_height)]
+      free_tiles, num_free = search_free_tiles(grid.grid_height, grid.grid_width, labels, free_tiles)
+      grid.move_free_tiles(free_tiles)
+
+   cleared += grid.clear_tiles()
+   # debug mode: check the incremental hash of the game grid
+   if grid.verify_hash:
+      grid.check_hash()
+   return merges, cleared
+
+# An undo record of apply_placement: the journal of the tile changes made by
+# the placement and its lock cascade (see game_grid.Journal), the placed tiles,
+# the number of merges, the number of cleared rows, the score gained and the
+# previous game over flag
+UndoRecord = namedtuple("UndoRecord",
+                        "changes tiles merges cleared_rows score game_over")
+
+# Locks the tiles of the given placement (see placements.Placement) on the
+# game grid, resolves the lock cascade as lock_tetromino does and returns the
+# UndoRecord that undo takes to bring the grid back to its previous state, so
+# searches can try placements on a grid without copying it. The changes are
+# journaled as they are made and the tiles of undone placements are reused,
+# so no snapshot of the grid is taken. The tetrominoes, the random numbers
+# and the telemetry of the game are not changed.
+def apply_placement(grid, placement):
+   score, game_over = grid.score, grid.game_over
+   merges, cleared = 0, 0
+   # the tried placements are not played, so they are not counted
+   telemetry, grid.telemetry = grid.telemetry, None
+   journal, grid.journal = grid.journal, Journal()
+   tiles = []
+   try:
+      for row, col, exponent in placement.cells:
+         if grid.is_inside(row, col):
+            if grid.spare_tiles:
+               tile = grid.spare_tiles.pop()
+               tile.renumber(1 << exponent)
+            else:
+               tile = Tile.with_number(1 << exponent)
+            tiles.append(tile)
+            grid.set_tile(row, col, tile)
+         # the game is over if any placed tile is above the game grid
+         else:
+            grid.game_over = True
+      if not grid.game_over:
+         merges, cleared = resolve_cascade(grid)
+   finally:
+      changes, grid.journal = grid.journal, journal
+      grid.telemetry = telemetry
+   return UndoRecord(changes, tiles, merges, cleared, grid.score - score,
+                     game_over)
+
+# Brings the game grid back to its state before the apply_placement call that
+# returned the given undo record (the records are undone in reverse order)
+def undo(grid, record):
+   grid.rollback(record.changes)
+   grid.spare_tiles.extend(record.tiles)
+   grid.score -= record.score
+   grid.game_over = record.game_over
+
 # A function for creating random shaped tetrominoes to enter the game grid
-def create_tetromino():
+# (the random values are drawn from the given generator, e.g. grid.rng, or
+# from the random module when it is not given)
+def create_tetromino(rng=None):
+   if rng is None:
+      rng = random
    # the type (shape) of the tetromino is determined randomly
    tetromino_types = ['I', 'O', 'Z', 'L', 'J', 'S', 'T']
-   random_index = random.randint(0, len(tetromino_types) - 1)
+   random_index = rng.randint(0, len(tetromino_types) - 1)
    random_type = tetromino_types[random_index]
    # create and return the tetromino
-   tetromino = Tetromino(random_type)
+   tetromino = Tetromino(random_type, rng)
    return tetromino
 
 # A function for displaying a simple menu before starting the game
@@ -221,6 +395,22 @@ def display_game_menu(grid):
    stddraw.filledRectangle(s_button_blc_x, s_button_blc_y, s_button_w, s_button_h)
    stddraw.setPenColor(text_color)
    stddraw.text(img_center_x, 2, "Settings")
+   # Practice Button (practice mode allows rewinding the game)
+   p_button_w, p_button_h = 3, 2
+   p_button_blc_x, p_button_blc_y = s_button_blc_x - 1 - p_button_w, 1
+   stddraw.setPenColor(button_color)
+   stddraw.filledRectangle(p_button_blc_x, p_button_blc_y, p_button_w, p_button_h)
+   stddraw.setPenColor(text_color)
+   stddraw.text(p_button_blc_x + p_button_w / 2, 2, "Practice")
+   # Resume Button (only when there is a saved game in progress)
+   saved_game = autosave.SavedGame.load()
+   r_button_w, r_button_h = 3, 2
+   r_button_blc_x, r_button_blc_y = s_button_blc_x + s_button_w + 1, 1
+   if saved_game is not None:
+      stddraw.setPenColor(button_color)
+      stddraw.filledRectangle(r_button_blc_x, r_button_blc_y, r_button_w, r_button_h)
+      stddraw.setPenColor(text_color)
+      stddraw.text(r_button_blc_x + r_button_w / 2, 2, "Resume")
    # the user interaction loop for the simple menu
    while True:
       # display the menu and wait for a short time (50 ms)
@@ -236,6 +426,19 @@ def display_game_menu(grid):
                # Initializing and Playing Click Sound
                playClickSound(grid.player)
                display_settings_menu(grid) # Opens the settings page
+         # check if these coordinates are inside the practice button
+         if mouse_x >= p_button_blc_x and mouse_x <= p_button_blc_x + p_button_w:
+            if mouse_y >= p_button_blc_y and mouse_y <= p_button_blc_y + p_button_h:
+               pg.mixer.music.stop()
+               playClickSound(grid.player)
+               update(grid, practice=True)  # start the game in practice mode
+         # check if these coordinates are inside the resume button
+         if saved_game is not None:
+            if mouse_x >= r_button_blc_x and mouse_x <= r_button_blc_x + r_button_w:
+               if mouse_y >= r_button_blc_y and mouse_y <= r_button_blc_y + r_button_h:
+                  pg.mixer.music.stop()
+                  playClickSound(grid.player)
+                  update(grid, saved_game=saved_game)  # continue the saved game
          # check if these coordinates are inside the start button
          if mouse_x >= button_blc_x and mouse_x <= button_blc_x + button_w:
             if mouse_y >= button_blc_y and mouse_y <= button_blc_y + button_h:
@@ -246,6 +449,7 @@ def display_game_menu(grid):
 
 # A function for displaying a settings menu before starting the game
 def display_settings_menu(grid):
+   global autoplay  # toggled with the autoplay on-off button
    # Initializing height, weight and player variables
    grid_height = grid.grid_height
    grid_width = grid.grid_width
@@ -277,6 +481,8 @@ def display_settings_menu(grid):
       stddraw.text(img_center_x - 6, 13, "Music")
       # Difficulty Text
       stddraw.text(img_center_x - 6, 11, "Difficulty")
+      # Autoplay Text
+      stddraw.text(img_center_x - 6, 9, "Autoplay")
       # Difficulty Level Text
       difficulty_level_text = ""
       if player.getDiff() == 0:
@@ -310,6 +516,12 @@ def display_settings_menu(grid):
       else:
          stddraw.setPenColor(Color(255, 0, 42))
       stddraw.filledRectangle(img_center_x + 6, 12.7, 0.5, 0.5)
+      # Autoplay On-Off Button
+      if autoplay is not None:
+         stddraw.setPenColor(Color(9, 255, 0))
+      else:
+         stddraw.setPenColor(Color(255, 0, 42))
+      stddraw.filledRectangle(img_center_x + 6, 8.7, 0.5, 0.5)
       # Music Volume
       stddraw.setPenColor(button_color)
       stddraw.text(img_center_x + 6.2, 15, str(player.getVolume()))
@@ -357,6 +569,12 @@ def display_settings_menu(grid):
                   playClickSound(grid.player)
                   player.turnMusicOn()
                   pg.mixer.music.set_volume(grid.player.getVolume() / 100)
+         # check if these coordinates are inside the autoplay on-off button
+         if mouse_x >= img_center_x + 6 and mouse_x <= img_center_x + 6 + 2:
+            if mouse_y >= 8.5 and mouse_y <= 9.5:
+               playClickSound(grid.player)
+               autoplay = None if autoplay is not None else \
+                  new_player(**autoplay_options)
          # check if these coordinates are inside the start button
          if mouse_x >= b_button_blc_x and mouse_x <= b_button_blc_x + b_button_w:
             if mouse_y >= b_button_blc_y and mouse_y <= b_button_blc_y + b_button_h:
@@ -377,6 +595,10 @@ def display_game_over_menu(grid):
    text_color = Color(31, 160, 239)
    # Initializing and Playing Game Over Sound
    playGameOverSound(grid.player)
+   # the best games of the difficulty level are queried in the background and
+   # shown when the result is ready
+   difficulty = grid.player.getDiff()
+   top_games = leaderboard.top(10, difficulty)
    while True:
       # clear the background drawing canvas to background_color
       stddraw.clear(background_color)
@@ -397,6 +619,19 @@ def display_game_over_menu(grid):
          stddraw.setPenColor(Color(255, 255, 255))
          stddraw.setFontSize(40)
          stddraw.text(img_center_x, 10, "YOU WIN!")
+      # Top 10 games of the difficulty level in two columns
+      stddraw.setPenColor(Color(255, 255, 255))
+      stddraw.setFontSize(22)
+      stddraw.text(img_center_x, 8.9, "TOP 10 (" + DIFFICULTIES[difficulty] + ")")
+      stddraw.setFontSize(18)
+      if not top_games.done():
+         stddraw.text(img_center_x, 7.5, "Loading...")
+      elif top_games.exception() is None:
+         for rank, game in enumerate(top_games.result()):
+            column_x = img_center_x - 4 if rank < 5 else img_center_x + 4
+            stddraw.text(column_x, 8.2 - (rank % 5) * 0.55,
+                         "%d. %d (max tile %d)" % (rank + 1, game["score"],
+                                                   game["max_tile"]))
       # Changing Font Size for Button Texts
       stddraw.setFontSize(35)
       # Restart Button
@@ -465,12 +700,14 @@ def is_full(grid_h, grid_w, grid):
 def shift_down(row_count, grid):
    for index, i in enumerate(row_count):
       if i:
-         for a in range(index, 19):
-            row = np.copy(grid.tile_matrix[a + 1])
-            grid.tile_matrix[a] = row
-            for b in range(12):
+         for a in range(index, grid.grid_height - 1):
+            for b in range(grid.grid_width):
+               grid.set_tile(a, b, grid.tile_matrix[a + 1][b])
                if grid.tile_matrix[a][b] is not None:
                   grid.tile_matrix[a][b].move(0, -1)
+         # the full row has been removed
+         if grid.telemetry is not None:
+            grid.telemetry.clear()
          break
 
 # Searches and finds tiles which do not connect to others
@@ -504,7 +741,7 @@ def shift_down_free_tiles(grid):
 def apply_merge(grid):
     height = grid.grid_height
     width = grid.grid_width
-    merged = False
+    merges = 0  # the number of merges
     while True:
         # Flag to track if any merging occurred in this iteration
         merged_this_iteration = False
@@ -519,8 +756,7 @@ def apply_merge(grid):
                     continue
                 # If the tile below is empty, move the current tile down
                 if grid.tile_matrix[row - 1][column] is None:
-                    grid.tile_matrix[row - 1][column] = grid.tile_matrix[row][column]
-                    grid.tile_matrix[row][column] = None
+                    grid.move_tile(row, column, row - 1, column)
                     moved_down = True
             # Merge tiles in this column
             row = 0
@@ -532,36 +768,27 @@ def apply_merge(grid):
                 # Merge vertically if the tile below has the same number
                 if grid.tile_matrix[row][column].number == grid.tile_matrix[row + 1][column].number:
                     # Double the number of the current tile
-                    grid.tile_matrix[row][column].number *= 2
+                    grid.double_tile(row, column)
                     # Increase score
                     grid.score += grid.tile_matrix[row][column].number
                     # Remove the tile below
-                    grid.tile_matrix[row + 1][column] = None
+                    grid.set_tile(row + 1, column, None)
                     # Update color if necessary
                     updateColor(grid.tile_matrix[row][column], grid.tile_matrix[row][column].number)
+                    if grid.telemetry is not None:
+                        grid.telemetry.merge(grid.tile_matrix[row][column].number)
                     merged_this_iteration = True  # Set the flag to True
+                    merges += 1
                     row += 1
                 else:
                     row += 1
         # If no merging or movement occurred in this iteration, break the loop
         if not moved_down and not merged_this_iteration:
             break
-        merged = True
+    return merges
 
 def updateColor(tile, num):
-   colors = {
-         2: (238, 228, 218),  # lightgray
-         4: (236, 224, 200),  # lightblue
-         8: (243, 177, 121),  # orange
-         16: (245, 149, 99),  # coral
-         32: (246, 124, 95),  # red
-         64: (246, 94, 59),  # purple
-         128: (237, 207, 114),  # green
-         256: (237, 204, 97),  # blue
-         512: (237, 200, 80),  # etc.
-         1024: (237, 197, 63),
-         2048: (237, 194, 46),
-      }
+   colors = Tile.colors
    if num in colors:
       # Update the colors by num value
       color = colors[num]
@@ -629,6 +856,9 @@ def update_min_equivalent_labels(all_min_eq_labels, min_eq_labels_to_merge):
 
 # Function to rearrange minimum equivalent labels so they all have consecutive values starting from 1.
 def rearrange_min_equivalent_labels(min_equivalent_labels):
+   # nothing to rearrange when there are no tiles (e.g. the last row is cleared)
+   if len(min_equivalent_labels) == 0:
+      return
    # find different values of min equivalent labels and sort them in increasing order
    different_labels = set(min_equivalent_labels)
    different_labels_sorted = sorted(different_labels)
@@ -734,4 +964,18 @@ def display_pause_menu(grid):
 # the program starts execution
 
 if __name__ == '__main__':
+   parser = argparse.ArgumentParser(description="Tetris 2048")
+   parser.add_argument("--autoplay", action="store_true",
+                       help="let the bot play the games (see autoplayer.py)")
+   parser.add_argument("--budget", type=float, default=50,
+                       help="time budget of a move of the bot in milliseconds")
+   parser.add_argument("--search", choices=["greedy", "expectimax"],
+                       default="greedy", help="how the bot chooses its moves")
+   parser.add_argument("--verify-hash", action="store_true",
+                       help="check the hash of the game grid after each lock")
+   args = parser.parse_args()
+   GameGrid.verify_hash = args.verify_hash
+   autoplay_options = {"search": args.search, "budget": args.budget / 1000}
+   if args.autoplay:
+      autoplay = new_player(**autoplay_options)
    start()
@@ -0,0 +1,182 @@
+################################################################################
+#                                                                              #
+# Columnar archive of game sessions for bulk analytics                          #
+#                                                                              #
+# Usage: python archive.py export OUT_DIR REPLAY... [--chunk-sessions 1000]    #
+#        python archive.py info OUT_DIR                                        #
+#                                                                              #
+################################################################################
+
+# The sessions (recorded as replays, see replay.py) are played again and packed
+# into columnar NumPy arrays, stored as one .npy file per column, so that
+# analysis scripts can load them with np.load(path, mmap_mode='r') without
+# parsing anything. The sessions are split into chunks (folders) of at most
+# chunk_sessions sessions, so archives of millions of games are written with
+# bounded memory. There are three tables in each chunk (the session column is
+# the index of the session in the whole archive):
+#   sessions  seed (u64), difficulty (u8), score (i64, final score), ticks
+#             (i32, length of the game), locks (i32), seconds (f32, length of
+#             the game at the speed of its difficulty level)
+#   actions   session (i64), tick (i32), action (u8, action code of replay.py)
+#             for each tick with an action
+#   locks     session (i64), tick (i32), score (i64, after the lock cascade),
+#             piece (u8, index in tetromino.TYPES) and board (u8, (h, w) tile
+#             exponents, 0 for empty cells) after each lock
+# The archive folder also has a manifest.json listing the chunks and columns.
+
+import os  # the os module is used for file and directory operations
+import sys
+import json
+import argparse
+import numpy as np
+from tetromino import TYPES  # the types of the tetrominoes
+import replay  # the recorded sessions
+
+TABLES = {
+   "sessions": {"seed": np.uint64, "difficulty": np.uint8, "score": np.int64,
+                "ticks": np.int32, "locks": np.int32, "seconds": np.float32},
+   "actions": {"session": np.int64, "tick": np.int32, "action": np.uint8},
+   "locks": {"session": np.int64, "tick": np.int32, "score": np.int64,
+             "piece": np.uint8, "board": np.uint8},
+}
+CHUNK_SESSIONS = 1000
+
+
+# Plays the given replay again and returns the columns of its session as a
+# dictionary of table name -> column name -> list of values
+def session_columns(game_replay):
+   locks = {"tick": [], "score": [], "piece": [], "board": []}
+   # the tetromino that was falling at the end of the previous tick
+   falling = [None]
+   def on_tick(grid, tick):
+      if falling[0] is not None and grid.current_tetromino is not falling[0]:
+         locks["tick"].append(tick)
+         locks["score"].append(grid.score)
+         locks["piece"].append(TYPES.index(falling[0].type))
+         locks["board"].append(grid.tile_exponents())
+      falling[0] = grid.current_tetromino
+   grid = game_replay.new_game()
+   falling[0] = grid.current_tetromino
+   grid, ticks = game_replay.simulate(on_tick, grid=grid)
+   action_ticks = sorted(game_replay.actions)
+   seconds = ticks * replay.TICK_MS.get(game_replay.difficulty, 250) / 1000
+   return {
+      "sessions": {"seed": [game_replay.seed],
+                   "difficulty": [game_replay.difficulty],
+                   "score": [grid.score], "ticks": [ticks],
+                   "locks": [len(locks["tick"])], "seconds": [seconds]},
+      "actions": {"tick": action_ticks,
+                  "action": [replay.ACTION_CODES[game_replay.actions[tick]]
+                             for tick in action_ticks]},
+      "locks": locks,
+   }
+
+# A class for writing sessions to a columnar archive chunk by chunk
+class ArchiveWriter:
+   def __init__(self, path, chunk_sessions=CHUNK_SESSIONS):
+      self.path = path
+      self.chunk_sessions = chunk_sessions
+      self.sessions = 0  # the number of sessions written
+      self.chunks = []  # the names of the written chunks
+      self.shape = None  # the (h, w) shape of the boards of all the sessions
+      self.pending = []  # the columns of the sessions of the next chunk
+      os.makedirs(path, exist_ok=True)
+
+   # Adds the session recorded in the given replay (raises ValueError when
+   # its game grid has another shape than the sessions already added, as the
+   # boards of the archive are stored with one shape)
+   def add_replay(self, game_replay):
+      shape = (game_replay.grid_height, game_replay.grid_width)
+      if self.shape is None:
+         self.shape = shape
+      elif shape != self.shape:
+         raise ValueError("the session is on a %dx%d game grid, not %dx%d" %
+                          (shape + self.shape))
+      self.pending.append(session_columns(game_replay))
+      if len(self.pending) >= self.chunk_sessions:
+         self.write_chunk()
+
+   # Writes the pending sessions as a new chunk
+   def write_chunk(self):
+      if not self.pending:
+         return
+      name = "chunk-%05d" % len(self.chunks)
+      folder = os.path.join(self.path, name)
+      os.makedirs(folder, exist_ok=True)
+      for table, columns in TABLES.items():
+         for column, dtype in columns.items():
+            values = []
+            for index, session in enumerate(self.pending):
+               if column == "session":
+                  # the session index of each row of the table
+                  rows = len(session[table]["tick"])
+                  values.append(np.full(rows, self.sessions + index, dtype))
+               elif column == "board":
+                  boards = b"".join(session[table]["board"])
+                  values.append(np.frombuffer(boards, dtype).reshape(
+                     (-1,) + self.shape))
+               else:
+                  values.append(np.asarray(session[table][column], dtype))
+            np.save(os.path.join(folder, "%s.%s.npy" % (table, column)),
+                    np.concatenate(values))
+      self.sessions += len(self.pending)
+      self.chunks.append(name)
+      self.pending = []
+
+   # Writes the remaining sessions and the manifest of the archive
+   def close(self):
+      self.write_chunk()
+      manifest = {"sessions": self.sessions, "chunks": self.chunks,
+                  "board_shape": self.shape,
+                  "tables": {table: {column: np.dtype(dtype).name
+                                     for column, dtype in columns.items()}
+                             for table, columns in TABLES.items()}}
+      with open(os.path.join(self.path, "manifest.json"), "w") as manifest_file:
+         json.dump(manifest, manifest_file, indent=2)
+
+# Returns the manifest of the archive at the given path
+def load_manifest(path):
+   with open(os.path.join(path, "manifest.json")) as manifest_file:
+      return json.load(manifest_file)
+
+# Yields the chunks of the archive at the given path, each as a dictionary of
+# table name -> column name -> memory-mapped array
+def load_chunks(path, mmap_mode="r"):
+   manifest = load_manifest(path)
+   for name in manifest["chunks"]:
+      folder = os.path.join(path, name)
+      yield {table: {column: np.load(os.path.join(folder, "%s.%s.npy" % (
+                        table, column)), mmap_mode=mmap_mode)
+                     for column in columns}
+             for table, columns in manifest["tables"].items()}
+
+def main(argv=None):
+   parser = argparse.ArgumentParser(description="Tetris 2048 session archive")
+   parser.add_argument("command", choices=["export", "info"])
+   parser.add_argument("archive", help="the folder of the archive")
+   parser.add_argument("replays", nargs="*", help="replay files to export")
+   parser.add_argument("--chunk-sessions", type=int, default=CHUNK_SESSIONS)
+   args = parser.parse_args(argv)
+
+   if args.command == "export":
+      writer = ArchiveWriter(args.archive, args.chunk_sessions)
+      for path in args.replays:
+         try:
+            writer.add_replay(replay.Replay.load(path))
+         except ValueError as error:
+            print("skipping %s: %s" % (path, error), file=sys.stderr)
+      writer.close()
+   manifest = load_manifest(args.archive)
+   locks, scores = 0, []
+   for chunk in load_chunks(args.archive):
+      locks += len(chunk["locks"]["tick"])
+      scores.append(np.asarray(chunk["sessions"]["score"]))
+   scores = np.concatenate(scores) if scores else np.zeros(0)
+   print("%d sessions in %d chunks, %d locks" % (
+      manifest["sessions"], len(manifest["chunks"]), locks))
+   if len(scores):
+      print("score: mean %.1f, max %d" % (scores.mean(), scores.max()))
+   return 0
+
+if __name__ == '__main__':
+   sys.exit(main())
@@ -0,0 +1,253 @@
+################################################################################
+#                                                                              #
+# Autoplayer: a bot that plays Tetris 2048 by searching the placements of the  #
+# current tetromino and scoring them with a heuristic                          #
+#                                                                              #
+# Usage: python autoplayer.py [--games 10] [--seed 0] [--budget 50]            #
+#                             [--weight holes=-4 ...] [--max-locks 1000]       #
+#                             [--search expectimax [--depth 3]]                #
+#        (plays headless games and prints the scores and decision times)      #
+#                                                                              #
+################################################################################
+
+# For each new tetromino the autoplayer enumerates its placements (see
+# placements.py), locks it at each of them on a copy of the board with the
+# lock cascade of the game (merges and row clears, see batch_env.py, all of
+# the candidates at once) and chooses the placement whose resulting board has
+# the best score:
+#   height     aggregate height (sum of the heights of the columns)
+#   holes      empty cells below the top tile of their column
+#   bumpiness  sum of the height differences of the neighboring columns
+#   merges     tiles merged by the lock (the lock cascade leaves no equal
+#              vertical neighbors, so the merges are counted as they happen)
+#   clears     rows cleared by the lock
+#   score      points gained by the lock (merges and cleared rows)
+# each multiplied by its weight. The keys of the chosen placement are then
+# played one per tick, so the autoplayer plays at any speed of the game. The
+# candidates are scored in batches until the time budget of the move runs
+# out, so a move never takes much longer than the budget.
+
+import sys
+import time
+import argparse
+from collections import deque
+import numpy as np
+from placements import enumerate_placements
+from batch_env import merge_tiles, clear_rows  # the lock cascade of the game
+from game_grid import GameGrid  # the class for modeling the game grid
+
+# the default weights of the heuristic
+WEIGHTS = {"height": -0.5, "holes": -4.0, "bumpiness": -0.4, "merges": 1.0,
+           "clears": 6.0, "score": 0.01}
+# the default time budget of a move (in seconds)
+BUDGET_SECONDS = 0.05
+# the number of candidates scored at once
+BATCH_SIZE = 16
+# the default number of locks after which the headless games are stopped (the
+# bot rarely loses)
+MAX_LOCKS = 1000
+
+
+# Returns the features of the heuristic of the given boards (an (M, h, w)
+# array of tile exponents) as a dictionary of arrays
+def board_features(boards):
+   occupied = boards != 0
+   grid_h = boards.shape[1]
+   # the height of a column is the row of its top tile + 1
+   heights = np.where(occupied.any(axis=1),
+                      grid_h - np.argmax(occupied[:, ::-1], axis=1), 0)
+   return {"height": heights.sum(axis=1),
+           "holes": heights.sum(axis=1) - occupied.sum(axis=(1, 2)),
+           "bumpiness": np.abs(np.diff(heights, axis=1)).sum(axis=1)}
+
+# Runs the lock cascade on the given boards (an (M, h, w) array of tile
+# exponents) in place and returns the points gained, the numbers of merges
+# (each merge removes a tile) and the numbers of cleared rows
+def lock_cascade(boards):
+   tiles = (boards != 0).sum(axis=(1, 2))
+   score = merge_tiles(boards)
+   occupied = boards != 0
+   merges = tiles - occupied.sum(axis=(1, 2))
+   clears = occupied.all(axis=2).sum(axis=1)
+   score += clear_rows(boards)
+   return score, merges, clears
+
+# Locks the given placements on copies of the given board (an (h, w) array of
+# tile exponents) and returns the resulting boards, the points gained, the
+# numbers of merges and cleared rows and which placements end the game
+def lock_placements(board, placements):
+   grid_h = board.shape[0]
+   boards = np.repeat(board[None], len(placements), axis=0)
+   over = np.zeros(len(placements), bool)
+   for i, placement in enumerate(placements):
+      for row, col, exponent in placement.cells:
+         if row >= grid_h:
+            over[i] = True  # a tile is locked above the game grid
+         else:
+            boards[i, row, col] = exponent
+   return (boards,) + lock_cascade(boards) + (over,)
+
+# Returns the weighted sum of the features of the given boards
+def board_values(boards, weights):
+   features = board_features(boards)
+   return sum(weights[name] * values for name, values in features.items())
+
+# Returns the weighted sum of the features of the locks with the given points
+# gained and numbers of merges and cleared rows
+def lock_values(score, merges, clears, weights):
+   return weights["merges"] * merges + weights["clears"] * clears + \
+      weights["score"] * score
+
+# Returns the heuristic score of the given placements on the given board
+def score_placements(board, placements, weights):
+   boards, score, merges, clears, over = lock_placements(board, placements)
+   values = board_values(boards, weights) + \
+      lock_values(score, merges, clears, weights)
+   return np.where(over, -np.inf, values)
+
+# A class for the bot playing the game in place of the keyboard
+class AutoPlayer:
+   def __init__(self, weights=None, budget=BUDGET_SECONDS):
+      self.weights = dict(WEIGHTS if weights is None else weights)
+      self.budget = budget
+      self.tetromino = None  # the tetromino of the planned keys
+      self.keys = deque()  # the keys of the chosen placement to be played
+      self.decision_times = []  # the time taken by each decision (seconds)
+
+   # Forgets the planned keys (e.g. when the game is rewound)
+   def reset(self):
+      self.tetromino = None
+      self.keys.clear()
+
+   # Returns the key to play at this tick of the game on the given game grid
+   # (None for no action)
+   def next_key(self, grid):
+      if grid.current_tetromino is not self.tetromino:
+         self.tetromino = grid.current_tetromino
+         placement = self.choose(grid)
+         self.keys = deque(placement.keys if placement is not None else ())
+      return self.keys.popleft() if self.keys else None
+
+   # Returns the best placement of the current tetromino of the given game
+   # grid found within the time budget (None when there is none)
+   def choose(self, grid):
+      start = time.perf_counter()
+      deadline = start + self.budget
+      candidates = enumerate_placements(grid)
+      board = np.frombuffer(grid.tile_exponents(), np.uint8).reshape(
+         grid.grid_height, grid.grid_width)
+      best, best_value = None, -np.inf
+      # the placements are found in the order of the ticks they take, so the
+      # closest ones are scored first
+      for i in range(0, len(candidates), BATCH_SIZE):
+         batch = candidates[i:i + BATCH_SIZE]
+         values = score_placements(board, batch, self.weights)
+         index = int(np.argmax(values))
+         if best is None or values[index] > best_value:
+            best, best_value = batch[index], values[index]
+         if time.perf_counter() >= deadline:
+            break
+      self.decision_times.append(time.perf_counter() - start)
+      return best
+
+# Returns a new autoplayer choosing the placements with the given search
+# ("greedy" or "expectimax", see expectimax.py)
+def new_player(search="greedy", weights=None, budget=BUDGET_SECONDS,
+               depth=None):
+   if search == "expectimax":
+      from expectimax import ExpectimaxPlayer, DEPTH
+      return ExpectimaxPlayer(weights, budget, depth or DEPTH)
+   return AutoPlayer(weights, budget)
+
+# A class for tracking the largest tile number made by a merge in a headless
+# game, in place of the telemetry log of the game grid (see telemetry.py)
+class MergeTracker:
+   def __init__(self):
+      self.max_tile = 0
+
+   # Records a merge making a tile with the given number
+   def merge(self, value):
+      self.max_tile = max(self.max_tile, value)
+
+   # Records a row clear (nothing to track)
+   def clear(self):
+      pass
+
+# Plays a game with the given seed headless (without drawing anything) with
+# the given autoplayer until it is over (or max_locks tetrominoes are locked)
+# and returns the final game grid, the number of locks and the largest tile
+# number reached (including the tiles merged and cleared by the same lock)
+def play_game(player, seed, grid_h=20, grid_w=12, max_locks=None):
+   import Tetris_2048 as game  # the game rules (only needed for playing)
+   from tetromino import Tetromino
+   Tetromino.grid_height, Tetromino.grid_width = grid_h, grid_w
+   grid = GameGrid(grid_h, grid_w, seed)
+   grid.telemetry = MergeTracker()
+   grid.current_tetromino = game.create_tetromino(grid.rng)
+   grid.next_tetromino = game.create_tetromino(grid.rng)
+   player.reset()
+   locks, max_exponent = 0, 0
+   while max_locks is None or locks < max_locks:
+      current = grid.current_tetromino
+      if game.game_tick(grid, player.next_key(grid)):
+         break
+      if grid.current_tetromino is not current:
+         locks += 1
+         max_exponent = max(max_exponent, max(grid.tile_exponents()))
+   return grid, locks, max(grid.telemetry.max_tile,
+                           1 << max_exponent if max_exponent else 0)
+
+# Returns the weights given as NAME=VALUE strings on top of the defaults
+def parse_weights(items):
+   weights = dict(WEIGHTS)
+   for item in items:
+      name, _, value = item.partition("=")
+      if name not in WEIGHTS:
+         raise ValueError("unknown weight %r (one of %s)" % (
+            name, ", ".join(WEIGHTS)))
+      weights[name] = float(value)
+   return weights
+
+def main(argv=None):
+   parser = argparse.ArgumentParser(description="Tetris 2048 autoplayer")
+   parser.add_argument("--games", type=int, default=10)
+   parser.add_argument("--seed", type=int, default=0)
+   parser.add_argument("--budget", type=float, default=BUDGET_SECONDS * 1000,
+                       help="time budget of a move in milliseconds")
+   parser.add_argument("--weight", action="append", default=[],
+                       help="a weight of the heuristic as NAME=VALUE")
+   parser.add_argument("--max-locks", type=int, default=MAX_LOCKS,
+                       help="stop the games after N locks (0 for no limit)")
+   parser.add_argument("--search", choices=["greedy", "expectimax"],
+                       default="greedy", help="how the placements are chosen")
+   parser.add_argument("--depth", type=int, help="maximum depth of expectimax")
+   parser.add_argument("--verify-hash", action="store_true",
+                       help="check the hash of the game grid after each lock")
+   args = parser.parse_args(argv)
+   GameGrid.verify_hash = args.verify_hash
+
+   player = new_player(args.search, parse_weights(args.weight),
+                       args.budget / 1000, args.depth)
+   scores = []
+   start = time.perf_counter()
+   for game_index in range(args.games):
+      grid, locks, max_tile = play_game(player, args.seed + game_index,
+                                        max_locks=args.max_locks or None)
+      scores.append(grid.score)
+      print("game %d: score %d, max tile %d, %d locks" % (
+         game_index, grid.score, max_tile, locks))
+   elapsed = time.perf_counter() - start
+   times = np.array(player.decision_times) * 1000
+   print("mean score %.1f, best %d, %.1f s" % (np.mean(scores), max(scores),
+                                               elapsed))
+   print("decision time: mean %.2f ms, p99 %.2f ms, max %.2f ms" % (
+      times.mean(), np.percentile(times, 99), times.max()))
+   if args.search == "expectimax":
+      table = player.table
+      print("mean depth %.2f, transposition table hit rate %.1f%%" % (
+         np.mean(player.depths),
+         100 * table.hits / max(table.hits + table.misses, 1)))
+   return 0
+
+if __name__ == '__main__':
+   sys.exit(main())
@@ -0,0 +1,86 @@
+################################################################################
+#                                                                              #
+# Autosave of the game in progress, so that a game can be resumed after the    #
+# window is closed or the game crashes                                         #
+#                                                                              #
+################################################################################
+
+# The game in progress is saved regularly (every AUTOSAVE_SECONDS) to a single
+# file, written atomically on a background thread (see persistence.py), so
+# saving never makes the game loop wait. The file format (all integers are
+# little endian):
+#   magic     4 bytes "T2SV"
+#   header    version (u8), practice mode (u8), seed (u64), tick (u32), tick of
+#             the last replay record (u32), number of locks (u32) and length
+#             of the replay recorded so far (u32)
+#   replay    the replay recorded so far, so the replay of a resumed game
+#             covers the whole game
+#   snapshot  the state of the game (see GameGrid.snapshot)
+
+import os  # the os module is used for file and directory operations
+import struct
+from game_grid import GameGrid  # the class for modeling the game grid
+from persistence import writer  # writes the files in the background
+import replay  # used for continuing the replay of a resumed game
+
+MAGIC = b"T2SV"
+VERSION = 1
+HEADER = struct.Struct("<BBQIIII")
+# the time between two autosaves of the game in progress (in seconds)
+AUTOSAVE_SECONDS = 5
+
+
+# Returns the path of the autosave file in the save folder of the game
+def autosave_path():
+   current_dir = os.path.dirname(os.path.realpath(__file__))
+   return current_dir + "/save/autosave.t2s"
+
+# Returns the bytes of the autosave file for the given game at the given tick
+def encode(grid, tick, recorder, practice=False):
+   replay_data, last_tick, locks = recorder.get_state()
+   return b"".join((MAGIC, HEADER.pack(VERSION, practice, grid.seed, tick,
+                                       last_tick, locks, len(replay_data)),
+                    replay_data, grid.snapshot()))
+
+# Saves the given game at the given tick in the background; only the snapshot
+# is taken on the calling thread, which takes a few microseconds
+def save(grid, tick, recorder, practice=False):
+   writer.write(autosave_path(), encode(grid, tick, recorder, practice))
+
+# Removes the autosave file (e.g. when the saved game is over)
+def discard():
+   writer.remove(autosave_path())
+
+# A class for a saved game that can be resumed
+class SavedGame:
+   def __init__(self, data):
+      if data[:4] != MAGIC:
+         raise ValueError("not a Tetris 2048 saved game")
+      if data[4] != VERSION:
+         raise ValueError("unsupported saved game version %d" % data[4])
+      version, practice, self.seed, self.tick, self.last_tick, self.locks, \
+         replay_length = HEADER.unpack_from(data, 4)
+      self.practice = bool(practice)
+      offset = 4 + HEADER.size
+      self.replay_data = data[offset:offset + replay_length]
+      self.snapshot = data[offset + replay_length:]
+
+   # Loads the saved game from the autosave file, or returns None when there
+   # is no saved game (or the file cannot be read)
+   @staticmethod
+   def load(path=None):
+      writer.flush()  # the newest save may still be being written
+      try:
+         with open(path or autosave_path(), "rb") as save_file:
+            return SavedGame(save_file.read())
+      except (OSError, ValueError, struct.error):
+         return None
+
+   # Returns the game grid, the replay recorder and the tick of the saved game
+   # for continuing it on a game grid with the given dimensions
+   def resume(self, grid_h, grid_w):
+      grid = GameGrid(grid_h, grid_w, self.seed)
+      grid.restore(self.snapshot)
+      recorder = replay.ReplayRecorder.from_state(self.replay_data,
+                                                  self.last_tick, self.locks)
+      return grid, recorder, self.tick
@@ -0,0 +1,450 @@
+################################################################################
+#                                                                              #
+# Batched game rules: many game sessions stepped in lockstep with NumPy        #
+#                                                                              #
+# Usage: python batch_env.py check [--games 64] [--ticks 2000] [--seed 0]      #
+#        python batch_env.py bench [--games 4096] [--ticks 200]                #
+#                                                                              #
+################################################################################
+
+# The locked tiles of N games are stored as one (N, h, w) uint8 array of tile
+# exponents (0 for empty cells, row 0 at the bottom as in GameGrid) and their
+# tetrominoes as arrays of types, rotations, positions and 4x4 matrices of
+# tile exponents, so that the moves, the collisions, the gravity, the merges
+# and the row clears of the whole batch are computed with NumPy operations
+# instead of a Python loop over the games. The rules are the ones of
+# Tetris_2048.game_tick, down to the random values: each game has its own
+# SplitMix64 state (see game_random.py) and draws the same numbers as a
+# GameGrid with the same seed, so every game of the batch can be compared
+# with the scalar game (see check).
+
+import sys
+import time
+import argparse
+import numpy as np
+from game_grid import SNAPSHOT_HEADER  # the layout of the game snapshots
+from game_random import new_seed
+from tetromino import TYPES, SHAPES, SNAPSHOT as TETROMINO_SNAPSHOT, \
+   NO_TETROMINO
+
+# the action codes (the same as the action codes of the replays, see
+# replay.ACTION_CODES) and the keys of the actions
+NO_ACTION, LEFT, RIGHT, DOWN, ROTATE, DROP = range(6)
+ACTION_KEYS = (None, "left", "right", "down", "up", "space")
+
+# the number of rows (= number of columns) of the tile matrix of each type of
+# tetromino (in the order of TYPES)
+SIZES = np.array([SHAPES[shape][0] for shape in TYPES])
+# the tile matrices are stored as 16 cells (a 4x4 matrix row by row, row 0 at
+# the top as in Tetromino.tile_matrix) whatever the type of the tetromino
+CELL_ROWS, CELL_COLS = np.divmod(np.arange(16), 4)
+# the vertical offset of each cell from the bottom left cell of the tetromino
+# by the size of the tile matrix
+CELL_DY = np.array([n - 1 - CELL_ROWS for n in range(5)])
+# the cells inside the tile matrix by its size
+BOX = np.array([(CELL_ROWS < n) & (CELL_COLS < n) for n in range(5)])
+# the cell of the tile matrix that each cell comes from when the tetromino is
+# rotated clockwise (as in Tetromino.rotate) by the size of the tile matrix;
+# the cells outside the matrix come from the last cell, which is empty
+ROTATED = np.array([np.where(BOX[n], (n - 1 - CELL_COLS) * 4 + CELL_ROWS, 15)
+                    for n in range(5)])
+# the occupied cells of each type of tetromino in the order in which their
+# tiles are created (see Tetromino.__init__)
+SPAWN_CELLS = np.array([[row * 4 + col for col, row in SHAPES[shape][1]]
+                        for shape in TYPES])
+# the bit length of the integers below 256 (for drawing random integers)
+BIT_LENGTHS = np.array([value.bit_length() for value in range(256)])
+
+# the constants of the SplitMix64 generator (see GameRandom.next64)
+GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+MIX_1, MIX_2 = np.uint64(0xBF58476D1CE4E5B9), np.uint64(0x94D049BB133111EB)
+
+
+# Advances the random number generators of the given games (an array of
+# SplitMix64 states) and returns their next 64-bit outputs
+def next64(states, games):
+   state = states[games] + GOLDEN
+   states[games] = state
+   z = (state ^ (state >> np.uint64(30))) * MIX_1
+   z = (z ^ (z >> np.uint64(27))) * MIX_2
+   return z ^ (z >> np.uint64(31))
+
+# Returns a random integer in [0, n) for each of the given games, drawn as
+# random.Random.randint draws it (random bits with rejection sampling)
+def rand_below(states, games, n):
+   bits = BIT_LENGTHS[n]
+   result = np.empty(len(games), np.int64)
+   pending = np.arange(len(games))
+   while len(pending):
+      values = next64(states, games[pending]) >> (64 - bits[pending]).astype(
+         np.uint64)
+      accepted = values < n[pending]
+      result[pending[accepted]] = values[accepted]
+      pending = pending[~accepted]
+   return result
+
+# Merges the tiles of the given boards (an (M, h, w) array of tile exponents)
+# in place as apply_merge does: the tiles above an empty cell fall by one and
+# the equal vertical neighbors merge from the bottom of each column up, again
+# and again while there are merges or a tile falls in the last column (which
+# is the column whose moves apply_merge checks). Returns the score of the
+# merges of each board.
+def merge_tiles(boards):
+   score = np.zeros(len(boards), np.int64)
+   rows = np.arange(boards.shape[1] - 1)[None, :, None]
+   active = np.arange(len(boards))
+   while len(active):
+      board = boards[active]
+      empty = board == 0
+      # a tile falls when there is an empty cell anywhere below it
+      gap_below = np.zeros_like(empty)
+      np.logical_or.accumulate(empty[:, :-1], axis=1, out=gap_below[:, 1:])
+      falls = gap_below & ~empty
+      settled = np.where(falls, 0, board)
+      settled[:, :-1] = np.where(falls[:, 1:], board[:, 1:], settled[:, :-1])
+      # in each run of equal tiles, the first tile merges with the second, the
+      # third with the fourth, etc.
+      lower, upper = settled[:, :-1], settled[:, 1:]
+      equal = (lower != 0) & (lower == upper)
+      run_start = np.maximum.accumulate(np.where(equal, -1, rows), axis=1) + 1
+      pairs = equal & ((rows - run_start) % 2 == 0)
+      lower[pairs] += 1
+      score[active] += (np.left_shift(1, lower.astype(np.int64)) * pairs).sum(
+         axis=(1, 2))
+      upper[pairs] = 0
+      boards[active] = settled
+      changed = falls[:, :, -1].any(axis=1) | pairs.any(axis=(1, 2))
+      active = active[changed]
+   return score
+
+# Removes the full rows of the given boards in place as GameGrid.clear_tiles
+# does and returns the score of the removed rows of each board. The rows above
+# a removed row move down and clear_tiles inserts the empty rows below the top
+# row, so the top row stays on top unless it is removed itself (together with
+# another row).
+def clear_rows(boards):
+   full = (boards != 0).all(axis=2)
+   score = (np.left_shift(1, boards.astype(np.int64)) * full[:, :, None]).sum(
+      axis=(1, 2))
+   cleared = full.sum(axis=1)
+   games = np.flatnonzero(cleared)
+   if not len(games):
+      return score
+   full, cleared = full[games], cleared[games]
+   height = boards.shape[1]
+   rows = np.arange(height)
+   # the kept rows in their order followed by the removed ones
+   order = np.argsort(full, axis=1, kind="stable")
+   kept = height - cleared
+   # the row of each board that each row comes from (height for empty rows)
+   source = np.where(rows < kept[:, None], order, height)
+   top = np.flatnonzero(~(full[:, -1] & (cleared >= 2)))
+   source[top] = np.where(rows < kept[top, None] - 1, order[top], height)
+   source[top, -1] = order[top, kept[top] - 1]
+   padded = np.concatenate((boards[games], np.zeros_like(boards[games, :1])),
+                           axis=1)
+   boards[games] = np.take_along_axis(padded, source[:, :, None], axis=1)
+   return score
+
+# A class for N games of Tetris 2048 played in lockstep
+class BatchEnv:
+   # Creates n games on game grids with the given dimensions, with the given
+   # seeds (random seeds when they are not given)
+   def __init__(self, n, grid_h=20, grid_w=12, seeds=None):
+      self.n = n
+      self.grid_height, self.grid_width = grid_h, grid_w
+      # the exponents of the locked tiles of the games
+      self.boards = np.zeros((n, grid_h, grid_w), np.uint8)
+      self.scores = np.zeros(n, np.int64)
+      self.game_over = np.zeros(n, bool)
+      self.seeds = np.zeros(n, np.uint64)
+      self.rng = np.zeros(n, np.uint64)  # the SplitMix64 states of the games
+      # the current (index 0) and the next (index 1) tetromino of each game:
+      # type (index in TYPES), rotation count, position of the bottom left
+      # cell and the exponents of the tile numbers in the tile matrix
+      self.types = np.zeros((2, n), np.uint8)
+      self.rotations = np.zeros((2, n), np.uint8)
+      self.xs = np.zeros((2, n), np.int64)
+      self.ys = np.zeros((2, n), np.int64)
+      self.tiles = np.zeros((2, n, 16), np.uint8)
+      self.reset(seeds=seeds)
+
+   # Starts new games in place of the given games (all of the games when
+   # they are not given) with the given seeds (random seeds when not given)
+   def reset(self, games=None, seeds=None):
+      games = np.arange(self.n) if games is None else np.asarray(games)
+      if seeds is None:
+         seeds = [new_seed() for _ in games]
+      self.seeds[games] = self.rng[games] = np.asarray(seeds, np.uint64)
+      self.boards[games] = 0
+      self.scores[games] = 0
+      self.game_over[games] = False
+      for slot in (0, 1):
+         self.spawn(games, slot)
+
+   # Creates new tetrominoes of the given games in the given slot (0 for the
+   # current and 1 for the next tetromino) with the random values of
+   # create_tetromino: the type, the tile numbers and the horizontal position
+   def spawn(self, games, slot=1):
+      count = len(games)
+      types = rand_below(self.rng, games, np.full(count, len(TYPES)))
+      tiles = np.zeros((count, 16), np.uint8)
+      for i in range(SPAWN_CELLS.shape[1]):
+         # 2 (exponent 1) or 4 (exponent 2) with the same probability
+         tiles[np.arange(count), SPAWN_CELLS[types, i]] = \
+            1 + (next64(self.rng, games) >> np.uint64(63))
+      size = SIZES[types]
+      self.xs[slot, games] = rand_below(self.rng, games,
+                                        self.grid_width - size + 1)
+      self.ys[slot, games] = self.grid_height - 1
+      self.types[slot, games] = types
+      self.rotations[slot, games] = 0
+      self.tiles[slot, games] = tiles
+
+   # Returns the size of the tile matrix, the rows and the columns of the 16
+   # cells of the current tetrominoes of the given games
+   def cell_positions(self, games):
+      size = SIZES[self.types[0, games]]
+      xs = self.xs[0, games][:, None] + CELL_COLS
+      ys = self.ys[0, games][:, None] + CELL_DY[size]
+      return size, ys, xs
+
+   # Returns whether the grid cells at the given rows and columns of the given
+   # games are occupied by locked tiles (the cells outside the game grid are
+   # not, as in GameGrid.is_occupied)
+   def is_occupied(self, games, ys, xs):
+      h, w = self.grid_height, self.grid_width
+      inside = (ys >= 0) & (ys < h) & (xs >= 0) & (xs < w)
+      tiles = self.boards[games[:, None], np.clip(ys, 0, h - 1),
+                          np.clip(xs, 0, w - 1)]
+      return inside & (tiles != 0)
+
+   # Returns whether the current tetrominoes of the given games can be moved
+   # in the given direction (LEFT, RIGHT or DOWN). As in
+   # Tetromino.can_be_moved, only the cells next to the leftmost, rightmost or
+   # bottommost tiles are checked.
+   def can_be_moved(self, games, direction):
+      size, ys, xs = self.cell_positions(games)
+      cells = (self.tiles[0, games] != 0).reshape(-1, 4, 4)
+      edge = cells.copy()
+      if direction == LEFT:
+         edge[:, :, 1:] &= ~cells[:, :, :-1]
+         xs = xs - 1
+      elif direction == RIGHT:
+         edge[:, :, :-1] &= ~cells[:, :, 1:]
+         xs = xs + 1
+      else:
+         edge[:, :-1, :] &= ~cells[:, 1:, :]
+         ys = ys - 1
+      blocked = (xs < 0) | (xs >= self.grid_width) | (ys < 0) | \
+         self.is_occupied(games, ys, xs)
+      return ~(edge.reshape(-1, 16) & blocked).any(axis=1)
+
+   # Moves the current tetrominoes of the given games in the given direction
+   # when they can be moved and returns which of them have been moved
+   def move(self, games, direction):
+      moved = self.can_be_moved(games, direction)
+      if direction == DOWN:
+         self.ys[0, games[moved]] -= 1
+      else:
+         self.xs[0, games[moved]] += 1 if direction == RIGHT else -1
+      return moved
+
+   # Rotates the current tetrominoes of the given games clockwise when they
+   # can be rotated: as in Tetromino.can_be_rotated, every cell of the tile
+   # matrix must be inside the game grid (or above it) and not occupied
+   def rotate(self, games):
+      size, ys, xs = self.cell_positions(games)
+      blocked = (xs < 0) | (xs >= self.grid_width) | (ys < 0) | \
+         self.is_occupied(games, ys, xs)
+      games = games[~(BOX[size] & blocked).any(axis=1)]
+      size = SIZES[self.types[0, games]]
+      self.tiles[0, games] = np.take_along_axis(self.tiles[0, games],
+                                                ROTATED[size], axis=1)
+      self.rotations[0, games] = (self.rotations[0, games] + 1) % 4
+
+   # Advances the games by one tick with the given actions (an array of N
+   # action codes) as game_tick does: applies the actions, moves the current
+   # tetrominoes down by one and locks the ones that cannot go down anymore.
+   # The games that are over are not changed. Returns which of the games
+   # have locked a tetromino.
+   def step(self, actions):
+      actions = np.asarray(actions)
+      playing = ~self.game_over
+      for direction in (LEFT, RIGHT, DOWN):
+         self.move(np.flatnonzero(playing & (actions == direction)), direction)
+      self.rotate(np.flatnonzero(playing & (actions == ROTATE)))
+      # hard drop: down until the tetrominoes cannot go down anymore
+      games = np.flatnonzero(playing & (actions == DROP))
+      while len(games):
+         games = games[self.move(games, DOWN)]
+      games = np.flatnonzero(playing)
+      landed = games[~self.move(games, DOWN)]
+      self.spawn(self.lock(landed))
+      locked = np.zeros(self.n, bool)
+      locked[landed] = True
+      return locked
+
+   # Locks the current tetrominoes of the given games onto their game grids
+   # and resolves the merges and the full rows, as lock_tetromino does. The
+   # games end when a tile is locked above the game grid. The next tetromino
+   # becomes the current one in the other games, which are returned.
+   def lock(self, games):
+      size, ys, xs = self.cell_positions(games)
+      tiles = self.tiles[0, games]
+      present = tiles != 0
+      inside = present & (ys >= 0) & (ys < self.grid_height) & (xs >= 0) & \
+         (xs < self.grid_width)
+      rows = np.broadcast_to(games[:, None], ys.shape)
+      self.boards[rows[inside], ys[inside], xs[inside]] = tiles[inside]
+      over = (present & ~inside).any(axis=1)
+      self.game_over[games[over]] = True
+      games = games[~over]
+      boards = self.boards[games]
+      score = merge_tiles(boards) + clear_rows(boards)
+      self.boards[games] = boards
+      self.scores[games] += score
+      for values in (self.types, self.rotations, self.xs, self.ys, self.tiles):
+         values[0, games] = values[1, games]
+      return games
+
+   # Returns the state of the given game in the format of GameGrid.snapshot,
+   # so that a GameGrid can be restored to it
+   def snapshot(self, game):
+      pieces = []
+      for slot in (0, 1):
+         if slot == 0 and self.game_over[game]:
+            # the current tetromino is locked when the game is over
+            pieces.append(NO_TETROMINO)
+            continue
+         size = SIZES[self.types[slot, game]]
+         exponents = self.tiles[slot, game].reshape(4, 4)[:size, :size]
+         pieces.append(TETROMINO_SNAPSHOT.pack(
+            self.types[slot, game], self.rotations[slot, game],
+            self.xs[slot, game], self.ys[slot, game], exponents.tobytes()))
+      header = SNAPSHOT_HEADER.pack(
+         int(self.scores[game]), int(self.rng[game]),
+         bool(self.game_over[game]), self.grid_height, self.grid_width)
+      return b"".join([header] + pieces + [self.boards[game].tobytes()])
+
+   # Restores the given game from a snapshot of a game (see
+   # GameGrid.snapshot) with the same grid dimensions
+   def restore(self, game, data):
+      score, state, game_over, grid_h, grid_w = \
+         SNAPSHOT_HEADER.unpack_from(data, 0)
+      if grid_h != self.grid_height or grid_w != self.grid_width:
+         raise ValueError("the snapshot is of a %dx%d game grid" %
+                          (grid_h, grid_w))
+      self.scores[game], self.rng[game] = score, state
+      self.game_over[game] = game_over
+      offset = SNAPSHOT_HEADER.size
+      for slot in (0, 1):
+         type_index, rotate_count, x, y, exponents = \
+            TETROMINO_SNAPSHOT.unpack_from(data, offset)
+         offset += TETROMINO_SNAPSHOT.size
+         if type_index == 255:
+            continue
+         size = SIZES[type_index]
+         tiles = np.zeros((4, 4), np.uint8)
+         tiles[:size, :size] = np.frombuffer(exponents, np.uint8,
+                                             size * size).reshape(size, size)
+         self.types[slot, game], self.rotations[slot, game] = \
+            type_index, rotate_count
+         self.xs[slot, game], self.ys[slot, game] = x, y
+         self.tiles[slot, game] = tiles.ravel()
+      self.boards[game] = np.frombuffer(data, np.uint8, grid_h * grid_w,
+                                        offset).reshape(grid_h, grid_w)
+
+# Returns random actions for n games (mostly no action, as in human games)
+def random_actions(rng, n):
+   return rng.choice(len(ACTION_KEYS), n,
+                     p=[0.4, 0.15, 0.15, 0.1, 0.15, 0.05]).astype(np.uint8)
+
+# Checks the batched rules against the scalar rules of Tetris_2048 and returns
+# the mismatches found as (game, tick) pairs: the given number of games are
+# played with random actions both ways and compared after every tick, then
+# the lock cascade of random boards (with merge chains and full rows) is
+# compared with lock_tetromino (with tick -1 in the mismatches)
+def check(games=64, ticks=2000, seed=0, grid_h=20, grid_w=12):
+   import Tetris_2048 as game  # the scalar rules (only needed for checking)
+   from game_grid import GameGrid
+   from tetromino import Tetromino
+   Tetromino.grid_height, Tetromino.grid_width = grid_h, grid_w
+   rng = np.random.default_rng(seed)
+   seeds = [int(s) for s in rng.integers(0, 2 ** 64, games, np.uint64)]
+   batch = BatchEnv(games, grid_h, grid_w, seeds)
+   grids = []
+   for s in seeds:
+      grid = GameGrid(grid_h, grid_w, s)
+      grid.current_tetromino = game.create_tetromino(grid.rng)
+      grid.next_tetromino = game.create_tetromino(grid.rng)
+      grids.append(grid)
+   mismatches = []
+   playing = [i for i in range(games) if grids[i].snapshot() == batch.snapshot(i)]
+   mismatches += [(i, 0) for i in range(games) if i not in playing]
+   for tick in range(1, ticks + 1):
+      if not playing:
+         break
+      actions = random_actions(rng, games)
+      batch.step(actions)
+      for i in list(playing):
+         game.game_tick(grids[i], ACTION_KEYS[actions[i]])
+         if grids[i].snapshot() != batch.snapshot(i):
+            mismatches.append((i, tick))
+            playing.remove(i)
+         elif grids[i].game_over:
+            playing.remove(i)
+
+   # the lock cascade of random boards and tetrominoes
+   batch = BatchEnv(games, grid_h, grid_w, seeds)
+   for i in range(games):
+      density = rng.random()
+      board = rng.integers(1, 5, (grid_h, grid_w)) * \
+         (rng.random((grid_h, grid_w)) < density)
+      full_rows = rng.random(grid_h) < 0.15
+      board[full_rows] = rng.integers(1, 4, (full_rows.sum(), grid_w))
+      batch.boards[i] = board
+      batch.ys[0, i] = rng.integers(0, grid_h)
+      grids[i].restore(batch.snapshot(i))
+   batch.lock(np.arange(games))
+   for i in range(games):
+      game.lock_tetromino(grids[i], grids[i].current_tetromino)
+      if (grids[i].score, grids[i].game_over, grids[i].tile_exponents()) != (
+            batch.scores[i], batch.game_over[i], batch.boards[i].tobytes()):
+         mismatches.append((i, -1))
+   return mismatches
+
+def main(argv=None):
+   parser = argparse.ArgumentParser(description="Tetris 2048 batched rules")
+   parser.add_argument("command", choices=["check", "bench"])
+   parser.add_argument("--games", type=int)
+   parser.add_argument("--ticks", type=int)
+   parser.add_argument("--seed", type=int, default=0)
+   args = parser.parse_args(argv)
+
+   if args.command == "check":
+      mismatches = check(args.games or 64, args.ticks or 2000, args.seed)
+      for game, tick in mismatches:
+         print("game %d differs at tick %d" % (game, tick))
+      print("%d mismatches" % len(mismatches))
+      return 1 if mismatches else 0
+   games, ticks = args.games or 4096, args.ticks or 200
+   rng = np.random.default_rng(args.seed)
+   batch = BatchEnv(games, seeds=[int(s) for s in rng.integers(
+      0, 2 ** 64, games, np.uint64)])
+   locks = 0
+   start = time.perf_counter()
+   for _ in range(ticks):
+      locks += batch.step(random_actions(rng, games)).sum()
+      # keep the batch full by starting new games in place of the ended ones
+      ended = np.flatnonzero(batch.game_over)
+      if len(ended):
+         batch.reset(ended, [int(s) for s in rng.integers(
+            0, 2 ** 64, len(ended), np.uint64)])
+   elapsed = time.perf_counter() - start
+   print("%d games x %d ticks in %.2f s: %.0f game ticks/s, %.0f locks/s" % (
+      games, ticks, elapsed, games * ticks / elapsed, locks / elapsed))
+   return 0
+
+if __name__ == '__main__':
+   sys.exit(main())
@@ -0,0 +1,259 @@
+################################################################################
+#                                                                              #
+# Micro-benchmarks for the hot paths of Tetris 2048                            #
+#                                                                              #
+# Usage: python benchmark.py [--output results.json] [--baseline FILE]         #
+#                            [--threshold 0.25] [--update-baseline]            #
+#                                                                              #
+################################################################################
+
+import os  # the os module is used for file and directory operations
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import statistics
+import numpy as np
+import lib.stddraw as stddraw  # used for drawing the grid on an off-screen canvas
+from game_grid import GameGrid  # the class for modeling the game grid
+from tetromino import Tetromino  # the class for modeling the tetrominoes
+from tile import Tile  # used for modeling each tile on the tetrominoes
+import placements  # the placement search of the bots
+from Tetris_2048 import (apply_merge, apply_placement,
+                         connected_component_labeling, is_full,
+                         search_free_tiles, shift_down, undo, updateColor)
+
+# the dimensions of the game grid used in all benchmarks (same as the game)
+GRID_H, GRID_W = 20, 12
+# the fill densities and the fixed seeds of the generated boards
+DENSITIES = [0.25, 0.5, 0.75, 0.95]
+BOARD_SEED = 2048
+# the default location of the stored baseline results
+current_dir = os.path.dirname(os.path.realpath(__file__))
+DEFAULT_BASELINE = current_dir + "/benchmark_baseline.json"
+# a benchmark regresses when its fastest time exceeds the baseline by this ratio
+# (the fastest time is compared as it is the least affected by system noise)
+DEFAULT_THRESHOLD = 0.25
+
+
+# Creates a tile with the given number and the matching colors
+def make_tile(number):
+   tile = Tile()
+   tile.number = number
+   updateColor(tile, number)
+   return tile
+
+# Generates the tile numbers (0 for empty cells) of a board with the given
+# fill density from a fixed seed; tiles lean towards the bottom rows as in a
+# real game and small numbers are more likely than large ones
+def make_numbers(seed, density, grid_h=GRID_H, grid_w=GRID_W):
+   rng = random.Random(seed)
+   numbers = np.zeros((grid_h, grid_w), dtype=int)
+   for row in range(grid_h):
+      # the probability of a cell being filled decreases towards the top
+      row_density = min(1.0, 2 * density * (grid_h - row) / grid_h)
+      for col in range(grid_w):
+         if rng.random() < row_density:
+            numbers[row][col] = 2 ** min(rng.randint(1, 4), rng.randint(1, 11))
+   return numbers
+
+# Builds a game grid whose tile matrix contains tiles with the given numbers
+def make_grid(numbers):
+   grid_h, grid_w = numbers.shape
+   grid = GameGrid(grid_h, grid_w)
+   for row in range(grid_h):
+      for col in range(grid_w):
+         if numbers[row][col]:
+            grid.set_tile(row, col, make_tile(int(numbers[row][col])))
+   return grid
+
+# Creates a tetromino of the given type at a fixed position in the top half of
+# the game grid
+def make_tetromino(shape):
+   tetromino = Tetromino(shape)
+   tetromino.bottom_left_cell.x = GRID_W // 2 - 1
+   tetromino.bottom_left_cell.y = GRID_H - 6
+   return tetromino
+
+# Times func(*setup()) and returns the statistics in microseconds per call;
+# setup runs before every call and is excluded from the measured time
+def measure(func, setup, repeat=7, number=20):
+   per_call = []
+   for _ in range(repeat):
+      elapsed = 0.0
+      for _ in range(number):
+         args = setup()
+         start = time.perf_counter()
+         func(*args)
+         elapsed += time.perf_counter() - start
+      per_call.append(elapsed / number * 1e6)
+   return {"median_us": statistics.median(per_call),
+           "min_us": min(per_call),
+           "repeat": repeat, "number": number}
+
+# Returns (name, func, setup) triples for all of the benchmarks
+def collect_benchmarks():
+   benchmarks = []
+   shapes = ['I', 'O', 'Z', 'L', 'J', 'S', 'T']
+   for density in DENSITIES:
+      numbers = make_numbers(BOARD_SEED, density)
+      tag = "@%d%%" % int(density * 100)
+      # the grid is rebuilt before each call for the functions modifying it
+      fresh = lambda numbers=numbers: (make_grid(numbers),)
+      benchmarks.append(("apply_merge" + tag, apply_merge, fresh))
+      benchmarks.append(("clear_tiles" + tag, GameGrid.clear_tiles, fresh))
+      grid = make_grid(numbers)
+      benchmarks.append(("connected_component_labeling" + tag,
+                         connected_component_labeling,
+                         lambda grid=grid: (grid.tile_matrix, GRID_W, GRID_H)))
+      # searching and moving free tiles as done in the main game loop
+      def free_tiles(grid):
+         labels, num_labels = connected_component_labeling(
+            grid.tile_matrix, grid.grid_width, grid.grid_height)
+         free = [[False for v in range(grid.grid_width)]
+                 for b in range(grid.grid_height)]
+         free, num_free = search_free_tiles(grid.grid_height, grid.grid_width,
+                                            labels, free)
+         grid.move_free_tiles(free)
+      benchmarks.append(("search_and_move_free_tiles" + tag, free_tiles, fresh))
+      benchmarks.append(("is_full" + tag, is_full,
+                         lambda numbers=numbers: (GRID_H, GRID_W,
+                                                  make_grid(numbers))))
+      # shifting down the rows above a full bottom row
+      def shift(numbers=numbers):
+         grid = make_grid(numbers)
+         row_count = [False for _ in range(GRID_H)]
+         row_count[0] = True
+         return row_count, grid
+      benchmarks.append(("shift_down" + tag, shift_down, shift))
+      benchmarks.append(("draw_grid" + tag, GameGrid.draw_grid,
+                         lambda grid=grid: (grid,)))
+      # tetromino movement and rotation checks against the same board
+      def moves(tetrominoes, grid):
+         for tetromino in tetrominoes:
+            for direction in ("left", "right", "down"):
+               tetromino.can_be_moved(direction, grid)
+      tetrominoes = [make_tetromino(shape) for shape in shapes]
+      benchmarks.append(("can_be_moved" + tag, moves,
+                         lambda t=tetrominoes, grid=grid: (t, grid)))
+      def can_rotate(tetrominoes, grid):
+         for tetromino in tetrominoes:
+            tetromino.can_be_rotated(grid)
+      benchmarks.append(("can_be_rotated" + tag, can_rotate,
+                         lambda t=tetrominoes, grid=grid: (t, grid)))
+      def rotate(tetrominoes, grid):
+         for tetromino in tetrominoes:
+            tetromino.rotate(grid)
+      # rotations change the tetrominoes, so new ones are created for each call
+      benchmarks.append(("rotate" + tag, rotate,
+                         lambda grid=grid: ([make_tetromino(shape)
+                                             for shape in shapes], grid)))
+      # taking a snapshot of the game state and restoring it (as search does)
+      state = make_grid(numbers)
+      state.current_tetromino = make_tetromino('T')
+      state.next_tetromino = make_tetromino('I')
+      def snapshot_restore(grid):
+         grid.restore(grid.snapshot())
+      benchmarks.append(("snapshot" + tag, GameGrid.snapshot,
+                         lambda grid=state: (grid,)))
+      benchmarks.append(("snapshot_restore" + tag, snapshot_restore,
+                         lambda grid=state: (grid,)))
+      # searching all placements of the current tetromino (without the
+      # memoized results of the previous calls)
+      def search(grid=state):
+         placements.reachable.cache_clear()
+         return (grid,)
+      benchmarks.append(("enumerate_placements" + tag,
+                         placements.enumerate_placements, search))
+      # trying all of the placements on the grid and bringing it back to its
+      # state with the undo records or with snapshots (as search can do)
+      tried = placements.enumerate_placements(state)
+      def apply_undo(grid, tried=tried):
+         for placement in tried:
+            undo(grid, apply_placement(grid, placement))
+      def apply_restore(grid, tried=tried):
+         for placement in tried:
+            data = grid.snapshot()
+            apply_placement(grid, placement)
+            grid.restore(data)
+      benchmarks.append(("apply_undo" + tag, apply_undo,
+                         lambda grid=state: (grid,)))
+      benchmarks.append(("apply_restore" + tag, apply_restore,
+                         lambda grid=state: (grid,)))
+   return benchmarks
+
+# Opens the off-screen drawing canvas with the same layout as the game
+def setup_canvas():
+   extra_w = 6
+   stddraw.setCanvasSize(40 * (GRID_W + extra_w), 40 * GRID_H, offscreen=True)
+   stddraw.setXscale(-0.5, (GRID_W + extra_w) - 0.5)
+   stddraw.setYscale(-0.5, GRID_H - 0.5)
+
+# Runs all benchmarks whose names contain the given filter string
+def run(name_filter="", repeat=7, number=20):
+   # the same seeds give the same tetrominoes and tile numbers on each run
+   random.seed(BOARD_SEED)
+   Tetromino.grid_height, Tetromino.grid_width = GRID_H, GRID_W
+   setup_canvas()
+   results = {}
+   for name, func, setup in collect_benchmarks():
+      if name_filter in name:
+         results[name] = measure(func, setup, repeat, number)
+         print("%-40s %12.1f us" % (name, results[name]["median_us"]))
+   return {"python": platform.python_version(),
+           "numpy": np.__version__,
+           "machine": platform.machine(),
+           "results": results}
+
+# Compares the results with the baseline and returns the names of the
+# benchmarks slower than the baseline by more than the threshold
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+   regressions = []
+   for name, result in results["results"].items():
+      if name not in baseline["results"]:
+         continue
+      base = baseline["results"][name]["min_us"]
+      ratio = result["min_us"] / base
+      # per benchmark thresholds stored in the baseline override the default
+      limit = baseline.get("thresholds", {}).get(name, threshold)
+      status = "REGRESSION" if ratio > 1 + limit else "ok"
+      print("%-40s %7.2fx  %s" % (name, ratio, status))
+      if status != "ok":
+         regressions.append(name)
+   return regressions
+
+def main(argv=None):
+   parser = argparse.ArgumentParser(description="Tetris 2048 micro-benchmarks")
+   parser.add_argument("--output", help="write the results as JSON to this file")
+   parser.add_argument("--baseline", default=DEFAULT_BASELINE,
+                       help="baseline results to compare against")
+   parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                       help="allowed slowdown ratio before reporting a regression")
+   parser.add_argument("--update-baseline", action="store_true",
+                       help="store the results as the new baseline")
+   parser.add_argument("--filter", default="", help="run only matching benchmarks")
+   parser.add_argument("--repeat", type=int, default=7)
+   parser.add_argument("--number", type=int, default=20)
+   args = parser.parse_args(argv)
+
+   results = run(args.filter, args.repeat, args.number)
+   if args.output:
+      with open(args.output, "w") as output_file:
+         json.dump(results, output_file, indent=2, sort_keys=True)
+   if args.update_baseline:
+      with open(args.baseline, "w") as baseline_file:
+         json.dump(results, baseline_file, indent=2, sort_keys=True)
+      return 0
+   if not os.path.exists(args.baseline):
+      print("No baseline found at " + args.baseline)
+      return 0
+   with open(args.baseline) as baseline_file:
+      baseline = json.load(baseline_file)
+   regressions = compare(results, baseline, args.threshold)
+   # a non-zero exit status lets scripts detect the regressions
+   return 1 if regressions else 0
+
+if __name__ == '__main__':
+   sys.exit(main())
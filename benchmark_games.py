@@ -0,0 +1,182 @@
+################################################################################
+#                                                                              #
+# Throughput benchmark: plays complete games of Tetris 2048 without a display  #
+#                                                                              #
+# Usage: python benchmark_games.py [--games 20] [--policy random|greedy]       #
+#                                  [--seed 2048] [--max-pieces 1000]           #
+#                                  [--trace-memory] [--output results.json]    #
+#                                                                              #
+################################################################################
+
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tracemalloc
+import numpy as np
+from game_grid import GameGrid  # the class for modeling the game grid
+from tetromino import Tetromino  # the class for modeling the tetrominoes
+import Tetris_2048 as game  # the game rules (create_tetromino, game_tick, ...)
+
+# the dimensions of the game grid (same as the game)
+GRID_H, GRID_W = 20, 12
+# the actions a player can take at each iteration of the main game loop
+ACTIONS = [None, "left", "right", "down", "up", "space"]
+
+
+# A policy choosing a random action at each iteration of the main game loop
+class RandomPolicy:
+   def __init__(self, rng):
+      self.rng = rng
+
+   def __call__(self, grid):
+      return self.rng.choice(ACTIONS)
+
+# A policy dropping each tetromino at the lowest position reachable by
+# rotating it at the top of the grid and moving it straight down
+class GreedyPolicy:
+   def __init__(self, rng):
+      self.rng = rng
+      self.planned_for = None  # the tetromino the planned actions are for
+      self.plan = []
+
+   def __call__(self, grid):
+      tetromino = grid.current_tetromino
+      if tetromino is not self.planned_for:
+         self.planned_for = tetromino
+         self.plan = self.make_plan(grid, tetromino)
+      if self.plan:
+         return self.plan.pop(0)
+      return None
+
+   # Returns the list of actions that drops the given tetromino to the lowest
+   # landing position (ties are broken by the leftmost position)
+   def make_plan(self, grid, tetromino):
+      best = None
+      cells = tetromino.tile_matrix != None
+      n = len(cells)
+      for rotation in range(4):
+         # occupied cells of the rotated matrix as (dx, dy) from its bottom left
+         offsets = [(col, (n - 1) - row) for row in range(n) for col in range(n)
+                    if cells[row][col]]
+         min_dx = min(dx for dx, dy in offsets)
+         max_dx = max(dx for dx, dy in offsets)
+         for x in range(-min_dx, grid.grid_width - max_dx):
+            y = landing_row(grid, offsets, x, tetromino.bottom_left_cell.y)
+            if best is None or y < best[0]:
+               best = (y, rotation, x)
+         cells = np.flip(np.transpose(cells), axis=1)
+      y, rotation, x = best
+      dx = x - tetromino.bottom_left_cell.x
+      plan = ["up"] * rotation
+      plan += ["right"] * dx if dx > 0 else ["left"] * -dx
+      return plan + ["space"]
+
+# Returns the row the bottom left cell of a tetromino with the given occupied
+# cell offsets lands on when it is dropped straight down in column x
+def landing_row(grid, offsets, x, y):
+   while all(y + dy - 1 >= 0 and not grid.is_occupied(y + dy - 1, x + dx)
+             for dx, dy in offsets):
+      y -= 1
+   return y
+
+POLICIES = {"random": RandomPolicy, "greedy": GreedyPolicy}
+
+# Plays a complete game from the given seed with the given policy and returns
+# its statistics; the lock times are appended to the given list in seconds.
+# Games of strong policies may last very long, so a game ends after
+# max_pieces locks.
+def play_game(seed, policy, lock_times, max_pieces=1000):
+   grid = GameGrid(GRID_H, GRID_W, seed)
+   grid.current_tetromino = game.create_tetromino(grid.rng)
+   grid.next_tetromino = game.create_tetromino(grid.rng)
+   pieces, ticks = 0, 0
+   while pieces < max_pieces:
+      ticks += 1
+      tetromino = grid.current_tetromino
+      start = time.perf_counter()
+      game_over = game.game_tick(grid, policy(grid))
+      if grid.current_tetromino is not tetromino or game_over:
+         # the tetromino has been locked, so this tick ran the lock cascade
+         lock_times.append(time.perf_counter() - start)
+         pieces += 1
+      if game_over:
+         break
+   max_tile = max([tile.number for tile in grid.tile_matrix.flat
+                   if tile is not None] or [0])
+   return {"score": grid.score, "pieces": pieces, "ticks": ticks,
+           "max_tile": max_tile, "truncated": not grid.game_over}
+
+# Returns the given percentiles of the values in microseconds
+def percentiles_us(values, qs=(50, 90, 99, 100)):
+   if not values:
+      return {}
+   result = np.percentile(np.array(values) * 1e6, qs)
+   return {"p%d" % q: float(v) for q, v in zip(qs, result)}
+
+# Plays the given number of games and returns the throughput statistics
+def run(games=20, policy_name="greedy", seed=2048, trace_memory=False,
+        max_pieces=1000):
+   Tetromino.grid_height, Tetromino.grid_width = GRID_H, GRID_W
+   # game i is played with the seed seed + i, and the policy has its own
+   # generator, so the same seed always gives the same games
+   policy = POLICIES[policy_name](random.Random(seed))
+   if trace_memory:
+      tracemalloc.start()
+   lock_times, results = [], []
+   start = time.perf_counter()
+   for i in range(games):
+      results.append(play_game(seed + i, policy, lock_times, max_pieces))
+   elapsed = time.perf_counter() - start
+   stats = {"python": platform.python_version(), "policy": policy_name,
+            "seed": seed, "games": games, "seconds": elapsed,
+            "games_per_sec": games / elapsed,
+            "pieces_per_sec": sum(r["pieces"] for r in results) / elapsed,
+            "ticks_per_sec": sum(r["ticks"] for r in results) / elapsed,
+            "mean_score": float(np.mean([r["score"] for r in results])),
+            "truncated_games": sum(r["truncated"] for r in results),
+            "lock_cascade_us": percentiles_us(lock_times)}
+   if trace_memory:
+      stats["peak_traced_bytes"] = tracemalloc.get_traced_memory()[1]
+      tracemalloc.stop()
+   try:
+      import resource  # only available on Unix
+      # ru_maxrss is reported in kilobytes on Linux
+      stats["peak_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+   except ImportError:
+      pass
+   return stats
+
+def main(argv=None):
+   parser = argparse.ArgumentParser(description="Tetris 2048 game throughput")
+   parser.add_argument("--games", type=int, default=20)
+   parser.add_argument("--policy", choices=sorted(POLICIES), default="greedy")
+   parser.add_argument("--seed", type=int, default=2048)
+   parser.add_argument("--max-pieces", type=int, default=1000,
+                       help="end a game after this many tetrominoes")
+   parser.add_argument("--trace-memory", action="store_true",
+                       help="measure the peak Python heap (slows the games down)")
+   parser.add_argument("--output", help="write the results as JSON to this file")
+   args = parser.parse_args(argv)
+
+   stats = run(args.games, args.policy, args.seed, args.trace_memory,
+               args.max_pieces)
+   print("games/sec:  %.2f" % stats["games_per_sec"])
+   print("pieces/sec: %.1f" % stats["pieces_per_sec"])
+   if stats["truncated_games"]:
+      print("games ended at the piece limit: %d" % stats["truncated_games"])
+   print("lock cascade (us): " + ", ".join(
+      "%s=%.0f" % item for item in stats["lock_cascade_us"].items()))
+   if "peak_traced_bytes" in stats:
+      print("peak traced memory: %.1f MB" % (stats["peak_traced_bytes"] / 2 ** 20))
+   if "peak_rss_kb" in stats:
+      print("peak RSS: %.1f MB" % (stats["peak_rss_kb"] / 1024))
+   if args.output:
+      with open(args.output, "w") as output_file:
+         json.dump(stats, output_file, indent=2, sort_keys=True)
+   return 0
+
+if __name__ == '__main__':
+   sys.exit(main())
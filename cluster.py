@@ -0,0 +1,374 @@
+################################################################################
+#                                                                              #
+# Cluster: self-play games (see selfplay.py) distributed over many machines    #
+#                                                                              #
+# Usage: python cluster.py coordinator [--port 2048] [--games 1000]            #
+#                          [--batch 8] [--seed 0] [--search greedy]            #
+#                          [--budget 50] [--max-locks 1000] [--weight ...]     #
+#        python cluster.py worker HOST [--port 2048] [--processes N]           #
+#                                                                              #
+################################################################################
+
+# The coordinator splits the games into batches of game indexes and hands them
+# out over TCP to the workers that connect to it, keeping about
+# GAMES_PER_PROCESS games per process of each worker (a new batch is sent as
+# soon as the games of the worker finish, whichever batches they belong to,
+# so a slow game never holds up the others). A worker plays the games of its
+# batches in its own pool of processes (see selfplay.play_games) and sends the
+# result of each game as soon as it finishes, packed in a few bytes, so the
+# coordinator always knows which games of each batch are still missing. When
+# a worker disconnects or stays silent for WORKER_TIMEOUT seconds (the
+# workers send a heartbeat every HEARTBEAT_SECONDS), the missing games of its
+# batches are put back in the queue for the other workers. As game i is
+# played with the seed base seed + i, a game played again on another worker
+# is the same game. The coordinator prints the games per second of the whole
+# cluster while the games run and the statistics of the games at the end.
+#
+# Each message is a type (u8) and a payload length (u32) followed by the
+# payload:
+#   CONFIG     coordinator -> worker, JSON: the options of the autoplayers
+#   BATCH      coordinator -> worker, batch id (u32) and game indexes (u32 each)
+#   DONE       coordinator -> worker, no payload: there are no more games
+#   HELLO      worker -> coordinator, number of processes (u16)
+#   RESULT     worker -> coordinator, batch id and a game result (see RESULT)
+#   HEARTBEAT  worker -> coordinator, no payload
+
+import os
+import sys
+import json
+import time
+import socket
+import struct
+import argparse
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import autoplayer
+import selfplay
+
+# the message types
+CONFIG, BATCH, DONE, HELLO, RESULT, HEARTBEAT = range(6)
+# the header of the messages: type (u8) and payload length (u32)
+HEADER = struct.Struct("<BI")
+# the payload of a result: batch id (u32), game index (u32), seed (u64), score
+# (u64), exponent of the largest tile (u8), locks (u32), game over flag and
+# length of the game in seconds (f32)
+RESULT_PAYLOAD = struct.Struct("<IIQQBI?f")
+PORT = 2048
+# the number of games per process that a worker has at the same time (one
+# being played and one waiting, so the processes never wait for the network)
+GAMES_PER_PROCESS = 2
+HEARTBEAT_SECONDS = 5
+WORKER_TIMEOUT = 30
+# the interval of the progress lines of the coordinator (in seconds)
+PROGRESS_SECONDS = 5
+
+
+# Sends a message of the given type with the given payload on the given socket
+def send_message(sock, kind, payload=b""):
+   sock.sendall(HEADER.pack(kind, len(payload)) + payload)
+
+# Returns the given number of bytes read from the given socket (raises
+# ConnectionError when the connection is closed before)
+def receive_exactly(sock, size):
+   data = bytearray()
+   while len(data) < size:
+      chunk = sock.recv(size - len(data))
+      if not chunk:
+         raise ConnectionError("the connection was closed")
+      data += chunk
+   return bytes(data)
+
+# Returns the next message (type, payload) read from the given socket
+def receive_message(sock):
+   kind, size = HEADER.unpack(receive_exactly(sock, HEADER.size))
+   return kind, receive_exactly(sock, size)
+
+# Packs the given result of a game of the given batch
+def pack_result(batch_id, result):
+   return RESULT_PAYLOAD.pack(batch_id, result.index, result.seed, result.score,
+                              result.max_tile.bit_length() - 1 if
+                              result.max_tile else 0, result.locks,
+                              result.game_over, result.seconds)
+
+# Returns the batch id and the GameResult packed in the given payload
+def unpack_result(payload):
+   batch_id, index, seed, score, exponent, locks, game_over, seconds = \
+      RESULT_PAYLOAD.unpack(payload)
+   return batch_id, selfplay.GameResult(index, seed, score,
+                                        1 << exponent if exponent else 0,
+                                        locks, game_over, seconds)
+
+# A class for the coordinator handing out the games to the workers
+class Coordinator:
+   def __init__(self, games, batch_size, config):
+      self.config = json.dumps(config).encode()
+      self.games = games
+      self.lock = threading.Lock()
+      self.queue = deque()  # the batches waiting for a worker
+      for start in range(0, games, batch_size):
+         self.queue.append(list(range(start, min(start + batch_size, games))))
+      self.next_batch_id = 0
+      self.workers = {}  # the connected workers and their batches
+      self.results = {}  # the results of the games by their indexes
+      self.finished = threading.Event()
+      self.start_time = time.perf_counter()
+
+   # Accepts the workers on the given listening socket until all the games
+   # are played
+   def serve(self, server):
+      server.settimeout(1)
+      while not self.finished.is_set():
+         try:
+            sock, address = server.accept()
+         except socket.timeout:
+            continue
+         threading.Thread(target=self.handle_worker, args=(sock, address),
+                          daemon=True).start()
+
+   # Talks to the worker connected on the given socket until it is done or
+   # lost
+   def handle_worker(self, sock, address):
+      worker = {"sock": sock, "address": address, "batches": {},
+                "send_lock": threading.Lock(), "games": 0, "processes": 1}
+      try:
+         sock.settimeout(WORKER_TIMEOUT)
+         kind, payload = receive_message(sock)
+         if kind != HELLO:
+            raise ConnectionError("the worker did not say hello")
+         worker["processes"], = struct.unpack("<H", payload)
+         print("worker %s:%d joined with %d processes" % (
+            address[0], address[1], worker["processes"]), flush=True)
+         send_message(sock, CONFIG, self.config)
+         with self.lock:
+            self.workers[sock] = worker
+            self.dispatch()
+         while not self.finished.is_set():
+            kind, payload = receive_message(sock)
+            if kind == RESULT:
+               self.add_result(worker, *unpack_result(payload))
+      except (OSError, ConnectionError, struct.error) as error:
+         if not self.finished.is_set():
+            print("worker %s:%d lost after %d games (%s)" % (
+               address[0], address[1], worker["games"], error), flush=True)
+      finally:
+         self.drop_worker(worker)
+         sock.close()
+
+   # Stores the given result of a game of the given batch of the given worker
+   def add_result(self, worker, batch_id, result):
+      with self.lock:
+         missing = worker["batches"].get(batch_id)
+         if missing is not None:
+            missing.discard(result.index)
+            if not missing:
+               del worker["batches"][batch_id]
+         # a game played again after its worker was lost is only counted once
+         if result.index not in self.results:
+            self.results[result.index] = result
+            worker["games"] += 1
+         if len(self.results) == self.games:
+            self.finish()
+         else:
+            self.dispatch()
+
+   # Removes the given worker and queues the games of its batches again
+   def drop_worker(self, worker):
+      with self.lock:
+         if self.workers.pop(worker["sock"], None) is None:
+            return
+         for missing in worker["batches"].values():
+            games = sorted(index for index in missing
+                           if index not in self.results)
+            if games:
+               self.queue.appendleft(games)
+         worker["batches"].clear()
+         self.dispatch()
+
+   # Sends the waiting batches to the workers with room for them: fewer
+   # unfinished games than GAMES_PER_PROCESS per process (called with the
+   # lock held)
+   def dispatch(self):
+      for worker in list(self.workers.values()):
+         playing = sum(len(missing) for missing in worker["batches"].values())
+         while self.queue and \
+               playing < GAMES_PER_PROCESS * max(worker["processes"], 1):
+            games = self.queue.popleft()
+            batch_id = self.next_batch_id
+            self.next_batch_id += 1
+            worker["batches"][batch_id] = set(games)
+            playing += len(games)
+            payload = struct.pack("<I%dI" % len(games), batch_id, *games)
+            try:
+               with worker["send_lock"]:
+                  send_message(worker["sock"], BATCH, payload)
+            except OSError:
+               # the reading thread of the worker notices it and drops it
+               break
+
+   # Tells the workers that the games are played (called with the lock held)
+   def finish(self):
+      self.finished.set()
+      for worker in self.workers.values():
+         try:
+            with worker["send_lock"]:
+               send_message(worker["sock"], DONE)
+         except OSError:
+            pass
+
+   # Prints the progress of the games until they are all played
+   def report(self):
+      while not self.finished.wait(PROGRESS_SECONDS):
+         with self.lock:
+            done, workers = len(self.results), len(self.workers)
+         elapsed = time.perf_counter() - self.start_time
+         print("%d/%d games, %d workers, %.2f games/s" % (
+            done, self.games, workers, done / elapsed), flush=True)
+
+# Runs a coordinator with the given options until all the games are played
+# and returns the results of the games
+def run_coordinator(args):
+   config = {"seed": args.seed, "search": args.search,
+             "weights": autoplayer.parse_weights(args.weight),
+             "budget": args.budget / 1000, "depth": args.depth,
+             "max_locks": args.max_locks or None}
+   coordinator = Coordinator(args.games, args.batch, config)
+   server = socket.create_server(("", args.port))
+   print("waiting for workers on port %d" % args.port, flush=True)
+   threading.Thread(target=coordinator.report, daemon=True).start()
+   try:
+      coordinator.serve(server)
+   finally:
+      server.close()
+   results = [coordinator.results[index] for index in range(args.games)]
+   stats = selfplay.summarize(results,
+                              time.perf_counter() - coordinator.start_time)
+   print("%d games, %d over: mean score %.1f, median %.1f, mean %.1f locks, "
+         "%.2f games/s" % (stats["games"], stats["game_overs"],
+                           stats["mean_score"], stats["median_score"],
+                           stats["mean_locks"], stats["games_per_second"]))
+   print("max tiles: " + ", ".join("%d: %d" % item
+                                   for item in stats["max_tiles"].items()))
+   return results
+
+# Runs a worker playing the games of the coordinator at the given address
+# with the given number of processes until the coordinator is done
+def run_worker(host, port, processes):
+   sock = socket.create_connection((host, port))
+   send_message(sock, HELLO, struct.pack("<H", processes))
+   kind, payload = receive_message(sock)
+   if kind != CONFIG:
+      raise ConnectionError("the coordinator did not send its options")
+   config = json.loads(payload)
+   send_lock = threading.Lock()
+   stopped = threading.Event()
+   failed = threading.Event()
+
+   # sends the result of a finished game (on the thread of the pool)
+   def send_result(batch_id, future):
+      if future.cancelled():
+         return  # cancelled when the coordinator is done
+      try:
+         result = pack_result(batch_id, future.result())
+         with send_lock:
+            send_message(sock, RESULT, result)
+      except Exception as error:
+         # the game failed (or its result cannot be sent): the connection is
+         # closed, so the coordinator drops this worker and queues the
+         # missing games of its batches again instead of waiting for them
+         if not isinstance(error, OSError):
+            print("a game of batch %d failed: %r" % (batch_id, error),
+                  flush=True)
+            failed.set()
+         stopped.set()
+         try:
+            sock.shutdown(socket.SHUT_RDWR)
+         except OSError:
+            pass
+
+   # tells the coordinator that this worker is alive
+   def heartbeat():
+      while not stopped.wait(HEARTBEAT_SECONDS):
+         try:
+            with send_lock:
+               send_message(sock, HEARTBEAT)
+         except OSError:
+            stopped.set()
+
+   threading.Thread(target=heartbeat, daemon=True).start()
+   played = 0
+   with ProcessPoolExecutor(processes, initializer=selfplay.init_worker,
+                            initargs=(config["search"], config["weights"],
+                                      config["budget"], config["depth"],
+                                      config["max_locks"])) as executor:
+      try:
+         while True:
+            kind, payload = receive_message(sock)
+            if kind == DONE:
+               # the games still waiting are not needed anymore (e.g. games
+               # of a lost worker that the coordinator got in the meantime)
+               executor.shutdown(wait=False, cancel_futures=True)
+               break
+            if kind != BATCH:
+               continue
+            batch_id, = struct.unpack_from("<I", payload)
+            games = struct.unpack_from("<%dI" % ((len(payload) - 4) // 4),
+                                       payload, 4)
+            for index in games:
+               future = executor.submit(selfplay.play_seed, index,
+                                        selfplay.game_seed(config["seed"],
+                                                           index))
+               future.add_done_callback(
+                  lambda future, batch_id=batch_id: send_result(batch_id,
+                                                                future))
+            played += len(games)
+      except ConnectionError:
+         if not failed.is_set():
+            print("the coordinator is gone", flush=True)
+         executor.shutdown(wait=False, cancel_futures=True)
+      finally:
+         stopped.set()
+   sock.close()
+   print("%d games received" % played)
+
+def main(argv=None):
+   parser = argparse.ArgumentParser(description="Tetris 2048 self-play cluster")
+   commands = parser.add_subparsers(dest="command", required=True)
+   coordinator = commands.add_parser("coordinator")
+   coordinator.add_argument("--port", type=int, default=PORT)
+   coordinator.add_argument("--games", type=int, default=1000)
+   coordinator.add_argument("--batch", type=int, default=8,
+                            help="the number of games of a batch")
+   coordinator.add_argument("--seed", type=int, default=0)
+   coordinator.add_argument("--search", choices=["greedy", "expectimax"],
+                            default="greedy")
+   coordinator.add_argument("--budget", type=float,
+                            default=autoplayer.BUDGET_SECONDS * 1000,
+                            help="time budget of a move in milliseconds (0 for "
+                                 "no limit)")
+   coordinator.add_argument("--depth", type=int,
+                            help="maximum depth of expectimax")
+   coordinator.add_argument("--max-locks", type=int,
+                            default=autoplayer.MAX_LOCKS,
+                            help="stop the games after N locks (0 for no limit)")
+   coordinator.add_argument("--weight", action="append", default=[],
+                            help="a weight of the heuristic as NAME=VALUE")
+   worker = commands.add_parser("worker")
+   worker.add_argument("host", help="the address of the coordinator")
+   worker.add_argument("--port", type=int, default=PORT)
+   worker.add_argument("--processes", type=int, default=os.cpu_count())
+   args = parser.parse_args(argv)
+
+   if args.command == "coordinator":
+      if args.games < 1 or args.batch < 1:
+         coordinator.error("--games and --batch must be at least 1")
+      # the seeds of the games are sent as unsigned 64-bit integers
+      if not 0 <= args.seed <= 2 ** 64 - args.games:
+         coordinator.error("--seed must be in 0..2**64 - games")
+      run_coordinator(args)
+   else:
+      run_worker(args.host, args.port, args.processes)
+   return 0
+
+if __name__ == '__main__':
+   sys.exit(main())
@@ -0,0 +1,196 @@
+################################################################################
+#                                                                              #
+# Gym-style environment for bots playing Tetris 2048 without the screen        #
+#                                                                              #
+# Usage: python environment.py [--episodes 10] [--seed 0]                      #
+#        (plays random placements and prints the scores and steps/s)           #
+#                                                                              #
+################################################################################
+
+# The environment runs the game rules of Tetris_2048 (game_tick with the lock
+# cascade of lock_tetromino) on a GameGrid without drawing anything:
+#   reset(seed)   starts a new game and returns (observation, info)
+#   step(action)  returns (observation, reward, terminated, truncated, info),
+#                 where the reward is the score gained by the action
+# The actions are integers: the primitive moves (PRIMITIVES, one tick of the
+# game each, as a key press in the game) followed by the placements: rotate
+# the current tetromino r times clockwise, move it so that its leftmost tile
+# is in column c and hard drop it (action len(PRIMITIVES) + r * grid_width +
+# c, see placement_action). The observation is a dictionary of NumPy arrays,
+# which are allocated once and updated in place at each step (copy them to
+# keep an observation):
+#   board     (h, w) uint8 exponents of the locked tiles (0 for empty cells,
+#             row 0 at the bottom)
+#   pieces    (2,) int8 types of the current and the next tetromino (index in
+#             tetromino.TYPES, -1 for none)
+#   tiles     (2, 4, 4) uint8 exponents of the tiles of the current and the
+#             next tetromino (their tile matrices, row 0 at the top)
+#   position  (3,) int16 column and row of the bottom left cell of the tile
+#             matrix and the rotation count of the current tetromino
+#   score     () int64 score of the game
+
+import sys
+import time
+import argparse
+import numpy as np
+from game_grid import GameGrid  # the class for modeling the game grid
+from tetromino import Tetromino, TYPES  # the class for modeling the tetrominoes
+import Tetris_2048 as game  # the game rules (create_tetromino, game_tick, ...)
+
+# the primitive moves and their keys in the game
+PRIMITIVES = ("left", "right", "down", "rotate", "space")
+PRIMITIVE_KEYS = ("left", "right", "down", "up", "space")
+
+
+# Returns the column of the leftmost tile of the given tetromino
+def leftmost_column(tetromino):
+   n = len(tetromino.tile_matrix)
+   for col in range(n):
+      for row in range(n):
+         if tetromino.tile_matrix[row][col] is not None:
+            return tetromino.bottom_left_cell.x + col
+
+# A class for an environment of a single game
+class GameEnv:
+   # Creates an environment with a game grid of the given dimensions; the
+   # episodes are truncated after max_ticks ticks when it is given
+   def __init__(self, grid_h=20, grid_w=12, max_ticks=None):
+      self.grid_height, self.grid_width = grid_h, grid_w
+      self.max_ticks = max_ticks
+      # the number of actions: the primitive moves and the placements
+      self.action_count = len(PRIMITIVES) + 4 * grid_w
+      self.grid = None
+      self.tick = 0  # the number of ticks of the game
+      self.locks = 0  # the number of locked tetrominoes
+      self.buffers = {
+         "board": np.zeros((grid_h, grid_w), np.uint8),
+         "pieces": np.full(2, -1, np.int8),
+         "tiles": np.zeros((2, 4, 4), np.uint8),
+         "position": np.zeros(3, np.int16),
+         "score": np.zeros((), np.int64),
+      }
+
+   # Returns the action that places the current tetromino rotated the given
+   # number of times with its leftmost tile in the given column
+   def placement_action(self, rotation, column):
+      return len(PRIMITIVES) + rotation * self.grid_width + column
+
+   # Starts a new game with the given seed (a random seed when it is not
+   # given) and returns the first observation and the info
+   def reset(self, seed=None):
+      Tetromino.grid_height = self.grid_height
+      Tetromino.grid_width = self.grid_width
+      self.grid = GameGrid(self.grid_height, self.grid_width, seed)
+      self.grid.current_tetromino = game.create_tetromino(self.grid.rng)
+      self.grid.next_tetromino = game.create_tetromino(self.grid.rng)
+      self.tick, self.locks = 0, 0
+      return self.observation(), self.info(False)
+
+   # Applies the given action and returns the observation, the reward (the
+   # score gained), whether the game is over, whether the episode has been
+   # truncated (see max_ticks) and the info (raises ValueError for an action
+   # outside range(action_count))
+   def step(self, action):
+      grid = self.grid
+      if grid is None or grid.game_over:
+         raise RuntimeError("the game is over, call reset to start a new one")
+      if not 0 <= action < self.action_count:
+         raise ValueError("action %r is not in range(%d)" % (
+            action, self.action_count))
+      score, current = grid.score, grid.current_tetromino
+      placed = True
+      if action < len(PRIMITIVES):
+         game_over = self.advance(PRIMITIVE_KEYS[action])
+      else:
+         rotation, column = divmod(action - len(PRIMITIVES), self.grid_width)
+         placed = self.move_to(rotation, column)
+         # the tetromino is hard dropped and locked in the same tick
+         game_over = self.advance("space")
+      locked = grid.current_tetromino is not current
+      self.locks += locked
+      truncated = self.max_ticks is not None and self.tick >= self.max_ticks
+      info = self.info(locked)
+      info["placed"] = placed
+      return self.observation(), grid.score - score, game_over, \
+         truncated and not game_over, info
+
+   # Runs one tick of the game with the given key and returns True when the
+   # game is over
+   def advance(self, key):
+      self.tick += 1
+      return game.game_tick(self.grid, key)
+
+   # Rotates and moves the current tetromino (without ticks) to the given
+   # placement and returns whether it could reach it
+   def move_to(self, rotation, column):
+      tetromino = self.grid.current_tetromino
+      for _ in range(rotation % 4):
+         count = tetromino.rotate_count
+         tetromino.rotate(self.grid)
+         if tetromino.rotate_count == count:
+            return False
+      shift = column - leftmost_column(tetromino)
+      direction = "right" if shift > 0 else "left"
+      for _ in range(abs(shift)):
+         if not tetromino.move(direction, self.grid):
+            return False
+      return True
+
+   # Returns the info of the last step
+   def info(self, locked):
+      return {"tick": self.tick, "locks": self.locks, "locked": locked,
+              "seed": self.grid.seed}
+
+   # Updates the observation buffers from the game and returns them
+   def observation(self):
+      grid, buffers = self.grid, self.buffers
+      buffers["board"][...] = np.frombuffer(
+         grid.tile_exponents(), np.uint8).reshape(buffers["board"].shape)
+      buffers["tiles"][...] = 0
+      for slot, tetromino in enumerate((grid.current_tetromino,
+                                        grid.next_tetromino)):
+         if tetromino is None:
+            buffers["pieces"][slot] = -1
+            continue
+         buffers["pieces"][slot] = TYPES.index(tetromino.type)
+         n = len(tetromino.tile_matrix)
+         for row in range(n):
+            for col in range(n):
+               tile = tetromino.tile_matrix[row][col]
+               if tile is not None:
+                  buffers["tiles"][slot, row, col] = \
+                     tile.number.bit_length() - 1
+      current = grid.current_tetromino
+      if current is not None:
+         buffers["position"][...] = (current.bottom_left_cell.x,
+                                     current.bottom_left_cell.y,
+                                     current.rotate_count)
+      buffers["score"][...] = grid.score
+      return buffers
+
+def main(argv=None):
+   parser = argparse.ArgumentParser(description="Tetris 2048 environment")
+   parser.add_argument("--episodes", type=int, default=10)
+   parser.add_argument("--seed", type=int, default=0)
+   args = parser.parse_args(argv)
+
+   env = GameEnv()
+   rng = np.random.default_rng(args.seed)
+   steps = 0
+   start = time.perf_counter()
+   for episode in range(args.episodes):
+      observation, info = env.reset(args.seed + episode)
+      done = False
+      while not done:
+         action = rng.integers(len(PRIMITIVES), env.action_count)
+         observation, reward, terminated, truncated, info = env.step(action)
+         done = terminated or truncated
+         steps += 1
+      print("episode %d: score %d, %d locks" % (
+         episode, observation["score"], info["locks"]))
+   elapsed = time.perf_counter() - start
+   print("%d steps in %.2f s (%.0f steps/s)" % (steps, elapsed, steps / elapsed))
+   return 0
+
+if __name__ == '__main__':
+   sys.exit(main())
@@ -0,0 +1,333 @@
+# Expectimax search for the autoplayer (see autoplayer.py): instead of
+# scoring the placements of the current tetromino alone, the autoplayer looks
+# ahead at the placements of the next tetromino, which is known, and at the
+# tetrominoes after it, which are chance nodes: each of the 7 types with equal
+# probability and each of its 4 tiles 2 or 4 with equal probability (as drawn
+# by create_tetromino). As their horizontal position is random in the game,
+# the unknown tetrominoes are not searched key by key: they are rotated and
+# dropped straight down from above each column. The value of a line of
+# placements is the heuristic of autoplayer.py: the features of the locks
+# along the line (merges, cleared rows, points) plus the features of the final
+# board.
+#
+# The search runs by iterative deepening (1 tetromino, then 2, ...) until the
+# time budget of the move runs out, and the placements of each iteration are
+# searched in the order of the values of the previous one, so the best
+# placement of the deepest (even unfinished) iteration is played. The deadline
+# is checked before each node, each chance child and each batch of locks, and
+# an iteration, an expansion or a chance node is not started when the running
+# mean of its time shows it cannot finish within the budget. Only the
+# BEAM_WIDTH best placements of each tetromino (by the heuristic of their own
+# lock, CHANCE_BEAM_WIDTH before a chance node) are searched deeper, and only
+# the DROP_BEAM_WIDTH best drops of each type of unknown tetromino (by the
+# heuristic of the board before the lock cascade) are locked with each
+# combination of tiles. The placements and locks of a (board, tetromino) and
+# the values of the nodes are kept in a bounded LRU transposition table,
+# shared by the iterations and the moves, so each iteration reuses the work of
+# the previous ones.
+
+import time
+from collections import OrderedDict
+from itertools import product
+import numpy as np
+from tetromino import TYPES, SHAPES
+from placements import find_placements
+from autoplayer import AutoPlayer, BUDGET_SECONDS, lock_placements, \
+   lock_cascade, board_values, lock_values
+
+# the default maximum number of tetrominoes searched (the current one, the
+# next one and one unknown tetromino)
+DEPTH = 3
+# the number of placements of each tetromino searched deeper (fewer before
+# the chance nodes, which cost the most)
+BEAM_WIDTH = 4
+CHANCE_BEAM_WIDTH = 2
+# the default number of entries of the transposition table
+TABLE_SIZE = 1 << 15
+# the value of the placements that end the game
+GAME_OVER_VALUE = -1e6
+# the exponents of the tiles of the unknown tetrominoes (2 or 4): the 8 of
+# their 16 equally likely combinations with an even number of 4s (a half
+# fraction in which any 3 of the tiles take all of their 8 combinations
+# equally often, so the expected value is estimated at half the cost)
+TILE_COMBINATIONS = np.array([combination for combination in
+                              product((1, 2), repeat=4)
+                              if combination.count(2) % 2 == 0], np.uint8)
+# the number of drops of each type of unknown tetromino locked with each
+# combination of tiles
+DROP_BEAM_WIDTH = 2
+
+
+# Returns the number of placements of a tetromino searched deeper when the
+# given known pieces come after it
+def beam_width(pieces):
+   return BEAM_WIDTH if pieces else CHANCE_BEAM_WIDTH
+
+# Raised when the time budget of the move runs out during a search
+class SearchTimeout(Exception):
+   pass
+
+# A bounded transposition table evicting the least recently used entries
+class TranspositionTable:
+   def __init__(self, size=TABLE_SIZE):
+      self.size = size
+      self.entries = OrderedDict()
+      self.hits, self.misses = 0, 0
+
+   # Returns the entry with the given key (None when there is none)
+   def get(self, key):
+      entry = self.entries.get(key)
+      if entry is None:
+         self.misses += 1
+      else:
+         self.hits += 1
+         self.entries.move_to_end(key)
+      return entry
+
+   # Stores the given entry with the given key
+   def put(self, key, entry):
+      self.entries[key] = entry
+      self.entries.move_to_end(key)
+      if len(self.entries) > self.size:
+         self.entries.popitem(last=False)
+
+# Returns the given tetromino as a search piece: its tile matrix (exponents of
+# the tile numbers, 0 for empty cells, row 0 at the top), its rotation count
+# and the position of the bottom left cell of its tile matrix
+def tetromino_piece(tetromino):
+   matrix = tuple(tuple(0 if tile is None else tile.number.bit_length() - 1
+                        for tile in row) for row in tetromino.tile_matrix)
+   return (matrix, tetromino.rotate_count, tetromino.bottom_left_cell.x,
+           tetromino.bottom_left_cell.y)
+
+# Returns the (row, column) cells of the matrix of the given size where the
+# given (row, column) cells are after k clockwise rotations
+def rotated_cells(cells, n, k):
+   for _ in range(k):
+      cells = [(col, n - 1 - row) for row, col in cells]
+   return cells
+
+# Returns the (column, offset from the bottom row) of the tiles of each
+# rotation of each type of tetromino (in the order in which their tiles are
+# created)
+def drop_shapes():
+   shapes = {}
+   for shape in TYPES:
+      n, cells = SHAPES[shape]
+      shapes[shape] = [[(col, n - 1 - row) for row, col in rotated_cells(
+         [(row, col) for col, row in cells], n, k)] for k in range(4)]
+   return shapes
+
+DROP_SHAPES = drop_shapes()
+
+# Returns the board (row, column) cells of the tiles (an (M, 4) array each, in
+# the order in which the tiles are created) of the tetrominoes of the given
+# type rotated and dropped straight down on the given board from above each
+# column where they fit
+def drop_cells(board, shape):
+   grid_h, grid_w = board.shape
+   occupied = board != 0
+   # the height of a column is the row of its top tile + 1
+   heights = np.where(occupied.any(axis=0),
+                      grid_h - np.argmax(occupied[::-1], axis=0), 0)
+   rows, cols = [], []
+   for cells in DROP_SHAPES[shape]:
+      dx = np.array([col for col, dy in cells])
+      dy = np.array([dy for col, dy in cells])
+      xs = np.arange(-dx.min(), grid_w - dx.max())[:, None]
+      # the tetromino rests on the highest column below one of its tiles
+      ys = (heights[xs + dx] - dy).max(axis=1, keepdims=True)
+      rows.append(ys + dy)
+      cols.append(xs + dx)
+   return np.concatenate(rows), np.concatenate(cols)
+
+# A class for the autoplayer searching the placements with expectimax
+class ExpectimaxPlayer(AutoPlayer):
+   def __init__(self, weights=None, budget=BUDGET_SECONDS, depth=DEPTH,
+                table_size=TABLE_SIZE):
+      super().__init__(weights, budget)
+      self.depth = depth
+      self.table = TranspositionTable(table_size)
+      self.depths = []  # the depth of the deepest iteration of each move
+      # the running means of the time taken by the iterations of each depth
+      # and by the expansions and the chance nodes that are not in the
+      # transposition table, so the search does not start what cannot finish
+      # within the budget
+      self.iteration_times = {}
+      self.node_times = {}
+      self.deadline = None
+
+   # Raises SearchTimeout when the time budget of the move has run out, or
+   # would run out during a node of the given kind ("expand" or "chance")
+   def check_time(self, kind=None):
+      if time.perf_counter() + self.node_times.get(kind, 0) >= self.deadline:
+         raise SearchTimeout()
+
+   # Adds the time taken by a node of the given kind started at the given
+   # time to the running mean of its kind
+   def node_done(self, kind, start):
+      elapsed = time.perf_counter() - start
+      mean = self.node_times.get(kind)
+      self.node_times[kind] = elapsed if mean is None else \
+         0.9 * mean + 0.1 * elapsed
+
+   # Returns the best placement of the current tetromino of the given game
+   # grid found within the time budget (None when there is none)
+   def choose(self, grid):
+      start = time.perf_counter()
+      self.deadline = start + self.budget
+      board = np.frombuffer(grid.tile_exponents(), np.uint8).reshape(
+         grid.grid_height, grid.grid_width)
+      pieces = tuple(tetromino_piece(tetromino) for tetromino in
+                     (grid.current_tetromino, grid.next_tetromino)
+                     if tetromino is not None)
+      # the placements of the current tetromino are needed whatever the time
+      placements, boards, gains, values = self.expand(board, pieces[0],
+                                                      check=False)
+      if not placements:
+         return None
+      order = list(np.argsort(-values, kind="stable"))
+      width = beam_width(pieces[1:])
+      reached = 1
+      for depth in range(2, self.depth + 1):
+         iteration_start = time.perf_counter()
+         if self.deadline <= iteration_start:
+            break
+         if self.iteration_times.get(depth, 0) > \
+               self.deadline - iteration_start:
+            # tried again once the estimate has decayed below the budget
+            self.iteration_times[depth] *= 0.9
+            break
+         deeper = {}
+         try:
+            for i in order[:width]:
+               deeper[i] = values[i] if values[i] <= GAME_OVER_VALUE else \
+                  gains[i] + self.next_value(boards[i], pieces[1:], depth - 1)
+         except SearchTimeout:
+            pass
+         # the placements are compared at the new depth as long as the best
+         # placement of the previous iteration has been searched again
+         if order[0] in deeper:
+            searched = sorted(deeper, key=deeper.get, reverse=True)
+            order = searched + [i for i in order if i not in deeper]
+         if len(deeper) < min(width, len(order)):
+            break
+         reached = depth
+         elapsed = time.perf_counter() - iteration_start
+         self.iteration_times[depth] = elapsed if depth not in \
+            self.iteration_times else \
+            0.9 * self.iteration_times[depth] + 0.1 * elapsed
+      self.depths.append(reached)
+      self.decision_times.append(time.perf_counter() - start)
+      return placements[order[0]]
+
+   # Returns the placements of the given piece on the given board, the boards
+   # after their locks, the heuristic values of their locks and their
+   # heuristic values (the locks and the boards after them); raises
+   # SearchTimeout when they are not in the transposition table and cannot be
+   # found within the budget (unless check is False)
+   def expand(self, board, piece, check=True):
+      key = ("expand", board.tobytes(), piece)
+      entry = self.table.get(key)
+      if entry is None:
+         if check:
+            self.check_time("expand")
+         start = time.perf_counter()
+         placements = find_placements(board, *piece)
+         boards, score, merges, clears, over = lock_placements(board,
+                                                               placements)
+         gains = lock_values(score, merges, clears, self.weights)
+         values = np.where(over, GAME_OVER_VALUE,
+                           gains + board_values(boards, self.weights))
+         entry = (placements, boards, gains, values)
+         self.table.put(key, entry)
+         self.node_done("expand", start)
+      return entry
+
+   # Returns the value of the given board with the given known pieces to be
+   # placed first, searching the given number of pieces
+   def next_value(self, board, pieces, depth):
+      if pieces:
+         return self.max_value(board, pieces, depth)
+      return self.chance_value(board, depth)
+
+   # Returns the value of the best placement of the first of the given pieces
+   # on the given board, searching the given number of pieces
+   def max_value(self, board, pieces, depth):
+      key = ("max", board.tobytes(), pieces, depth)
+      value = self.table.get(key)
+      if value is None:
+         self.check_time()
+         placements, boards, gains, values = self.expand(board, pieces[0])
+         value = values.max() if len(placements) else GAME_OVER_VALUE
+         if depth > 1 and value > GAME_OVER_VALUE:
+            best = np.argsort(-values,
+                              kind="stable")[:beam_width(pieces[1:])]
+            value = max(values[i] if values[i] <= GAME_OVER_VALUE else
+                        gains[i] + self.next_value(boards[i], pieces[1:],
+                                                   depth - 1) for i in best)
+         self.table.put(key, value)
+      return value
+
+   # Returns the expected value of the given board before an unknown
+   # tetromino, searching the given number of pieces
+   def chance_value(self, board, depth):
+      key = ("chance", board.tobytes(), depth)
+      value = self.table.get(key)
+      if value is None:
+         self.check_time("chance")
+         start = time.perf_counter()
+         value = self.expected_drop_value(board, depth)
+         self.table.put(key, value)
+         if depth == 1:
+            self.node_done("chance", start)
+      return value
+
+   # Returns the expected value of the best drop of an unknown tetromino on
+   # the given board, searching the given number of pieces: the best drops of
+   # each type are locked with all the combinations of tiles at once
+   def expected_drop_value(self, board, depth):
+      grid_h = board.shape[0]
+      rows, cols, types = [], [], []
+      for type_index, shape in enumerate(TYPES):
+         shape_rows, shape_cols = drop_cells(board, shape)
+         # the drops locking tiles above the game grid end the game
+         inside = (shape_rows < grid_h).all(axis=1)
+         rows.append(shape_rows[inside])
+         cols.append(shape_cols[inside])
+         types.append(np.full(inside.sum(), type_index))
+      self.check_time()
+      rows, cols = np.concatenate(rows), np.concatenate(cols)
+      types = np.concatenate(types)
+      # the drops of all the types are compared with tiles of 2 before the
+      # lock cascade, and the best ones of each type are kept
+      boards = np.repeat(board[None], len(rows), axis=0)
+      boards[np.arange(len(boards))[:, None], rows, cols] = 1
+      order = np.lexsort((-board_values(boards, self.weights), types))
+      starts = np.searchsorted(types[order], np.arange(len(TYPES)))
+      rank = np.arange(len(order)) - starts[types[order]]
+      kept = order[rank < DROP_BEAM_WIDTH]
+      rows, cols, types = rows[kept], cols[kept], types[kept]
+      starts = list(np.searchsorted(types, np.arange(len(TYPES))))
+      combos, count = len(TILE_COMBINATIONS), len(rows)
+      if count == 0:
+         return GAME_OVER_VALUE
+      boards = np.repeat(board[None], combos * count, axis=0)
+      index = np.arange(combos * count).reshape(combos, count, 1)
+      boards[index, rows[None], cols[None]] = TILE_COMBINATIONS[:, None, :]
+      gains = lock_values(*lock_cascade(boards), self.weights)
+      if depth == 1:
+         values = gains + board_values(boards, self.weights)
+      else:
+         values = np.empty(len(boards))
+         for i, child in enumerate(boards):
+            self.check_time()
+            values[i] = gains[i] + self.chance_value(child, depth - 1)
+      self.check_time()
+      values = values.reshape(combos, count)
+      # the best drop of each type (the types without drops end the game)
+      lengths = np.diff(starts + [count])
+      best = np.full((combos, len(TYPES)), GAME_OVER_VALUE)
+      best[:, lengths > 0] = np.maximum.reduceat(
+         values, np.array(starts)[lengths > 0], axis=1)
+      return best.mean()
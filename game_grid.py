@@ -4,14 +4,63 @@ from lib.color import Color  # used for coloring the game grid
 from point import Point  # used for tile positions
 import numpy as np  # fundamental Python module for scientific computing
 import copy as cp
+import struct  # used for storing the game state in snapshots
+import functools  # used for caching the keys of the Zobrist hash
 from player import Player
+from tile import Tile  # used for restoring the tiles of snapshots
+from tetromino import Tetromino  # used for restoring the tetrominoes
+from tetromino import SNAPSHOT as TETROMINO_SNAPSHOT, NO_TETROMINO
+from game_random import GameRandom, new_seed  # the random numbers of a game
+
+# snapshot layout of the game state: score (u64), state of the random number
+# generator (u64), game over flag, grid height and width (u8), followed by the
+# current and the next tetromino (see tetromino.SNAPSHOT) and the exponents of
+# the tile numbers on the game grid row by row (0 for empty cells)
+SNAPSHOT_HEADER = struct.Struct("<QQ?BB")
+# the seed of the random keys of the Zobrist hash of the locked tiles
+ZOBRIST_SEED = 0x2048
+# the number of tile exponents with a key (tile numbers up to 2^63)
+ZOBRIST_EXPONENTS = 64
+
+# The changes of the tiles of a game grid since the journal was started: the
+# previous tile of each changed cell (by row * grid width + column, None for
+# empty cells) and the previous numbers of the tiles whose numbers changed in
+# place, in order. Only the first change of a cell is kept, so the journal
+# stays small however many times the tiles move during a lock cascade.
+class Journal:
+   def __init__(self):
+      self.cells = {}
+      self.numbers = []
+
+# Returns the random 64-bit keys of the Zobrist hash of a game grid with the
+# given dimensions as keys[row][col][exponent of the tile number] (the same
+# keys for all the grids with these dimensions, 0 for empty cells)
+@functools.lru_cache(maxsize=None)
+def zobrist_keys(grid_h, grid_w):
+   rng = GameRandom(ZOBRIST_SEED)
+   return tuple(tuple(tuple([0] + [rng.next64() for _ in range(
+      ZOBRIST_EXPONENTS - 1)]) for col in range(grid_w))
+      for row in range(grid_h))
 
 # A class for modeling the game grid
 class GameGrid:
+   # debug mode: the incremental hash is checked against the hash computed
+   # from scratch after every lock cascade (see check_hash)
+   verify_hash = False
+
    # A constructor for creating the game grid based on the given arguments
-   def __init__(self, grid_h, grid_w):
+   # All random values of the game (tetromino types, tile numbers and spawn
+   # positions) come from a generator seeded with the given seed, so the same
+   # seed and the same user actions give the same game (a random seed is used
+   # when no seed is given)
+   def __init__(self, grid_h, grid_w, seed=None):
       # Create player
       self.player = Player()
+      # Create the random number generator of this game session
+      if seed is None:
+         seed = new_seed()
+      self.seed = seed
+      self.rng = GameRandom(seed)
       # Initialize score
       self.score = 0
       # set the dimensions of the game grid as the given arguments
@@ -19,12 +68,25 @@ class GameGrid:
       self.grid_width = grid_w
       # create a tile matrix to store the tiles locked on the game grid
       self.tile_matrix = np.full((grid_h, grid_w), None)
+      # the Zobrist hash of the locked tiles: the XOR of the keys of the
+      # (cell, tile exponent) pairs, updated with every change of the tiles
+      self.zobrist = zobrist_keys(grid_h, grid_w)
+      self.hash = 0
+      # the Journal of the tile changes while they are journaled (None
+      # otherwise), so they can be rolled back (see Tetris_2048.apply_placement)
+      self.journal = None
+      # the tiles of undone placements, reused by the next placements
+      self.spare_tiles = []
       # create the tetromino that is currently being moved on the game grid
       self.current_tetromino = None
       # create the next tetromino that will be move on the game grid
       self.next_tetromino = None
       # the game_over flag shows whether the game is over or not
       self.game_over = False
+      # the rewind buffer of the practice mode (None in normal games)
+      self.rewind = None
+      # the log of the gameplay events (None when the events are not logged)
+      self.telemetry = None
       # set the color used for the empty grid cells
       self.empty_cell_color = Color(206, 195, 181)
       # set the colors used for the grid lines and the grid boundaries
@@ -37,6 +99,37 @@ class GameGrid:
 
    # A method for displaying the game grid
    def display(self):
+      # draw the game grid, the tetrominoes and the score
+      self.draw()
+
+      # Pause Game button
+      button_width = 2
+      button_height = 1
+      button_x = 13.5
+      button_y = 10.5
+      if stddraw.mousePressed():
+         mouse_x, mouse_y = stddraw.mouseX(), stddraw.mouseY() #get the coordinates of mouse that has been clicked
+         # check if these coordinates are inside the pause button
+         if mouse_x >= button_x - button_width/2 and mouse_x <= button_x + button_width/2:
+            if mouse_y >= button_y - button_height/2 and mouse_y <= button_y + button_height/2:
+               self.pause_screen(self.grid_width, self.grid_height)
+
+      # show the resulting drawing with a pause duration according to difficulty level
+      if (self.player.getDiff() == 0):
+         stddraw.show(250)
+      if (self.player.getDiff() == 1):
+         stddraw.show(200)
+      if (self.player.getDiff() == 2):
+         stddraw.show(125)
+
+
+
+
+
+   # A method for drawing the game screen (the game grid, the tetrominoes, the
+   # score and the pause button) without showing it, so that callers can show
+   # it with their own pause duration (e.g. replays)
+   def draw(self):
       # clear the background to empty_cell_color
       stddraw.clear(self.empty_cell_color)
       # draw the game grid
@@ -57,15 +150,6 @@ class GameGrid:
       stddraw.setFontSize(20)
       stddraw.text(button_x + button_width / 2, button_y + button_height / 2, "Pause")
 
-      if stddraw.mousePressed():
-         mouse_x, mouse_y = stddraw.mouseX(), stddraw.mouseY() #get the coordinates of mouse that has been clicked
-         # check if these coordinates are inside the pause button
-         if mouse_x >= button_x - button_width/2 and mouse_x <= button_x + button_width/2:
-            if mouse_y >= button_y - button_height/2 and mouse_y <= button_y + button_height/2:
-               self.pause_screen(self.grid_width, self.grid_height)
-
-
-
       # draw the current/active tetromino if it is not None
       # (the case when the game grid is updated)
       if self.current_tetromino is not None:
@@ -75,17 +159,6 @@ class GameGrid:
          self.next_tetromino.draw_outside()
       # draw a box around the game grid
       self.draw_boundaries()
-      # show the resulting drawing with a pause duration according to difficulty level
-      if (self.player.getDiff() == 0):
-         stddraw.show(250)
-      if (self.player.getDiff() == 1):
-         stddraw.show(200)
-      if (self.player.getDiff() == 2):
-         stddraw.show(125)
-
-
-
-
 
    # A method for drawing the cells and the lines of the game grid
 
@@ -162,27 +235,45 @@ class GameGrid:
                pos.x = blc_position.x + col
                pos.y = blc_position.y + (n_rows - 1) - row
                if self.is_inside(pos.y, pos.x):
-                  self.tile_matrix[pos.y][pos.x] = tiles_to_lock[row][col]
+                  self.set_tile(pos.y, pos.x, tiles_to_lock[row][col])
                # the game is over if any placed tile is above the game grid
                else:
                   self.game_over = True
       # return the game_over flag
       return self.game_over
 
+   # Removes the full rows (adding their numbers to the score) and returns the
+   # number of removed rows
    def clear_tiles(self):
       row = 0
       total_score = 0
+      cleared = 0
       while (row < self.grid_height):
          # check if the row is full
          if all(self.tile_matrix[row]):
             total_score += sum(element.number for element in self.tile_matrix[row])
-            # remove the row from the game grid
-            self.tile_matrix = np.delete(self.tile_matrix, row, 0)
-            # add an empty row to the game grid
-            self.tile_matrix = np.insert(self.tile_matrix, -1, None, 0)
+            if self.telemetry is not None:
+               self.telemetry.clear()
+            self.remove_row(row)
+            cleared += 1
          else:
             row += 1
       self.score += total_score
+      return cleared
+
+   # Removes the given row in place: the rows above it move down by one and
+   # an empty row is inserted below the top row, so the top row stays on top
+   # unless it is the removed row (then the row below it moves up to the top)
+   def remove_row(self, row):
+      top = self.grid_height - 1
+      if row == top:
+         for col in range(self.grid_width):
+            self.set_tile(top, col, self.tile_matrix[top - 1][col])
+      for r in range(row, top - 1):
+         for col in range(self.grid_width):
+            self.set_tile(r, col, self.tile_matrix[r + 1][col])
+      for col in range(self.grid_width):
+         self.set_tile(top - 1, col, None)
 
    # draws the ghost tetromino on the game grid
    def ghost_tetromino(self):
@@ -198,11 +289,142 @@ class GameGrid:
       for row in range(self.grid_height):  # does not contain the bottommost row
          for col in range(self.grid_width):
             if free_tiles[row][col]:
-               free_tile_copy = cp.deepcopy(self.tile_matrix[row][col])
-               self.tile_matrix[row - 1][col] = free_tile_copy
+               self.move_tile(row, col, row - 1, col)
                dx, dy = 0, -1  # change of the position in x and y directions
                self.tile_matrix[row - 1][col].move(dx, dy)
-               self.tile_matrix[row][col] = None
+
+   # Returns the state of the game (the locked tiles, the current and the next
+   # tetromino, the score, the game over flag and the state of the random
+   # number generator) as compact bytes, which restore brings the game back to.
+   # Snapshots are cheap compared to copy.deepcopy, so search algorithms and
+   # rewinding can take them freely.
+   def snapshot(self):
+      current, next = self.current_tetromino, self.next_tetromino
+      return b"".join((
+         SNAPSHOT_HEADER.pack(self.score, self.rng.getstate(), self.game_over,
+                              self.grid_height, self.grid_width),
+         NO_TETROMINO if current is None else current.snapshot(),
+         NO_TETROMINO if next is None else next.snapshot(),
+         self.tile_exponents()))
+
+   # Returns the exponents of the tile numbers on the game grid row by row (0
+   # for empty cells) as bytes
+   def tile_exponents(self):
+      rows = self.tile_matrix.tolist()
+      # the rows above the highest tile are empty, so they are not visited
+      height, empty_row = len(rows), [None] * self.grid_width
+      while height and rows[height - 1] == empty_row:
+         height -= 1
+      return bytes([0 if tile is None else tile.number.bit_length() - 1
+                    for row in rows[:height] for tile in row]) + \
+         bytes((len(rows) - height) * self.grid_width)
+
+   # Restores the state of the game from the given snapshot. The tiles on the
+   # grid cells whose numbers are the same in the snapshot and the unchanged
+   # tetrominoes are kept, so only what changed since the snapshot allocates
+   # new objects.
+   def restore(self, data):
+      score, state, game_over, grid_h, grid_w = \
+         SNAPSHOT_HEADER.unpack_from(data, 0)
+      if grid_h != self.grid_height or grid_w != self.grid_width:
+         raise ValueError("the snapshot is of a %dx%d game grid" %
+                          (grid_h, grid_w))
+      self.score, self.game_over = score, game_over
+      self.rng.setstate(state)
+      offset = SNAPSHOT_HEADER.size
+      # e.g. the next tetromino of the snapshot is the current tetromino after
+      # a lock, and the same tetromino must not be used twice
+      reuse = [self.current_tetromino, self.next_tetromino]
+      current = Tetromino.from_snapshot(data, offset, reuse)
+      offset += TETROMINO_SNAPSHOT.size
+      reuse = [tetromino for tetromino in reuse if tetromino is not current]
+      self.next_tetromino = Tetromino.from_snapshot(data, offset, reuse)
+      self.current_tetromino = current
+      offset += TETROMINO_SNAPSHOT.size
+      # only the cells whose exponents differ from the snapshot are replaced
+      exponents = np.frombuffer(data, np.uint8, grid_h * grid_w, offset)
+      current = np.frombuffer(self.tile_exponents(), np.uint8)
+      for i in np.flatnonzero(exponents != current).tolist():
+         row, col = divmod(i, grid_w)
+         exponent = int(exponents[i])
+         self.set_tile(row, col, None if exponent == 0 else
+                       Tile.with_number(1 << exponent))
+
+   # Returns the key of the tile on the given cell in the Zobrist hash (0 for
+   # an empty cell)
+   def hash_cell(self, row, col):
+      tile = self.tile_matrix[row][col]
+      if tile is None:
+         return 0
+      return self.zobrist[row][col][tile.number.bit_length() - 1]
+
+   # Returns the XOR of the keys of the tiles on the rows from the given row up
+   # to the top of the game grid (or to the given end row, excluded)
+   def hash_rows(self, first, end=None):
+      result = 0
+      for row in range(first, self.grid_height if end is None else end):
+         for col in range(self.grid_width):
+            if self.tile_matrix[row][col] is not None:
+               result ^= self.hash_cell(row, col)
+      return result
+
+   # Puts the given tile (None for no tile) on the given cell and updates the
+   # hash (and the journal)
+   def set_tile(self, row, col, tile):
+      previous = self.tile_matrix[row][col]
+      if previous is tile:
+         return
+      journal = self.journal
+      if journal is not None:
+         index = row * self.grid_width + col
+         if index not in journal.cells:
+            journal.cells[index] = previous
+      self.hash ^= self.hash_cell(row, col)
+      self.tile_matrix[row][col] = tile
+      self.hash ^= self.hash_cell(row, col)
+
+   # Doubles the number of the tile on the given cell (a merge) and updates
+   # the hash (and the journal); the colors are updated by the caller
+   def double_tile(self, row, col):
+      tile = self.tile_matrix[row][col]
+      journal = self.journal
+      if journal is not None:
+         journal.cells.setdefault(row * self.grid_width + col, tile)
+         journal.numbers.append((tile, tile.number))
+      self.hash ^= self.hash_cell(row, col)
+      tile.number *= 2
+      self.hash ^= self.hash_cell(row, col)
+
+   # Brings the changed cells of the given journal back to their previous
+   # tiles and numbers and updates the hash
+   def rollback(self, journal):
+      grid_w, matrix, keys = self.grid_width, self.tile_matrix, self.zobrist
+      for index in journal.cells:
+         row, col = divmod(index, grid_w)
+         tile = matrix[row][col]
+         if tile is not None:
+            self.hash ^= keys[row][col][tile.number.bit_length() - 1]
+      for tile, number in reversed(journal.numbers):
+         tile.renumber(number)
+      for index, tile in journal.cells.items():
+         row, col = divmod(index, grid_w)
+         matrix[row][col] = tile
+         if tile is not None:
+            self.hash ^= keys[row][col][tile.number.bit_length() - 1]
+
+   # Moves the tile on the given cell to the given (empty) cell and updates
+   # the hash
+   def move_tile(self, row, col, to_row, to_col):
+      self.set_tile(to_row, to_col, self.tile_matrix[row][col])
+      self.set_tile(row, col, None)
+
+   # Raises RuntimeError when the incremental hash differs from the hash
+   # computed from scratch (see verify_hash)
+   def check_hash(self):
+      expected = self.hash_rows(0)
+      if self.hash != expected:
+         raise RuntimeError("the hash of the game grid is %016x instead of "
+                            "%016x" % (self.hash, expected))
 
    # Displays the score on the top right of the main game screen
    def display_Score(self):
@@ -212,6 +434,11 @@ class GameGrid:
       stddraw.text(14.5, 16.5, text_to_display)
       high_score_text = "HIGH SCORE: " + str(self.player.getHighScore())
       stddraw.text(14.5, 13.5, high_score_text)
+      # remind the key for rewinding in practice mode
+      if self.rewind is not None:
+         stddraw.setFontSize(16)
+         stddraw.text(14.5, 9, "PRACTICE")
+         stddraw.text(14.5, 8.4, "Backspace: undo lock")
 
       # return the value of the game_over flag
       return self.game_over
@@ -0,0 +1,58 @@
+import os  # the os module is used for drawing fresh seeds
+import random  # the base class providing randint, choice, shuffle, etc.
+
+# mask for keeping the generator state and outputs on 64 bits
+MASK_64 = (1 << 64) - 1
+
+# Returns a new random 64-bit seed for a game session
+def new_seed():
+   return int.from_bytes(os.urandom(8), "little")
+
+# A random number generator scoped to a single game session. It uses the
+# SplitMix64 algorithm, so its whole state is one 64-bit integer: the same
+# seed gives the same sequence on every platform and Python version, and the
+# state is cheap to store in snapshots, keyframes and save files.
+# It subclasses random.Random, so all of the usual methods (randint, choice,
+# shuffle, ...) are available and built on the random and getrandbits
+# methods defined below.
+class GameRandom(random.Random):
+   # A constructor for creating a generator with the given (integer) seed
+   # or with a fresh random seed when no seed is given
+   def __init__(self, seed=None):
+      self.state = 0
+      super().__init__(seed)
+
+   # Resets the generator to the start of the sequence of the given seed
+   def seed(self, a=None, version=2):
+      if a is None:
+         a = new_seed()
+      self.state = int(a) & MASK_64
+
+   # Returns the next 64-bit output of the generator
+   def next64(self):
+      self.state = (self.state + 0x9E3779B97F4A7C15) & MASK_64
+      z = self.state
+      z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & MASK_64
+      z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & MASK_64
+      return z ^ (z >> 31)
+
+   # Returns a random float in [0.0, 1.0) with 53 bits of precision
+   def random(self):
+      return (self.next64() >> 11) * (1.0 / 9007199254740992.0)
+
+   # Returns a non-negative integer with k random bits
+   def getrandbits(self, k):
+      if k <= 64:
+         return self.next64() >> (64 - k) if k > 0 else 0
+      result, bits = 0, 0
+      while bits < k:
+         result = (result << 64) | self.next64()
+         bits += 64
+      return result >> (bits - k)
+
+   # The state is the single 64-bit integer of the generator
+   def getstate(self):
+      return self.state
+
+   def setstate(self, state):
+      self.state = state
@@ -0,0 +1,215 @@
+################################################################################
+#                                                                              #
+# Leaderboard and history of the finished games, stored in a SQLite database   #
+#                                                                              #
+# Usage: python leaderboard.py top [--difficulty 0] [-n 10]                    #
+#        python leaderboard.py day [DATE] [-n 10]   (DATE as YYYY-MM-DD)       #
+#                                                                              #
+################################################################################
+
+# Every finished game is stored with its score, highest tile, number of locked
+# tetrominoes, duration, difficulty, seed and replay file. The database is only
+# used on a background thread: the game queues the finished games and the
+# queries without waiting, the games are inserted in batches (one transaction
+# for all of the games waiting in the queue) and the results of the queries
+# are delivered as futures, so the menus never wait for the disk.
+
+import os  # the os module is used for file and directory operations
+import sys
+import time
+import queue
+import atexit  # used for writing the queued games when the game exits
+import sqlite3
+import argparse
+import threading
+from concurrent.futures import Future
+from settings import DIFFICULTIES  # the difficulty levels of the game
+
+# the version of the database schema (stored as the user_version of the
+# database, so that older databases can be migrated)
+SCHEMA_VERSION = 1
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS games (
+   id INTEGER PRIMARY KEY,
+   finished_at REAL NOT NULL,  -- seconds since the epoch
+   day TEXT NOT NULL,          -- local date as YYYY-MM-DD
+   score INTEGER NOT NULL,
+   max_tile INTEGER NOT NULL,
+   pieces INTEGER NOT NULL,
+   duration REAL NOT NULL,     -- seconds
+   difficulty INTEGER NOT NULL,
+   seed TEXT NOT NULL,         -- 64-bit seed as 16 hex digits
+   replay_path TEXT
+);
+-- top N of a difficulty level
+CREATE INDEX IF NOT EXISTS games_by_difficulty ON games (difficulty, score DESC);
+-- top N of a day
+CREATE INDEX IF NOT EXISTS games_by_day ON games (day, score DESC);
+"""
+COLUMNS = ("finished_at", "day", "score", "max_tile", "pieces", "duration",
+           "difficulty", "seed", "replay_path")
+INSERT = "INSERT INTO games (%s) VALUES (%s)" % (", ".join(COLUMNS),
+                                                ", ".join("?" * len(COLUMNS)))
+# at most this many games are inserted in one transaction
+BATCH_SIZE = 64
+
+
+# Returns the path of the database in the save folder of the game
+def leaderboard_path():
+   current_dir = os.path.dirname(os.path.realpath(__file__))
+   return current_dir + "/save/leaderboard.db"
+
+# Opens the database at the given path, creating or migrating its schema
+def connect(path):
+   folder = os.path.dirname(path)
+   if folder:
+      os.makedirs(folder, exist_ok=True)
+   connection = sqlite3.connect(path)
+   connection.row_factory = sqlite3.Row
+   # readers (e.g. other kiosks or the command line) do not block the writes
+   connection.execute("PRAGMA journal_mode=WAL")
+   version = connection.execute("PRAGMA user_version").fetchone()[0]
+   if version < SCHEMA_VERSION:
+      with connection:
+         connection.executescript(SCHEMA)
+         connection.execute("PRAGMA user_version = %d" % SCHEMA_VERSION)
+   return connection
+
+# A class for the leaderboard database, used from a background thread
+class Leaderboard:
+   def __init__(self, path=None):
+      self.path = path or leaderboard_path()
+      self.jobs = queue.Queue()  # (sql or None for inserts, values, future)
+      self.thread = None  # started when the first job is queued
+      self.lock = threading.Lock()
+      # write the queued games when the program exits
+      atexit.register(self.flush)
+
+   # Queues a job for the background thread and returns its future
+   def submit(self, sql, values):
+      future = Future()
+      with self.lock:
+         if self.thread is None:
+            self.thread = threading.Thread(target=self.work, name="Leaderboard")
+            self.thread.daemon = True
+            self.thread.start()
+      self.jobs.put((sql, values, future))
+      return future
+
+   # Queues a finished game to be stored; the seed is the 64-bit seed of the
+   # game session and the replay path may be None
+   def record_game(self, score, max_tile, pieces, duration, difficulty, seed,
+                   replay_path=None, finished_at=None):
+      if finished_at is None:
+         finished_at = time.time()
+      day = time.strftime("%Y-%m-%d", time.localtime(finished_at))
+      return self.submit(None, (finished_at, day, score, max_tile, pieces,
+                                duration, difficulty, "%016x" % seed,
+                                replay_path))
+
+   # Returns a future of the n best games (as dictionaries) of the given
+   # difficulty level (of all levels when it is None)
+   def top(self, n=10, difficulty=None):
+      if difficulty is None:
+         return self.submit("SELECT * FROM games ORDER BY score DESC LIMIT ?",
+                            (n,))
+      return self.submit("SELECT * FROM games WHERE difficulty = ? "
+                         "ORDER BY score DESC LIMIT ?", (difficulty, n))
+
+   # Returns a future of the n best games of the given day (YYYY-MM-DD, today
+   # when it is None)
+   def top_of_day(self, day=None, n=10):
+      if day is None:
+         day = time.strftime("%Y-%m-%d")
+      return self.submit("SELECT * FROM games WHERE day = ? "
+                         "ORDER BY score DESC LIMIT ?", (day, n))
+
+   # Waits until all of the queued jobs are done
+   def flush(self):
+      if self.thread is not None:
+         self.jobs.join()
+
+   # The loop of the background thread running the queued jobs
+   def work(self):
+      try:
+         connection, failure = connect(self.path), None
+      except (OSError, sqlite3.Error) as error:
+         # e.g. an unwritable save folder or a locked or corrupt database:
+         # the jobs fail, but the queue is still drained so flush returns
+         print("Could not open the leaderboard: %s" % error, file=sys.stderr)
+         connection, failure = None, error
+      while True:
+         jobs = [self.jobs.get()]
+         # take the other waiting jobs too, so the games are inserted in batches
+         while len(jobs) < BATCH_SIZE:
+            try:
+               jobs.append(self.jobs.get_nowait())
+            except queue.Empty:
+               break
+         try:
+            if connection is None:
+               for _, _, future in jobs:
+                  future.set_exception(failure)
+            else:
+               self.run(connection, jobs)
+         finally:
+            for _ in jobs:
+               self.jobs.task_done()
+
+   # Runs the given jobs on the given connection
+   def run(self, connection, jobs):
+      games = []
+      for sql, values, future in jobs:
+         if sql is None:
+            games.append((values, future))
+            continue
+         # the games queued before a query are inserted before it runs
+         self.insert(connection, games)
+         games = []
+         try:
+            rows = connection.execute(sql, values).fetchall()
+            future.set_result([dict(row) for row in rows])
+         except sqlite3.Error as error:
+            future.set_exception(error)
+      self.insert(connection, games)
+
+   # Inserts the given (values, future) pairs of games in one transaction
+   def insert(self, connection, games):
+      if not games:
+         return
+      try:
+         with connection:
+            connection.executemany(INSERT, [values for values, _ in games])
+         for _, future in games:
+            future.set_result(None)
+      except sqlite3.Error as error:
+         print("Could not store the games: %s" % error, file=sys.stderr)
+         for _, future in games:
+            future.set_exception(error)
+
+# the leaderboard shared by the whole game
+leaderboard = Leaderboard()
+
+def main(argv=None):
+   parser = argparse.ArgumentParser(description="Tetris 2048 leaderboard")
+   parser.add_argument("command", choices=["top", "day"])
+   parser.add_argument("day", nargs="?", help="the day (YYYY-MM-DD) of the day command")
+   parser.add_argument("--difficulty", type=int, choices=sorted(DIFFICULTIES))
+   parser.add_argument("-n", type=int, default=10, help="the number of games")
+   parser.add_argument("--database", default=leaderboard_path())
+   args = parser.parse_args(argv)
+
+   board = Leaderboard(args.database)
+   if args.command == "top":
+      games = board.top(args.n, args.difficulty).result()
+   else:
+      games = board.top_of_day(args.day, args.n).result()
+   for rank, game in enumerate(games, 1):
+      print("%2d. %7d  max tile %5d  %4d pieces  %6.1f s  %-6s  %s" % (
+         rank, game["score"], game["max_tile"], game["pieces"],
+         game["duration"], DIFFICULTIES.get(game["difficulty"], "?"),
+         time.strftime("%Y-%m-%d %H:%M", time.localtime(game["finished_at"]))))
+   return 0
+
+if __name__ == '__main__':
+   sys.exit(main())
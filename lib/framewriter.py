@@ -0,0 +1,243 @@
+"""
+framewriter.py
+
+The framewriter module defines the FrameWriter class, which encodes
+and writes images (screenshots or numbered frame sequences) on
+background threads, so that the drawing loop never waits for an
+image to be encoded or written.
+"""
+
+#-----------------------------------------------------------------------
+
+import os
+import zlib
+import queue
+import struct
+import threading
+import traceback
+
+os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = 'hide'
+import pygame
+
+#-----------------------------------------------------------------------
+
+_DEFAULT_WORKERS = 2
+_DEFAULT_MAX_PENDING = 8
+_DEFAULT_COMPRESSION = 1  # zlib level: fast, still much smaller than raw
+
+# pygame.image.tostring was renamed to tobytes in pygame 2.1.3.
+_toBytes = getattr(pygame.image, 'tobytes', None) or pygame.image.tostring
+_fromBytes = getattr(pygame.image, 'frombytes', None) or \
+    pygame.image.fromstring
+
+#-----------------------------------------------------------------------
+
+def _pngChunk(chunkType, data):
+    """
+    Return the PNG chunk of the given type holding data.
+    """
+    crc = zlib.crc32(data, zlib.crc32(chunkType))
+    return struct.pack('>I', len(data)) + chunkType + data + \
+        struct.pack('>I', crc)
+
+def encodePng(data, size, level=_DEFAULT_COMPRESSION):
+    """
+    Return the bytes of a PNG image holding the RGB pixels in data
+    (3 * size[0] * size[1] bytes, row by row). The compression is done
+    by zlib, which releases the GIL, so other threads keep running
+    while an image is encoded (pygame.image.save does not).
+    """
+    width, height = size
+    stride = 3 * width
+    # each row starts with the filter type 0 (no filtering)
+    raw = b''.join(b'\x00' + data[y * stride:(y + 1) * stride]
+                   for y in range(height))
+    header = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    return b'\x89PNG\r\n\x1a\n' + _pngChunk(b'IHDR', header) + \
+        _pngChunk(b'IDAT', zlib.compress(raw, level)) + \
+        _pngChunk(b'IEND', b'')
+
+#-----------------------------------------------------------------------
+
+class FrameWriter:
+    """
+    A FrameWriter object writes images to files on a pool of worker
+    threads. At most maxPending images wait to be written; an image
+    submitted while the queue is full is dropped (and counted in the
+    dropped attribute) instead of making the caller wait. The file
+    format is determined by the extension of the file name, as with
+    pygame.image.save. PNG files are encoded with encodePng, which
+    does not hold the GIL while compressing; other formats are encoded
+    by pygame.
+    """
+
+    def __init__(self, workers=_DEFAULT_WORKERS,
+                 maxPending=_DEFAULT_MAX_PENDING,
+                 compression=_DEFAULT_COMPRESSION):
+        """
+        Construct self with the given number of worker threads, the
+        given maximum number of images waiting to be written and the
+        given zlib compression level (0 to 9) for PNG files.
+        """
+        self._queue = queue.Queue(maxPending)
+        self._compression = compression
+        self.dropped = 0   # number of images dropped as the queue was full
+        self.written = 0   # number of images written successfully
+        self.failed = 0    # number of images that could not be written
+        self._lock = threading.Lock()
+        self._workers = []
+        for i in range(workers):
+            worker = threading.Thread(target=self._work,
+                                      name='FrameWriter-' + str(i))
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+
+    #-------------------------------------------------------------------
+
+    def submit(self, f, data, size, onDone=None):
+        """
+        Write the RGB pixels in data (a bytes object of
+        3 * size[0] * size[1] bytes, row by row) to the file f. If
+        onDone is not None, onDone(error) is called on the worker
+        thread after the write, where error is None on success or the
+        exception raised. Return True if the image was queued, and
+        False if it was dropped because the queue is full.
+        """
+        try:
+            self._queue.put_nowait((f, data, size, onDone))
+            return True
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+
+    def submitSurface(self, f, surface, onDone=None):
+        """
+        Copy the pixels of the pygame surface now and write them to the
+        file f in the background. See submit for onDone and the return
+        value. Nothing is copied if the queue is full.
+        """
+        if self._queue.full():
+            with self._lock:
+                self.dropped += 1
+            return False
+        data = _toBytes(surface, 'RGB')
+        return self.submit(f, data, surface.get_size(), onDone)
+
+    def submitArray(self, f, pixels, onDone=None):
+        """
+        Copy the pixels of the NumPy array of shape (height, width, 3)
+        now (for example a view returned by stddraw.frameArray) and
+        write them to the file f in the background. See submit for
+        onDone and the return value. Nothing is copied if the queue
+        is full.
+        """
+        if self._queue.full():
+            with self._lock:
+                self.dropped += 1
+            return False
+        height, width = pixels.shape[0], pixels.shape[1]
+        data = pixels.astype('uint8', copy=False).tobytes()
+        return self.submit(f, data, (width, height), onDone)
+
+    def sequenceCallback(self, pattern):
+        """
+        Return a function that can be passed to
+        stddraw.setFrameCallback to write every shown frame to the file
+        pattern % i, where i is the frame number starting from 0 (for
+        example 'frames/frame_%06d.png'). Frame numbers of dropped
+        frames are skipped, so gaps in the sequence show the frames
+        that were dropped.
+        """
+        counter = [0]
+        def callback(frame):
+            self.submitArray(pattern % counter[0], frame)
+            counter[0] += 1
+        return callback
+
+    #-------------------------------------------------------------------
+
+    def pending(self):
+        """
+        Return the number of images waiting to be written.
+        """
+        return self._queue.qsize()
+
+    def flush(self):
+        """
+        Wait until all of the queued images have been written.
+        """
+        self._queue.join()
+
+    def close(self):
+        """
+        Write the queued images and stop the worker threads.
+        """
+        self.flush()
+        for _ in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join()
+        self._workers = []
+
+    #-------------------------------------------------------------------
+
+    def _work(self):
+        """
+        Encode and write the queued images until a None job is found.
+        """
+        while True:
+            job = self._queue.get()
+            if job is None:
+                self._queue.task_done()
+                return
+            try:
+                self._write(*job)
+            finally:
+                # flush and close must not wait forever for a failed job
+                self._queue.task_done()
+
+    def _write(self, f, data, size, onDone):
+        """
+        Encode and write one image and report the outcome to onDone.
+        """
+        error = None
+        try:
+            if f.lower().endswith('.png'):
+                png = encodePng(data, size, self._compression)
+                with open(f, 'wb') as imageFile:
+                    imageFile.write(png)
+            else:
+                surface = _fromBytes(data, size, 'RGB')
+                pygame.image.save(surface, f)
+            with self._lock:
+                self.written += 1
+        except Exception as e:
+            error = e
+            with self._lock:
+                self.failed += 1
+        if onDone is not None:
+            try:
+                onDone(error)
+            except Exception:
+                # an error of the caller must not stop the worker thread
+                traceback.print_exc()
+
+#-----------------------------------------------------------------------
+
+def _main():
+    """
+    For testing: write a numbered sequence of 10 frames to the current
+    directory and report the counts.
+    """
+    surface = pygame.Surface((64, 64))
+    writer = FrameWriter()
+    for i in range(10):
+        surface.fill((25 * i, 0, 0))
+        writer.submitSurface('frame_%02d.png' % i, surface)
+    writer.close()
+    print('written:', writer.written, 'dropped:', writer.dropped)
+
+if __name__ == '__main__':
+    _main()
@@ -15,11 +15,11 @@ os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = 'hide'
 import pygame
 import pygame.gfxdraw
 import pygame.font
+import pygame.surfarray
+
+# Tkinter is imported only by the functions that display dialog boxes, so that
+# the module also works (offscreen) on servers without Tk.
 
-import tkinter as Tkinter
-import tkinter.messagebox as tkMessageBox
-import tkinter.filedialog as tkFileDialog
-	
 #-----------------------------------------------------------------------
 
 # Define colors so clients need not import the color module.
@@ -44,6 +44,7 @@ try:
     from lib.color import BOOK_BLUE
     from lib.color import BOOK_LIGHT_BLUE
     from lib.color import BOOK_RED
+    from lib.framewriter import FrameWriter
 except ModuleNotFoundError:
     from color import WHITE
     from color import BLACK
@@ -65,6 +66,7 @@ except ModuleNotFoundError:
     from color import BOOK_BLUE
     from color import BOOK_LIGHT_BLUE
     from color import BOOK_RED
+    from framewriter import FrameWriter
 
 #-----------------------------------------------------------------------
 
@@ -100,6 +102,18 @@ _keysTyped = []
 # Has the window been created?
 _windowCreated = False
 
+# Is the canvas drawn only into memory, without a window (see setCanvasSize)?
+_offscreen = False
+
+# The function called with each shown frame (see setFrameCallback)
+_frameCallback = None
+
+# The background writer used by saveAsync (created when first needed)
+_frameWriter = None
+
+# The 16-bit scratch arrays of grayFrameArray (created when first needed)
+_grayScratch = None
+
 #-----------------------------------------------------------------------
 # Begin added by Alan J. Broder
 #-----------------------------------------------------------------------
@@ -160,17 +174,23 @@ def _userY(y):
     
 #-----------------------------------------------------------------------
 
-def setCanvasSize(w=_DEFAULT_CANVAS_SIZE, h=_DEFAULT_CANVAS_SIZE):
+def setCanvasSize(w=_DEFAULT_CANVAS_SIZE, h=_DEFAULT_CANVAS_SIZE,
+                  offscreen=False):
     """
     Set the size of the canvas to w pixels wide and h pixels high.
     Calling this function is optional. If you call it, you must do
-    so before calling any drawing function.
+    so before calling any drawing function. If offscreen is True,
+    no window is opened: drawing goes to an in-memory canvas that can
+    be saved with save(), show() returns without waiting and no mouse
+    or keyboard events are reported. This works on computers without
+    a display.
     """
     global _background
     global _surface
     global _canvasWidth
     global _canvasHeight
     global _windowCreated
+    global _offscreen
 
     if _windowCreated:
         raise Exception('The stddraw window already was created')
@@ -180,8 +200,12 @@ def setCanvasSize(w=_DEFAULT_CANVAS_SIZE, h=_DEFAULT_CANVAS_SIZE):
 
     _canvasWidth = w
     _canvasHeight = h
-    _background = pygame.display.set_mode([w, h])
-    pygame.display.set_caption('Tetris 2048')
+    _offscreen = offscreen
+    if offscreen:
+        _background = None
+    else:
+        _background = pygame.display.set_mode([w, h])
+        pygame.display.set_caption('Tetris 2048')
     _surface = pygame.Surface((w, h))
     _surface.fill(_pygameColor(WHITE))
     _windowCreated = True
@@ -556,12 +580,108 @@ def save(f):
 
     pygame.image.save(_surface, f)
 
+def saveAsync(f, onDone=None):
+    """
+    Save the window canvas to file f without waiting for the image to
+    be encoded and written: the pixels are copied now and written on a
+    background thread. If onDone is not None, onDone(error) is called
+    on that thread after the write, where error is None on success.
+    Return True if the save was queued, and False if it was dropped
+    because too many saves are already waiting to be written.
+    """
+    global _frameWriter
+    _makeSureWindowCreated()
+    if _frameWriter is None:
+        _frameWriter = FrameWriter()
+    return _frameWriter.submitSurface(f, _surface, onDone)
+
+def flushSaves():
+    """
+    Wait until all of the saves queued by saveAsync have been written.
+    """
+    if _frameWriter is not None:
+        _frameWriter.flush()
+
+#-----------------------------------------------------------------------
+
+# Functions for accessing the pixels of the background canvas.
+
+def frameArray(scale=1):
+    """
+    Return the pixels of the background canvas as a NumPy array of
+    shape (height, width, 3) with the red, green and blue components.
+    The array is a view of the canvas, not a copy: it changes when the
+    canvas is drawn on, and the canvas cannot be drawn on while the
+    array (or any view of it) exists. If scale is an integer larger
+    than 1, only every scale-th pixel in each direction is included,
+    which is still a view.
+    """
+    _makeSureWindowCreated()
+    # pixels3d indexes the pixels as [x][y], so swap the axes
+    pixels = pygame.surfarray.pixels3d(_surface).transpose(1, 0, 2)
+    if scale > 1:
+        pixels = pixels[::scale, ::scale]
+    return pixels
+
+def grayFrameArray(scale=1, out=None):
+    """
+    Return the pixels of the background canvas as a NumPy array of
+    shape (height, width) with the luma of each pixel (ITU-R BT.601
+    weights) as uint8. Unlike frameArray, the result is a new array
+    unless out is given, in which case the result is written into out
+    and out is returned. The luma is computed in scratch arrays that
+    are kept between calls, so with out no array is allocated per
+    frame. If scale is an integer larger than 1, only every scale-th
+    pixel in each direction is included.
+    """
+    global _grayScratch
+    import numpy
+    pixels = frameArray(scale)
+    shape = pixels.shape[:2]
+    if out is None:
+        out = numpy.empty(shape, dtype=numpy.uint8)
+    if _grayScratch is None or _grayScratch.shape[1:] != shape:
+        _grayScratch = numpy.empty((2,) + shape, dtype=numpy.uint16)
+    luma, term = _grayScratch
+    # integer arithmetic on 16 bits: 77 + 150 + 29 = 256
+    numpy.multiply(pixels[:, :, 0], 77, out=luma, dtype=numpy.uint16)
+    numpy.multiply(pixels[:, :, 1], 150, out=term, dtype=numpy.uint16)
+    luma += term
+    numpy.multiply(pixels[:, :, 2], 29, out=term, dtype=numpy.uint16)
+    luma += term
+    numpy.right_shift(luma, 8, out=out, casting='unsafe')
+    del pixels  # release the canvas
+    return out
+
+def setFrameCallback(callback=None):
+    """
+    Call callback(frame) each time the background canvas is shown by
+    show(), where frame is the view returned by frameArray(). The view
+    is valid only during the call: callback must copy (or encode) the
+    pixels it needs and must not keep a reference to the view, because
+    the canvas cannot be drawn on while the view exists. callback
+    defaults to None, which removes the current callback.
+    """
+    global _frameCallback
+    _frameCallback = callback
+
+def _callFrameCallback():
+    """
+    Call the frame callback, if any, with a view of the canvas.
+    """
+    if _frameCallback is not None:
+        frame = frameArray()
+        _frameCallback(frame)
+        del frame  # release the canvas so that drawing can continue
+
 #-----------------------------------------------------------------------
 
 def _show():
     """
     Copy the background canvas to the window canvas.
     """
+    if _offscreen:
+        return
     _background.blit(_surface, (0, 0))
     pygame.display.flip()
     _checkForEvents()
@@ -582,12 +702,19 @@ def show(msec=float('inf')):
     """
     Copy the background canvas to the window canvas, and
     then wait for msec milliseconds. msec defaults to infinity.
+    An offscreen canvas is not waited for.
     """
+    if _offscreen:
+        _makeSureWindowCreated()
+        _callFrameCallback()
+        return
+
     if msec == float('inf'):
         _showAndWaitForever()
 
     _makeSureWindowCreated()
     _show()
+    _callFrameCallback()
     _checkForEvents()
 
     # Sleep for the required time, but check for events every
@@ -637,13 +764,20 @@ def _saveToFile():
             'File name must end with ".jpg" or ".png".'])
         return
 
-    try:
-        save(fileName)
-        childProcess = subprocess.Popen(
-            [sys.executable, stddrawPath, 'confirmFileSave'])
-    except (pygame.error) as e:
+    # Report the result from the writer thread once the file is written.
+    def reportSave(error):
+        if error is None:
+            subprocess.Popen(
+                [sys.executable, stddrawPath, 'confirmFileSave'])
+        else:
+            subprocess.Popen(
+                [sys.executable, stddrawPath, 'reportFileSaveError',
+                str(error)])
+
+    if not saveAsync(fileName, reportSave):
         childProcess = subprocess.Popen(
-            [sys.executable, stddrawPath, 'reportFileSaveError', str(e)])
+            [sys.executable, stddrawPath, 'reportFileSaveError',
+            'Too many drawings are being saved. Try again later.'])
 
 def _checkForEvents():
     """
@@ -664,6 +798,10 @@ def _checkForEvents():
     
     _makeSureWindowCreated()
 
+    # There is no window to receive events from.
+    if _offscreen:
+        return
+
     for event in pygame.event.get():
         if event.type == pygame.QUIT:
             sys.exit()
@@ -777,6 +915,8 @@ def _getFileName():
     """
     Display a dialog box that asks the user for a file name.
     """
+    import tkinter as Tkinter
+    import tkinter.filedialog as tkFileDialog
     root = Tkinter.Tk()
     root.withdraw()
     reply = tkFileDialog.asksaveasfilename(initialdir='.')
@@ -788,6 +928,8 @@ def _confirmFileSave():
     """
     Display a dialog box that confirms a file save operation.
     """
+    import tkinter as Tkinter
+    import tkinter.messagebox as tkMessageBox
     root = Tkinter.Tk()
     root.withdraw()
     tkMessageBox.showinfo(title='File Save Confirmation',
@@ -799,6 +941,8 @@ def _reportFileSaveError(msg):
     Display a dialog box that reports a msg.  msg is a string which
     describes an error in a file save operation.
     """
+    import tkinter as Tkinter
+    import tkinter.messagebox as tkMessageBox
     root = Tkinter.Tk()
     root.withdraw()
     tkMessageBox.showerror(title='File Save Error', message=msg)
@@ -0,0 +1,90 @@
+import os  # the os module is used for file and directory operations
+import sys
+import atexit  # used for finishing the pending writes when the game exits
+import threading  # the files are written on a background thread
+
+
+# Writes the given bytes to the file at the given path atomically: the data is
+# written to a temporary file in the same folder, flushed to the disk and then
+# renamed over the file, so the file holds either the old or the new data even
+# if the game crashes (or the power goes out) in the middle of the write
+def write_atomic(path, data):
+   folder = os.path.dirname(path)
+   if folder:
+      os.makedirs(folder, exist_ok=True)
+   temp_path = path + ".tmp"
+   with open(temp_path, "wb") as temp_file:
+      temp_file.write(data)
+      temp_file.flush()
+      os.fsync(temp_file.fileno())
+   os.replace(temp_path, path)
+
+# A class for writing files on a background thread, so the game loop never
+# waits for the disk. Only the newest data of each file is kept: when a file is
+# written again before the previous data reached the disk, the previous data is
+# dropped, so writing often costs nothing more than storing a reference.
+class BackgroundWriter:
+   def __init__(self):
+      # path -> the newest data (None for removing the file) and the function
+      # called when it is written
+      self.pending = {}
+      self.busy = False  # whether the thread is writing a file at the moment
+      self.failed = 0  # the number of writes that failed
+      self.condition = threading.Condition()
+      self.thread = None  # started when the first file is written
+      # finish the pending writes when the program exits (e.g. when the
+      # window of the game is closed)
+      atexit.register(self.flush)
+
+   # Writes the given bytes to the file at the given path in the background
+   # and then calls on_done (when it is given) on the background thread with
+   # None or the OSError of the write (a write dropped for newer data of the
+   # same file is not reported)
+   def write(self, path, data, on_done=None):
+      with self.condition:
+         self.pending[path] = (data, on_done)
+         if self.thread is None:
+            self.thread = threading.Thread(target=self.work,
+                                           name="BackgroundWriter")
+            self.thread.daemon = True
+            self.thread.start()
+         self.condition.notify_all()
+
+   # Removes the file at the given path in the background (after any pending
+   # write of the same file is dropped)
+   def remove(self, path):
+      self.write(path, None)
+
+   # Waits until all of the pending writes are done
+   def flush(self):
+      with self.condition:
+         while self.pending or self.busy:
+            self.condition.wait()
+
+   # The loop of the background thread writing the pending files
+   def work(self):
+      while True:
+         with self.condition:
+            while not self.pending:
+               self.condition.wait()
+            path = next(iter(self.pending))
+            data, on_done = self.pending.pop(path)
+            self.busy = True
+         failure = None
+         try:
+            if data is not None:
+               write_atomic(path, data)
+            elif os.path.exists(path):
+               os.remove(path)
+         except OSError as error:
+            self.failed += 1
+            failure = error
+            print("Could not write %s: %s" % (path, error), file=sys.stderr)
+         if on_done is not None:
+            on_done(failure)
+         with self.condition:
+            self.busy = False
+            self.condition.notify_all()
+
+# the writer shared by all of the files of the game
+writer = BackgroundWriter()
@@ -0,0 +1,188 @@
+# Enumeration of the placements of a tetromino: every position where the
+# current tetromino can be locked on the game grid and the keys that bring it
+# there. The search is a breadth first search over the (rotation, x, y)
+# states of the tetromino with the rules of the game: each tick applies one
+# action (no action, left, right, down, rotate or hard drop, with the checks
+# of Tetromino.can_be_moved and Tetromino.can_be_rotated) and then the
+# automatic fall of game_tick, and the tetromino is locked where it cannot
+# fall anymore. The occupied cells of each row are kept as the bits of an
+# integer so the checks are a few bit operations, and the reachable states of
+# a board and a tetromino shape are memoized, as bots search the same boards
+# again and again.
+
+import functools
+from collections import deque, namedtuple
+import numpy as np
+
+# the actions of a tick (the keys of the game, None for no action)
+KEYS = (None, "left", "right", "down", "up", "space")
+# the number of searches whose reachable states are memoized
+MEMO_SIZE = 1 << 14
+
+# A placement: the rotation count and the position of the bottom left cell of
+# the tile matrix of the locked tetromino, the keys (one per tick) that lock
+# it there and its tiles as (row, column, exponent of the tile number) cells
+Placement = namedtuple("Placement", "rotate_count x y keys cells")
+
+
+# Returns the given tile matrix (a list of rows, row 0 at the top) rotated
+# clockwise as Tetromino.rotate rotates it
+def rotated(matrix):
+   n = len(matrix)
+   return tuple(tuple(matrix[n - 1 - col][row] for col in range(n))
+                for row in range(n))
+
+# Returns the cells of a tetromino shape (the occupied cells of its tile
+# matrix) needed for the checks of the game: the size of the matrix and the
+# (column, offset from the bottom row) of the tiles, of the leftmost and the
+# rightmost tile of each row and of the bottommost tile of each column
+def shape_cells(shape):
+   n = len(shape)
+   cells = [(col, n - 1 - row) for row in range(n) for col in range(n)
+            if shape[row][col]]
+   left, right, bottom = {}, {}, {}
+   for col, dy in cells:
+      left[dy] = min(left.get(dy, col), col)
+      right[dy] = max(right.get(dy, col), col)
+      bottom[col] = min(bottom.get(col, dy), dy)
+   return (n, tuple(cells), tuple((col, dy) for dy, col in left.items()),
+           tuple((col, dy) for dy, col in right.items()),
+           tuple(bottom.items()))
+
+# Returns the reachable placements of a tetromino with the given shape (a
+# tuple of rows of booleans) and position on a board with the given occupied
+# cells (a tuple of the bits of each row): (rotations, x, y, keys) tuples
+# where rotations is the number of clockwise rotations from the given shape
+@functools.lru_cache(maxsize=MEMO_SIZE)
+def reachable(rows, shape, x, y, grid_w):
+   grid_h = len(rows)
+   shapes = [shape]
+   for _ in range(3):
+      shapes.append(rotated(shapes[-1]))
+   cells = [shape_cells(s) for s in shapes]
+   # the rows above the game grid (where the tetrominoes enter) are empty
+   rows = rows + (0,) * (y + len(shape) + 1 - grid_h)
+
+   # the checks of Tetromino.can_be_moved: only the cells next to the
+   # leftmost, rightmost or bottommost tiles are checked
+   falls = {}  # whether the tetromino can move down from each state
+   def can_move_down(state):
+      result = falls.get(state)
+      if result is None:
+         k, x, y = state
+         result = True
+         for col, dy in cells[k][4]:
+            if y + dy == 0 or rows[y + dy - 1] >> (x + col) & 1:
+               result = False
+               break
+         falls[state] = result
+      return result
+
+   bottoms = {}  # where a hard drop from each state ends
+   def bottom(state):
+      path = []
+      while state not in bottoms and can_move_down(state):
+         path.append(state)
+         state = (state[0], state[1], state[2] - 1)
+      end = bottoms.get(state, state)
+      for state in path:
+         bottoms[state] = end
+      return end
+
+   start = (0, x, y)
+   parents = {start: None}  # the visited states and how they were reached
+   locks = {}  # the lock positions and how they were reached
+   queue = deque([start])
+   while queue:
+      state = queue.popleft()
+      k, x, y = state
+      n, tiles, left, right, below = cells[k]
+      # the states after the action of the tick (the first key reaching each
+      # of them, with no action first)
+      moved = {state: None}
+      for col, dy in left:
+         if x + col == 0 or rows[y + dy] >> (x + col - 1) & 1:
+            break
+      else:
+         moved[(k, x - 1, y)] = "left"
+      for col, dy in right:
+         if x + col == grid_w - 1 or rows[y + dy] >> (x + col + 1) & 1:
+            break
+      else:
+         moved[(k, x + 1, y)] = "right"
+      if can_move_down(state):
+         moved[(k, x, y - 1)] = "down"
+         moved.setdefault(bottom(state), "space")
+      # every cell of the tile matrix must be inside the game grid (or above
+      # it) and empty for a rotation (as in Tetromino.can_be_rotated)
+      if x >= 0 and x + n <= grid_w and y >= 0:
+         mask = ((1 << n) - 1) << x
+         for row in range(y, y + n):
+            if rows[row] & mask:
+               break
+         else:
+            moved[((k + 1) % 4, x, y)] = "up"
+      for after, key in moved.items():
+         # the automatic fall of the tick
+         if can_move_down(after):
+            following = (after[0], after[1], after[2] - 1)
+            if following not in parents:
+               parents[following] = (state, key)
+               queue.append(following)
+         elif after not in locks:
+            locks[after] = (state, key)
+
+   placements = []
+   for (k, x, y), (state, key) in locks.items():
+      keys = [key]
+      while parents[state] is not None:
+         state, key = parents[state]
+         keys.append(key)
+      placements.append((k, x, y, tuple(reversed(keys))))
+   return tuple(placements)
+
+# Returns the occupied cells of the given board (an (h, w) array of tile
+# exponents or numbers, 0 for empty cells, row 0 at the bottom) as a tuple of
+# the bits of each row
+def occupied_rows(board):
+   weights = 1 << np.arange(board.shape[1])
+   return tuple(((board != 0) @ weights).tolist())
+
+# Returns the distinct placements of a tetromino on the given board (see
+# occupied_rows). The tetromino is given by its tile matrix (exponents of the
+# tile numbers, 0 for empty cells, row 0 at the top), its rotation count and
+# the position of the bottom left cell of the matrix. Placements that lock
+# the same tiles on the same cells are the same (e.g. the rotations of a
+# symmetric shape with equal tiles), and only the one reached with the
+# fewest ticks is returned.
+def find_placements(board, matrix, rotate_count, x, y):
+   matrix = tuple(tuple(int(e) for e in row) for row in matrix)
+   shape = tuple(tuple(e != 0 for e in row) for row in matrix)
+   matrices = [matrix]
+   for _ in range(3):
+      matrices.append(rotated(matrices[-1]))
+   n = len(matrix)
+   placements, seen = [], set()
+   for k, px, py, keys in reachable(occupied_rows(board), shape, x, y,
+                                    board.shape[1]):
+      cells = tuple((py + n - 1 - row, px + col, e)
+                    for row, cells in enumerate(matrices[k])
+                    for col, e in enumerate(cells) if e)
+      key = frozenset(cells)
+      if key not in seen:
+         seen.add(key)
+         placements.append(Placement((rotate_count + k) % 4, px, py, keys,
+                                     cells))
+   return placements
+
+# Returns the distinct placements of the current tetromino of the given game
+# grid (see find_placements)
+def enumerate_placements(grid):
+   tetromino = grid.current_tetromino
+   board = np.frombuffer(grid.tile_exponents(), np.uint8).reshape(
+      grid.grid_height, grid.grid_width)
+   matrix = [[0 if tile is None else tile.number.bit_length() - 1
+              for tile in row] for row in tetromino.tile_matrix]
+   return find_placements(board, matrix, tetromino.rotate_count,
+                          tetromino.bottom_left_cell.x,
+                          tetromino.bottom_left_cell.y)
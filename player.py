@@ -1,85 +1,52 @@
-import os
+from settings import store  # the settings shared by all players
 
-class Player:
 
-    difficulty = 0 # 0 represents easy, 1 represents normal, 2 represents hard
-    high_score = 0
-    volume = 50
-    music_on = True
-    save_list = []
+# A class for the settings and the high score of the player. The values are
+# kept in the settings store (see settings.py), which loads the settings file
+# once per process, so creating a Player (e.g. for each new game) is cheap and
+# all players see the same values.
+class Player:
 
     def __init__(self):
-        # get the directory in which this python code file is placed
-        current_dir = os.path.dirname(os.path.realpath(__file__))
-        # compute the path of the image file
-        save_file_location = current_dir + "/save/save.save"
-        # Import values from save file to list
-        save_file = open(save_file_location, "r")
-        self.save_list = save_file.readlines()
-        save_file.close()
-        # Importing difficulty
-        if (int(self.save_list[0]) == 1):
-            self.difficulty = 1
-        elif (int(self.save_list[0]) == 2):
-            self.difficulty = 2
-        # Importing high score
-        self.high_score = int(self.save_list[1])
-        # Importing music volume
-        self.volume = int(self.save_list[2])
-        # Importing music on-off setting
-        # 0 represents false, 1 represents True
-        if (int(self.save_list[3]) == 0):
-            self.music_on = False
+        self.settings = store.load()
 
     def getDiff(self):
-        return self.difficulty
+        return self.settings.get("difficulty")
 
     def setDiff(self, number):
-        self.difficulty = number
+        self.settings.set("difficulty", number)
 
     def getHighScore(self):
-        return self.high_score
+        return self.settings.get("high_score")
 
     def setHighScore(self, number):
-        self.high_score = number
+        self.settings.set("high_score", number)
 
     def getVolume(self):
-        return self.volume
+        return self.settings.get("volume")
 
     def setVolume(self, number):
         if (number >= 0 and number <= 100):
-            self.volume = number
+            self.settings.set("volume", number)
 
     def increaseVolume(self, number=1):
-        if (self.volume + number <= 100):
-            self.volume += number
+        if (self.getVolume() + number <= 100):
+            self.settings.set("volume", self.getVolume() + number)
 
     def decreaseVolume(self, number=1):
-        if (self.volume - number >= 0):
-            self.volume -= number
+        if (self.getVolume() - number >= 0):
+            self.settings.set("volume", self.getVolume() - number)
 
     def getMusicCondition(self):
-        return self.music_on
+        return self.settings.get("music_on")
 
     def turnMusicOn(self):
-        self.music_on = True
+        self.settings.set("music_on", True)
 
     def turnMusicOff(self):
-        self.music_on = False
+        self.settings.set("music_on", False)
 
-    # Writes changed settings into the file
+    # Writes the changed settings into the settings file (atomically and in
+    # the background; nothing is written when nothing has changed)
     def updateOnClose(self):
-        # get the directory in which this python code file is placed
-        current_dir = os.path.dirname(os.path.realpath(__file__))
-        # compute the path of the image file
-        save_file_location = current_dir + "/save/save.save"
-        # Import values to save file from Player object
-        save_file = open(save_file_location, "w")
-        save_file.write(str(self.difficulty) + "\n")
-        save_file.write(str(self.high_score) + "\n")
-        save_file.write(str(self.volume) + "\n")
-        if (self.music_on):
-            save_file.write("1")
-        else:
-            save_file.write("0")
-        save_file.close()
+        self.settings.save()
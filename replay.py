@@ -0,0 +1,298 @@
+################################################################################
+#                                                                              #
+# Recording and playback of Tetris 2048 games                                  #
+#                                                                              #
+# Usage: python replay.py verify FILE...       (re-simulate without display)   #
+#        python replay.py play FILE [--rate 2] (show the game on the screen)   #
+#        python replay.py seek FILE TICK       (restore the game at a tick)    #
+#                                                                              #
+################################################################################
+
+# A replay file stores the seed of the game session and the actions taken in
+# the main game loop, so the game is recreated by playing the same actions
+# with the same seed. The file format (all integers are little endian):
+#   magic     4 bytes "T2RP"
+#   header    version (u8), seed (u64), grid height (u8), grid width (u8),
+#             difficulty (u8), keyframe interval (u8, version 2 only)
+#   records   one unsigned LEB128 varint per action: (tick delta << 3) | code,
+#             where the tick delta is the number of ticks (iterations of the
+#             main game loop) since the previous record and code is the action
+#   keyframes a record with code 6 every keyframe interval locks, followed by
+#             the length of the keyframe as a varint and the keyframe: the
+#             zlib compressed state of the game before its tick (see
+#             encode_keyframe), so seeking does not start from tick zero
+#   end       a record with code 0 at the tick the game ended, followed by the
+#             final score as a varint (used for verifying the replay)
+
+import os  # the os module is used for file and directory operations
+import sys
+import time
+import zlib
+import struct
+import argparse
+import bisect
+from game_grid import GameGrid  # the class for modeling the game grid
+from tetromino import Tetromino  # the class for modeling the tetrominoes
+import Tetris_2048 as game  # the game rules (create_tetromino, game_tick, ...)
+
+MAGIC = b"T2RP"
+VERSION = 2
+HEADERS = {1: struct.Struct("<BQBBB"), 2: struct.Struct("<BQBBBB")}
+# action codes stored in the records (0 marks the end of the game)
+END = 0
+KEYFRAME = 6
+ACTION_CODES = {"left": 1, "right": 2, "down": 3, "up": 4, "r": 4, "space": 5}
+CODE_ACTIONS = {1: "left", 2: "right", 3: "down", 4: "up", 5: "space"}
+# a keyframe is stored every KEYFRAME_INTERVAL locks by default
+KEYFRAME_INTERVAL = 10
+# a keyframe is the tick (u32) followed by the snapshot of the game grid (see
+# GameGrid.snapshot), compressed with zlib
+KEYFRAME_TICK = struct.Struct("<I")
+# pause durations (ms) of the main game loop for each difficulty level
+TICK_MS = {0: 250, 1: 200, 2: 125}
+
+
+# Appends the unsigned LEB128 encoding of the given value to the buffer
+def write_varint(buffer, value):
+   while value >= 0x80:
+      buffer.append((value & 0x7F) | 0x80)
+      value >>= 7
+   buffer.append(value)
+
+# Reads an unsigned LEB128 value from the data at the given offset and returns
+# the value and the offset after it
+def read_varint(data, offset):
+   value, shift = 0, 0
+   while True:
+      byte = data[offset]
+      offset += 1
+      value |= (byte & 0x7F) << shift
+      if byte < 0x80:
+         return value, offset
+      shift += 7
+
+# Encodes the state of the game before the given tick as a keyframe
+def encode_keyframe(grid, tick):
+   return zlib.compress(KEYFRAME_TICK.pack(tick) + grid.snapshot())
+
+# Restores the state stored in the given keyframe on the given game grid (of
+# the same session) and returns the tick of the keyframe
+def decode_keyframe(data, grid):
+   data = zlib.decompress(data)
+   grid.restore(data[KEYFRAME_TICK.size:])
+   return KEYFRAME_TICK.unpack_from(data, 0)[0]
+
+# A class for recording the actions of a game session as a replay; a keyframe
+# is stored every keyframe_interval locks (0 for no keyframes), trading the
+# size of the file for the time needed for seeking
+class ReplayRecorder:
+   def __init__(self, seed, grid_h, grid_w, difficulty=0,
+                keyframe_interval=KEYFRAME_INTERVAL):
+      self.buffer = bytearray(MAGIC)
+      self.buffer += HEADERS[VERSION].pack(VERSION, seed, grid_h, grid_w,
+                                           difficulty, keyframe_interval)
+      self.keyframe_interval = keyframe_interval
+      self.locks = 0
+      self.last_tick = 0
+      self.finished = False
+
+   # Records the action (key name) taken at the given tick; keys that do not
+   # change the game are not recorded
+   def record(self, tick, key_typed):
+      code = ACTION_CODES.get(key_typed)
+      if code is None:
+         return
+      write_varint(self.buffer, ((tick - self.last_tick) << 3) | code)
+      self.last_tick = tick
+
+   # Records that a tetromino has been locked on the given game grid, which is
+   # now at the given tick, and stores a keyframe when it is time for one
+   def record_lock(self, tick, grid):
+      self.locks += 1
+      if self.keyframe_interval and self.locks % self.keyframe_interval == 0:
+         keyframe = encode_keyframe(grid, tick)
+         write_varint(self.buffer, ((tick - self.last_tick) << 3) | KEYFRAME)
+         write_varint(self.buffer, len(keyframe))
+         self.buffer += keyframe
+         self.last_tick = tick
+
+   # Returns the state of this recorder (the recorded bytes, the tick of the
+   # last record and the number of locks), e.g. for saving an unfinished game
+   def get_state(self):
+      return bytes(self.buffer), self.last_tick, self.locks
+
+   # Creates a recorder that continues recording from the given state (see
+   # get_state), e.g. when a saved game is resumed
+   @staticmethod
+   def from_state(data, last_tick, locks):
+      recorder = ReplayRecorder.__new__(ReplayRecorder)
+      recorder.buffer = bytearray(data)
+      recorder.keyframe_interval = HEADERS[VERSION].unpack_from(data, 4)[5]
+      recorder.locks = locks
+      recorder.last_tick = last_tick
+      recorder.finished = False
+      return recorder
+
+   # Records the end of the game at the given tick with the final score and
+   # returns the bytes of the replay
+   def finish(self, tick, score):
+      if not self.finished:
+         write_varint(self.buffer, ((tick - self.last_tick) << 3) | END)
+         write_varint(self.buffer, score)
+         self.finished = True
+      return bytes(self.buffer)
+
+   # Writes the finished replay to the given file
+   def save(self, path):
+      with open(path, "wb") as replay_file:
+         replay_file.write(bytes(self.buffer))
+
+# A class for loading and playing back a recorded game
+class Replay:
+   def __init__(self, data):
+      if data[:4] != MAGIC:
+         raise ValueError("not a Tetris 2048 replay")
+      version = data[4]
+      if version not in HEADERS:
+         raise ValueError("unsupported replay version %d" % version)
+      header = HEADERS[version].unpack_from(data, 4)
+      self.seed, self.grid_height, self.grid_width, self.difficulty = header[1:5]
+      self.keyframe_interval = header[5] if version >= 2 else 0
+      # decode the records into a tick -> action dictionary and the lists of
+      # the keyframe ticks and keyframes (sorted by tick)
+      self.actions = {}
+      self.keyframe_ticks, self.keyframes = [], []
+      self.end_tick, self.final_score = None, None
+      offset, tick = 4 + HEADERS[version].size, 0
+      while offset < len(data):
+         value, offset = read_varint(data, offset)
+         tick += value >> 3
+         code = value & 7
+         if code == END:
+            self.end_tick = tick
+            self.final_score, offset = read_varint(data, offset)
+            break
+         if code == KEYFRAME:
+            length, offset = read_varint(data, offset)
+            self.keyframe_ticks.append(tick)
+            self.keyframes.append(data[offset:offset + length])
+            offset += length
+            continue
+         self.actions[tick] = CODE_ACTIONS[code]
+
+   # Loads the replay stored in the given file
+   @staticmethod
+   def load(path):
+      with open(path, "rb") as replay_file:
+         return Replay(replay_file.read())
+
+   # Creates the game grid of the recorded game session before its first tick
+   def new_game(self):
+      Tetromino.grid_height = self.grid_height
+      Tetromino.grid_width = self.grid_width
+      grid = GameGrid(self.grid_height, self.grid_width, self.seed)
+      grid.current_tetromino = game.create_tetromino(grid.rng)
+      grid.next_tetromino = game.create_tetromino(grid.rng)
+      return grid
+
+   # Plays the game again without drawing it and returns the final game grid
+   # and the number of ticks played; on_tick(grid, tick) is called after each
+   # tick when it is given. The game is played from the start, or from the
+   # given game grid at the given tick (e.g. restored from a keyframe), and
+   # until the given tick or the end of the game.
+   def simulate(self, on_tick=None, grid=None, tick=0, until=None):
+      if grid is None:
+         grid, tick = self.new_game(), 0
+      actions = self.actions
+      # recordings without an end (e.g. cut off) run until the game is over
+      end_tick = self.end_tick if self.end_tick is not None else float("inf")
+      if until is not None:
+         end_tick = min(end_tick, until)
+      while tick < end_tick:
+         game_over = game.game_tick(grid, actions.get(tick))
+         tick += 1
+         if on_tick is not None:
+            on_tick(grid, tick)
+         if game_over:
+            break
+      return grid, tick
+
+   # Returns the game grid of the recorded game before the given tick: the
+   # state is restored from the last keyframe before the tick and the game is
+   # simulated from there
+   def seek(self, tick):
+      grid, start = self.new_game(), 0
+      index = bisect.bisect_right(self.keyframe_ticks, tick) - 1
+      if index >= 0:
+         start = decode_keyframe(self.keyframes[index], grid)
+      grid, tick = self.simulate(grid=grid, tick=start, until=tick)
+      return grid
+
+   # Re-simulates the game and returns True if it ends with the recorded score
+   def verify(self):
+      grid, tick = self.simulate()
+      return grid.score == self.final_score and tick == self.end_tick
+
+   # Shows the game on the drawing canvas at the given playback rate (2 is
+   # twice as fast as the original game); the canvas must already be set up
+   def play(self, rate=1.0):
+      import lib.stddraw as stddraw  # only needed for drawing
+      pause = TICK_MS.get(self.difficulty, 250) / rate
+      def show(grid, tick):
+         grid.draw()
+         stddraw.show(pause)
+      return self.simulate(show)
+
+# Returns the path of a new replay file for a game with the given seed in the
+# replay folder of the game, creating the folder if necessary
+def new_replay_path(seed):
+   current_dir = os.path.dirname(os.path.realpath(__file__))
+   replay_dir = current_dir + "/save/replays"
+   os.makedirs(replay_dir, exist_ok=True)
+   file_name = time.strftime("%Y%m%d-%H%M%S") + "-%016x.t2r" % seed
+   return replay_dir + "/" + file_name
+
+def main(argv=None):
+   parser = argparse.ArgumentParser(description="Tetris 2048 replays")
+   parser.add_argument("command", choices=["verify", "play", "seek"])
+   parser.add_argument("files", nargs="+",
+                       help="replay files (the seek command takes FILE TICK)")
+   parser.add_argument("--rate", type=float, default=1.0,
+                       help="playback rate of the play command")
+   args = parser.parse_args(argv)
+
+   if args.command == "play":
+      import lib.stddraw as stddraw
+      replay = Replay.load(args.files[0])
+      extra_w = 6
+      grid_h, grid_w = replay.grid_height, replay.grid_width
+      stddraw.setCanvasSize(40 * (grid_w + extra_w), 40 * grid_h)
+      stddraw.setXscale(-0.5, (grid_w + extra_w) - 0.5)
+      stddraw.setYscale(-0.5, grid_h - 0.5)
+      grid, ticks = replay.play(args.rate)
+      print("score: %d" % grid.score)
+      return 0
+
+   if args.command == "seek":
+      replay = Replay.load(args.files[0])
+      tick = int(args.files[1])
+      start = time.perf_counter()
+      grid = replay.seek(tick)
+      elapsed = time.perf_counter() - start
+      print("tick %d: score=%d  %.1f ms" % (tick, grid.score, elapsed * 1000))
+      return 0
+
+   failures = 0
+   for path in args.files:
+      replay = Replay.load(path)
+      start = time.perf_counter()
+      ok = replay.verify()
+      elapsed = time.perf_counter() - start
+      print("%s  %s  score=%s ticks=%s  %.1f ms" % (
+         "OK  " if ok else "FAIL", path, replay.final_score, replay.end_tick,
+         elapsed * 1000))
+      failures += not ok
+   return 1 if failures else 0
+
+if __name__ == '__main__':
+   sys.exit(main())
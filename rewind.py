@@ -0,0 +1,58 @@
+import zlib  # used for compressing the differences between the snapshots
+from collections import deque  # a double-ended queue with a maximum length
+
+# the number of locks that can be rewound by default
+REWIND_CAPACITY = 1000
+# the key that rewinds the game by one lock in practice mode
+REWIND_KEY = "backspace"
+
+
+# Returns the bytewise XOR of two snapshots of the same length
+def xor_bytes(a, b):
+   value = int.from_bytes(a, "little") ^ int.from_bytes(b, "little")
+   return value.to_bytes(len(a), "little")
+
+# A fixed-size ring buffer of game snapshots (see GameGrid.snapshot) taken at
+# each lock, used for stepping back through the recent locks in practice mode.
+# Only the newest snapshot is stored in full; each older snapshot is stored as
+# the compressed XOR with the snapshot after it, which is mostly zeros as
+# consecutive locks change only a few cells. Stepping back undoes one
+# difference, so it takes the same (short) time however long the game is, and
+# the oldest snapshots are dropped when the buffer is full, so the memory used
+# stays bounded.
+class RewindBuffer:
+   # A constructor for creating an empty buffer holding at most the given
+   # number of snapshots
+   def __init__(self, capacity=REWIND_CAPACITY):
+      self.latest = None  # the newest snapshot
+      # the differences of the older snapshots (the oldest first)
+      self.deltas = deque(maxlen=max(capacity - 1, 0))
+
+   # Returns the number of snapshots in the buffer
+   def __len__(self):
+      return 0 if self.latest is None else len(self.deltas) + 1
+
+   # Returns the number of bytes used by the stored snapshots
+   def nbytes(self):
+      if self.latest is None:
+         return 0
+      return len(self.latest) + sum(len(delta) for delta in self.deltas)
+
+   # Adds the given snapshot as the newest one
+   def push(self, snapshot):
+      if self.latest is not None and self.deltas.maxlen:
+         self.deltas.append(zlib.compress(xor_bytes(self.latest, snapshot), 1))
+      self.latest = snapshot
+
+   # Drops the newest snapshot and returns the one before it, which becomes the
+   # newest; the oldest snapshot stays in the buffer and is returned again when
+   # there is nothing older (None when the buffer is empty)
+   def step_back(self):
+      if self.deltas:
+         self.latest = xor_bytes(self.latest, zlib.decompress(self.deltas.pop()))
+      return self.latest
+
+   # Removes all of the snapshots
+   def clear(self):
+      self.latest = None
+      self.deltas.clear()
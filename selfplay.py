@@ -0,0 +1,138 @@
+################################################################################
+#                                                                              #
+# Self-play: many headless games of an autoplayer run on all the CPU cores     #
+#                                                                              #
+# Usage: python selfplay.py [--games 100] [--workers N] [--seed 0]             #
+#                           [--search greedy] [--budget 50] [--depth 3]        #
+#                           [--max-locks 1000] [--weight holes=-4 ...]         #
+#        (prints each game as it finishes and the statistics of all games)     #
+#                                                                              #
+################################################################################
+
+# Game i is played with the seed base seed + i, whichever worker process plays
+# it and whenever it finishes, so a run gives the same games as any other run
+# with the same options and seeds (the decisions are deterministic when the
+# time budget of the moves does not run out, e.g. with --budget 0 for no
+# limit). Each worker process creates its autoplayer once, so the memoized
+# placements (see placements.py) and the transposition table of expectimax
+# are reused by the games of the worker, and only the seeds and the compact
+# results of the games are sent between the processes.
+
+import os
+import sys
+import time
+import argparse
+import statistics
+from collections import Counter, namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import autoplayer
+
+# The result of a game: its index and seed, the final score, the largest tile
+# number reached, the number of locked tetrominoes, whether the game is over (or was
+# stopped after max_locks locks) and its length in seconds
+GameResult = namedtuple("GameResult",
+                        "index seed score max_tile locks game_over seconds")
+
+# the autoplayer and the lock limit of the games of this worker process
+worker = {}
+
+
+# Returns the seed of the game with the given index
+def game_seed(base_seed, index):
+   return base_seed + index
+
+# Creates the autoplayer of this worker process (a budget of 0 is no limit)
+def init_worker(search, weights, budget, depth, max_locks):
+   worker["options"] = (search, budget if budget > 0 else float("inf"), depth)
+   worker["player"] = autoplayer.new_player(search, weights,
+                                            worker["options"][1], depth)
+   worker["max_locks"] = max_locks
+
+# Plays the game with the given index and seed with the autoplayer of this
+# worker process (with the given weights of the heuristic when they are
+# given) and returns its GameResult
+def play_seed(index, seed, weights=None):
+   if weights is not None and weights != worker["player"].weights:
+      # a new autoplayer, as the values of expectimax depend on the weights
+      search, budget, depth = worker["options"]
+      worker["player"] = autoplayer.new_player(search, weights, budget, depth)
+   start = time.perf_counter()
+   grid, locks, max_tile = autoplayer.play_game(
+      worker["player"], seed, max_locks=worker["max_locks"])
+   return GameResult(index, seed, grid.score, max_tile, locks, grid.game_over,
+                     time.perf_counter() - start)
+
+# Plays the games with the given (index, seed) pairs one after the other with
+# the same autoplayer of this worker process (see play_seed) and returns
+# their GameResults, so a chunk of games only sends its weights once
+def play_seeds(games, weights=None):
+   return [play_seed(index, seed, weights) for index, seed in games]
+
+# Plays the games with the given indexes in the given number of worker
+# processes (see init_worker for the options of the players) and yields their
+# GameResults as they finish
+def play_games(indexes, base_seed, workers=None, search="greedy", weights=None,
+               budget=autoplayer.BUDGET_SECONDS, depth=None,
+               max_locks=autoplayer.MAX_LOCKS):
+   with ProcessPoolExecutor(workers, initializer=init_worker,
+                            initargs=(search, weights, budget, depth,
+                                      max_locks)) as executor:
+      futures = [executor.submit(play_seed, index, game_seed(base_seed, index))
+                 for index in indexes]
+      for future in as_completed(futures):
+         yield future.result()
+
+# Returns the statistics of the given GameResults as a dictionary (the means
+# and the median are 0 when there are no results)
+def summarize(results, elapsed):
+   scores = [result.score for result in results]
+   locks = [result.locks for result in results]
+   return {"games": len(results),
+           "mean_score": statistics.mean(scores) if scores else 0,
+           "median_score": statistics.median(scores) if scores else 0,
+           "mean_locks": statistics.mean(locks) if locks else 0,
+           "game_overs": sum(result.game_over for result in results),
+           "max_tiles": dict(sorted(Counter(
+              result.max_tile for result in results).items())),
+           "games_per_second": len(results) / elapsed if elapsed else 0}
+
+def main(argv=None):
+   parser = argparse.ArgumentParser(description="Tetris 2048 self-play")
+   parser.add_argument("--games", type=int, default=100)
+   parser.add_argument("--workers", type=int, default=os.cpu_count())
+   parser.add_argument("--seed", type=int, default=0)
+   parser.add_argument("--search", choices=["greedy", "expectimax"],
+                       default="greedy")
+   parser.add_argument("--budget", type=float,
+                       default=autoplayer.BUDGET_SECONDS * 1000,
+                       help="time budget of a move in milliseconds (0 for no "
+                            "limit)")
+   parser.add_argument("--depth", type=int, help="maximum depth of expectimax")
+   parser.add_argument("--max-locks", type=int, default=autoplayer.MAX_LOCKS,
+                       help="stop the games after N locks (0 for no limit)")
+   parser.add_argument("--weight", action="append", default=[],
+                       help="a weight of the heuristic as NAME=VALUE")
+   args = parser.parse_args(argv)
+
+   start = time.perf_counter()
+   results = []
+   for result in play_games(range(args.games), args.seed, args.workers,
+                            args.search, autoplayer.parse_weights(args.weight),
+                            args.budget / 1000, args.depth,
+                            args.max_locks or None):
+      results.append(result)
+      print("game %d (seed %d): score %d, max tile %d, %d locks%s, %.1f s" % (
+         result.index, result.seed, result.score, result.max_tile,
+         result.locks, "" if result.game_over else " (stopped)",
+         result.seconds), flush=True)
+   stats = summarize(results, time.perf_counter() - start)
+   print("%d games, %d over: mean score %.1f, median %.1f, mean %.1f locks, "
+         "%.2f games/s" % (stats["games"], stats["game_overs"],
+                           stats["mean_score"], stats["median_score"],
+                           stats["mean_locks"], stats["games_per_second"]))
+   print("max tiles: " + ", ".join("%d: %d" % item
+                                   for item in stats["max_tiles"].items()))
+   return 0
+
+if __name__ == '__main__':
+   sys.exit(main())
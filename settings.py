@@ -0,0 +1,106 @@
+import os  # the os module is used for file and directory operations
+import json  # the settings are stored as JSON
+from persistence import writer  # writes the files in the background
+
+# the version of the layout of the settings file, stored in the file so that
+# files written by older versions of the game are migrated when loaded
+SCHEMA_VERSION = 1
+# the difficulty levels of the game and their names
+DIFFICULTIES = {0: "Easy", 1: "Normal", 2: "Hard"}
+# the settings and their default values (used for the missing settings)
+DEFAULTS = {
+   "difficulty": 0,  # 0 represents easy, 1 represents normal, 2 represents hard
+   "high_score": 0,
+   "volume": 50,
+   "music_on": True,
+}
+
+
+# Returns the settings stored in the line-oriented format of the older
+# versions of the game (version 0): difficulty, high score, music volume and
+# music on-off setting (1 for on) on separate lines
+def parse_lines(text):
+   lines = text.split()
+   return {"difficulty": int(lines[0]), "high_score": int(lines[1]),
+           "volume": int(lines[2]), "music_on": int(lines[3]) != 0}
+
+# Returns the settings stored in the given text of a settings file of any
+# version (with the default values for the missing or invalid settings) and
+# the version of the file
+def parse(text):
+   if text.lstrip().startswith("{"):
+      document = json.loads(text)
+      version = document.get("version", 0)
+      if version > SCHEMA_VERSION:
+         raise ValueError("settings file of a newer version of the game")
+      stored = document.get("settings", {})
+   else:
+      version, stored = 0, parse_lines(text)
+   values = dict(DEFAULTS)
+   for key, default in DEFAULTS.items():
+      # keep only the settings with the same type as their defaults
+      if type(stored.get(key)) is type(default):
+         values[key] = stored[key]
+   # and only the difficulty levels of the game, with the volume in 0..100
+   if values["difficulty"] not in DIFFICULTIES:
+      values["difficulty"] = DEFAULTS["difficulty"]
+   values["volume"] = min(max(values["volume"], 0), 100)
+   return values, version
+
+# A class for the settings of the game (difficulty, high score and music),
+# which are loaded from the settings file once per process and shared by all
+# Player objects. The file is written only when a setting has changed since
+# the last write, atomically and in the background (see persistence.py), so a
+# crash in the middle of a write cannot corrupt the high score.
+class SettingsStore:
+   def __init__(self, path):
+      self.path = path
+      self.values = None  # loaded when a setting is first used
+      self.saved = None  # the settings as they are in the file
+
+   # Loads the settings from the file when they are not loaded yet
+   def load(self):
+      if self.values is None:
+         try:
+            with open(self.path) as settings_file:
+               self.values, version = parse(settings_file.read())
+            # files of older versions are rewritten in the current format
+            if version == SCHEMA_VERSION:
+               self.saved = dict(self.values)
+         except (OSError, ValueError, IndexError):
+            # missing or unreadable settings file
+            self.values = dict(DEFAULTS)
+      return self
+
+   # Returns the value of the given setting
+   def get(self, key):
+      return self.load().values[key]
+
+   # Changes the value of the given setting (save writes it to the file)
+   def set(self, key, value):
+      self.load().values[key] = value
+
+   # Writes the settings to the file in the background if they have changed
+   # since they were last written
+   def save(self):
+      if self.values is None or self.values == self.saved:
+         return
+      document = {"version": SCHEMA_VERSION, "settings": self.values}
+      data = json.dumps(document, indent=2, sort_keys=True) + "\n"
+      values = dict(self.values)
+
+      # the settings are only marked as saved once they are on the disk, so
+      # a failed write is retried by the next save
+      def written(error):
+         if error is None:
+            self.saved = values
+
+      writer.write(self.path, data.encode("utf-8"), written)
+
+# Returns the path of the settings file in the save folder of the game
+def settings_path():
+   current_dir = os.path.dirname(os.path.realpath(__file__))
+   return current_dir + "/save/save.save"
+
+# the settings store shared by the whole game
+store = SettingsStore(settings_path())
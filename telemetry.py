@@ -0,0 +1,200 @@
+################################################################################
+#                                                                              #
+# Gameplay telemetry: an append-only event log written by the game and a       #
+# streaming analyzer for it                                                    #
+#                                                                              #
+# Usage: python telemetry.py analyze FILE... [--json]  (FILE may be .gz)       #
+#                                                                              #
+################################################################################
+
+# The log has one JSON object per line (JSONL), with the event type in "e"
+# and the tick of the game in "t":
+#   session  a game session starts: seed (hex), difficulty, practice, time
+#   spawn    a tetromino enters the game grid: type
+#   lock     a tetromino is locked: type, score after the lock cascade
+#   merge    two tiles are merged: value of the merged tile
+#   clear    a full row is cleared
+#   frame    an iteration of the main game loop: logic_us (time of the game
+#            rules) and frame_us (time of the whole iteration with drawing and
+#            the pause of the difficulty level)
+#   end      the game is over: score
+# The events are buffered in memory and appended to the file in batches, so
+# the game loop does not wait for a write at every event.
+
+import os  # the os module is used for file and directory operations
+import sys
+import gzip
+import atexit  # used for writing the buffered events when the game exits
+import json
+import math
+import time
+import argparse
+
+# the number of buffered events that are written to the file at once
+BATCH_SIZE = 256
+# relative width of the buckets of the histograms used for the percentiles
+BUCKET_RATIO = 1.02
+
+
+# Returns the path of the telemetry log in the save folder of the game
+def telemetry_path():
+   current_dir = os.path.dirname(os.path.realpath(__file__))
+   return current_dir + "/save/telemetry.jsonl"
+
+# A class for writing the telemetry events of the game to the log file
+class TelemetryLog:
+   def __init__(self, path=None, batch_size=BATCH_SIZE):
+      self.path = path or telemetry_path()
+      self.batch_size = batch_size
+      self.buffer = []  # the encoded events waiting to be written
+      self.tick = 0  # the tick of the events (set by the main game loop)
+
+   # Buffers an event of the given type with the given fields
+   def event(self, event_type, **fields):
+      fields["e"] = event_type
+      fields["t"] = self.tick
+      self.buffer.append(json.dumps(fields, separators=(",", ":")))
+      if len(self.buffer) >= self.batch_size:
+         self.flush()
+
+   def session(self, seed, difficulty, practice=False):
+      self.event("session", seed="%016x" % seed, difficulty=difficulty,
+                 practice=practice, time=round(time.time(), 3))
+
+   def spawn(self, tetromino):
+      self.event("spawn", type=tetromino.type)
+
+   def lock(self, tetromino, score):
+      self.event("lock", type=tetromino.type, score=score)
+
+   def merge(self, value):
+      self.event("merge", value=value)
+
+   def clear(self):
+      self.event("clear")
+
+   def frame(self, logic_seconds, frame_seconds):
+      self.event("frame", logic_us=int(logic_seconds * 1e6),
+                 frame_us=int(frame_seconds * 1e6))
+
+   def end(self, score):
+      self.event("end", score=score)
+      self.flush()
+
+   # Appends the buffered events to the log file
+   def flush(self):
+      if not self.buffer:
+         return
+      folder = os.path.dirname(self.path)
+      if folder:
+         os.makedirs(folder, exist_ok=True)
+      try:
+         with open(self.path, "a") as log_file:
+            log_file.write("\n".join(self.buffer) + "\n")
+      except OSError as error:
+         print("Could not write the telemetry: %s" % error, file=sys.stderr)
+      self.buffer = []
+
+# the telemetry log shared by the game sessions
+telemetry_log = TelemetryLog()
+atexit.register(telemetry_log.flush)
+
+# A histogram with logarithmic buckets for approximate percentiles of a stream
+# of positive values in constant memory (the error is below BUCKET_RATIO)
+class Histogram:
+   def __init__(self):
+      self.buckets = {}
+      self.count = 0
+
+   def add(self, value):
+      bucket = int(math.log(max(value, 1)) / math.log(BUCKET_RATIO))
+      self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+      self.count += 1
+
+   # Returns the value below which the given percent of the values are
+   def percentile(self, q):
+      if not self.count:
+         return None
+      rank, seen = q / 100 * self.count, 0
+      for bucket in sorted(self.buckets):
+         seen += self.buckets[bucket]
+         if seen >= rank:
+            return BUCKET_RATIO ** (bucket + 0.5)
+      return BUCKET_RATIO ** (max(self.buckets) + 0.5)
+
+   def percentiles(self, qs=(50, 90, 99, 99.9, 100)):
+      return {"p%g" % q: self.percentile(q) for q in qs}
+
+# Opens a log file for reading (gzip compressed when it ends with .gz)
+def open_log(path):
+   if path.endswith(".gz"):
+      return gzip.open(path, "rt")
+   return open(path)
+
+# Reads the given log files line by line (so the memory used does not depend
+# on the size of the logs) and returns the statistics of the events
+def analyze(paths):
+   events, sessions, locks, clears, merges = 0, 0, 0, 0, 0
+   # the number of merges resolved by each lock (the merge chain length)
+   chains = {}
+   merge_values = {}
+   logic, frame = Histogram(), Histogram()
+   chain = 0
+   for path in paths:
+      with open_log(path) as log_file:
+         for line in log_file:
+            try:
+               event = json.loads(line)
+            except ValueError:
+               continue  # e.g. a line cut off by a crash
+            events += 1
+            event_type = event.get("e")
+            if event_type == "frame":
+               logic.add(event["logic_us"])
+               frame.add(event["frame_us"])
+            elif event_type == "merge":
+               merges += 1
+               chain += 1
+               merge_values[event["value"]] = merge_values.get(event["value"], 0) + 1
+            elif event_type == "lock":
+               locks += 1
+               chains[chain] = chains.get(chain, 0) + 1
+               chain = 0
+            elif event_type == "clear":
+               clears += 1
+            elif event_type == "session":
+               sessions += 1
+               chain = 0
+   return {"events": events, "sessions": sessions, "locks": locks,
+           "merges": merges, "rows_cleared": clears,
+           "rows_cleared_per_100_locks": 100 * clears / locks if locks else 0.0,
+           "merge_chain_lengths": {str(k): chains[k] for k in sorted(chains)},
+           "merge_values": {str(k): merge_values[k] for k in sorted(merge_values)},
+           "logic_us": logic.percentiles(), "frame_us": frame.percentiles()}
+
+def main(argv=None):
+   parser = argparse.ArgumentParser(description="Tetris 2048 telemetry")
+   parser.add_argument("command", choices=["analyze"])
+   parser.add_argument("files", nargs="+")
+   parser.add_argument("--json", action="store_true", help="print the results as JSON")
+   args = parser.parse_args(argv)
+
+   stats = analyze(args.files)
+   if args.json:
+      print(json.dumps(stats, indent=2))
+      return 0
+   print("events: %d  sessions: %d  locks: %d  merges: %d" % (
+      stats["events"], stats["sessions"], stats["locks"], stats["merges"]))
+   print("rows cleared: %d (%.1f per 100 locks)" % (
+      stats["rows_cleared"], stats["rows_cleared_per_100_locks"]))
+   print("merge chain lengths (merges per lock):")
+   for length, count in stats["merge_chain_lengths"].items():
+      print("  %3s: %d" % (length, count))
+   for name in ("logic_us", "frame_us"):
+      values = ", ".join("%s=%.0f" % (q, v) for q, v in stats[name].items()
+                         if v is not None)
+      print("%s: %s" % (name, values or "no frames"))
+   return 0
+
+if __name__ == '__main__':
+   sys.exit(main())
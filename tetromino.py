@@ -2,69 +2,45 @@ from tile import Tile  # used for modeling each tile on the tetrominoes
 from point import Point  # used for tile positions
 import copy as cp  # the copy module is used for copying tiles and positions
 import random  # the random module is used for generating random values
+import struct  # used for storing tetrominoes in game snapshots
 import numpy as np  # the fundamental Python module for scientific computing
 
+# the types of the tetrominoes in the order used by the snapshots
+TYPES = "IOZLJST"
+# snapshot layout of a tetromino: type index (255 for no tetromino), rotation
+# count, x and y of the bottom left cell, and the exponents of the tile
+# numbers in its tile matrix row by row (0 for empty cells)
+SNAPSHOT = struct.Struct("<BBbh16s")
+NO_TETROMINO = SNAPSHOT.pack(255, 0, 0, 0, b"")
+# the number of rows (= number of columns) of the tile matrix of each type of
+# tetromino and its occupied cells as (column_index, row_index) in the initial
+# rotation state, in the order in which their tiles are created
+SHAPES = {
+   'I': (4, ((1, 0), (1, 1), (1, 2), (1, 3))),
+   'O': (2, ((0, 0), (1, 0), (0, 1), (1, 1))),
+   'Z': (3, ((0, 1), (1, 1), (1, 2), (2, 2))),
+   'L': (3, ((1, 0), (1, 1), (1, 2), (2, 2))),
+   'J': (3, ((1, 0), (1, 1), (1, 2), (0, 2))),  # reverse L
+   'S': (3, ((2, 1), (1, 1), (1, 2), (0, 2))),  # reverse Z
+   'T': (3, ((0, 1), (1, 1), (2, 1), (1, 2))),
+}
+
 # A class for modeling tetrominoes with 3 out of 7 different types as I, O and Z
 class Tetromino:
    # the dimensions of the game grid (defined as class variables)
    grid_height, grid_width = None, None
 
    # A constructor for creating a tetromino with a given shape (type)
-   def __init__(self, shape):
+   # The tile numbers and the horizontal position are drawn from the given
+   # random number generator (the random module when it is not given)
+   def __init__(self, shape, rng=None):
+      if rng is None:
+         rng = random
       self.type = shape  # set the type of this tetromino
       self.rotate_count = 0
       # determine the occupied (non-empty) cells in the tile matrix based on
       # the shape of this tetromino (see the documentation given with this code)
-      occupied_cells = []
-      if self.type == 'I':
-         n = 4  # n = number of rows = number of columns in the tile matrix
-         # shape of the tetromino I in its initial rotation state
-         occupied_cells.append((1, 0))  # (column_index, row_index)
-         occupied_cells.append((1, 1))
-         occupied_cells.append((1, 2))
-         occupied_cells.append((1, 3))
-      elif self.type == 'O':
-         n = 2  # n = number of rows = number of columns in the tile matrix
-         # shape of the tetromino O in its initial rotation state
-         occupied_cells.append((0, 0))  # (column_index, row_index)
-         occupied_cells.append((1, 0))
-         occupied_cells.append((0, 1))
-         occupied_cells.append((1, 1))
-      elif self.type == 'Z':
-         n = 3  # n = number of rows = number of columns in the tile matrix
-         # shape of the tetromino Z in its initial rotation state
-         occupied_cells.append((0, 1))  # (column_index, row_index)
-         occupied_cells.append((1, 1))
-         occupied_cells.append((1, 2))
-         occupied_cells.append((2, 2))
-      elif self.type == 'L':
-         n = 3  # n = number of rows = number of columns in the tile matrix
-         # shape of the tetromino L in its initial rotation state
-         occupied_cells.append((1, 0))  # (column_index, row_index)
-         occupied_cells.append((1, 1))
-         occupied_cells.append((1, 2))
-         occupied_cells.append((2, 2))
-      elif self.type == 'J': # Represents reverse L
-         n = 3  # n = number of rows = number of columns in the tile matrix
-         # shape of the tetromino reverse L in its initial rotation state
-         occupied_cells.append((1, 0))  # (column_index, row_index)
-         occupied_cells.append((1, 1))
-         occupied_cells.append((1, 2))
-         occupied_cells.append((0, 2))
-      elif self.type == 'S': # Respresents reverse Z
-         n = 3  # n = number of rows = number of columns in the tile matrix
-         # shape of the tetromino reverse Z in its initial rotation state
-         occupied_cells.append((2, 1))  # (column_index, row_index)
-         occupied_cells.append((1, 1))
-         occupied_cells.append((1, 2))
-         occupied_cells.append((0, 2))
-      elif self.type == 'T':
-         n = 3  # n = number of rows = number of columns in the tile matrix
-         # shape of the tetromino T in its initial rotation state
-         occupied_cells.append((0, 1))  # (column_index, row_index)
-         occupied_cells.append((1, 1))
-         occupied_cells.append((2, 1))
-         occupied_cells.append((1, 2))
+      n, occupied_cells = SHAPES[self.type]
       # create a matrix of numbered tiles based on the shape of this tetromino
       self.tile_matrix = np.full((n, n), None)
       # create the four tiles (minos) of this tetromino and place these tiles
@@ -72,12 +48,48 @@ class Tetromino:
       for i in range(len(occupied_cells)):
          col_index, row_index = occupied_cells[i][0], occupied_cells[i][1]
          # create a tile for each occupied cell of this tetromino
-         self.tile_matrix[row_index][col_index] = Tile()
+         self.tile_matrix[row_index][col_index] = Tile(rng)
       # initialize the position of this tetromino (as the bottom left cell in
       # the tile matrix) with a random horizontal position above the game grid
       self.bottom_left_cell = Point()
       self.bottom_left_cell.y = Tetromino.grid_height - 1
-      self.bottom_left_cell.x = random.randint(0, Tetromino.grid_width - n)
+      self.bottom_left_cell.x = rng.randint(0, Tetromino.grid_width - n)
+
+   # Returns the state of this tetromino as compact bytes (see SNAPSHOT)
+   def snapshot(self):
+      exponents = bytes([0 if tile is None else tile.number.bit_length() - 1
+                         for tile in self.tile_matrix.flat])
+      return SNAPSHOT.pack(TYPES.index(self.type), self.rotate_count,
+                           self.bottom_left_cell.x, self.bottom_left_cell.y,
+                           exponents)
+
+   # Creates a tetromino from the snapshot at the given offset of the data
+   # (None for the snapshot of no tetromino); no random values are drawn.
+   # A tetromino in the given reuse list is returned instead of a new one when
+   # its state is the same as in the snapshot.
+   @staticmethod
+   def from_snapshot(data, offset=0, reuse=()):
+      type_index, rotate_count, x, y, exponents = \
+         SNAPSHOT.unpack_from(data, offset)
+      if type_index == 255:
+         return None
+      for tetromino in reuse:
+         # the position is compared first as it rules out most tetrominoes
+         if tetromino is not None and tetromino.bottom_left_cell.x == x and \
+               tetromino.bottom_left_cell.y == y and \
+               tetromino.snapshot() == data[offset:offset + SNAPSHOT.size]:
+            return tetromino
+      tetromino = Tetromino.__new__(Tetromino)
+      tetromino.type = TYPES[type_index]
+      tetromino.rotate_count = rotate_count
+      n = SHAPES[tetromino.type][0]
+      tetromino.tile_matrix = np.empty((n, n), dtype=object)  # all None
+      for i in range(n * n):
+         if exponents[i]:
+            tetromino.tile_matrix[i // n, i % n] = Tile.with_number(
+               1 << exponents[i])
+      tetromino.bottom_left_cell = Point(x, y)
+      return tetromino
 
    # A method that computes and returns the position of the cell in the tile
    # matrix specified by the given row and column indexes
@@ -1,6 +1,7 @@
 import lib.stddraw as stddraw  # used for drawing the tiles to display them
 from lib.color import Color  # used for coloring the tiles
 import random as rd
+import copy as cp
 from point import Point
 
 
@@ -12,12 +13,36 @@ class Tile:
    boundary_thickness = 0.002
    # font family and font size used for displaying the tile number
    font_family, font_size = "Arial", 14
+   # background colors of the tiles by their numbers (see updateColor)
+   colors = {
+         2: (238, 228, 218),  # lightgray
+         4: (236, 224, 200),  # lightblue
+         8: (243, 177, 121),  # orange
+         16: (245, 149, 99),  # coral
+         32: (246, 124, 95),  # red
+         64: (246, 94, 59),  # purple
+         128: (237, 207, 114),  # green
+         256: (237, 204, 97),  # blue
+         512: (237, 200, 80),  # etc.
+         1024: (237, 197, 63),
+         2048: (237, 194, 46),
+      }
+   # tiles copied by with_number (one for each number)
+   _prototypes = {}
 
    # A constructor that creates a tile with 2 or 4 (with 50% probability) as the number on it
-   def __init__(self):
+   # The number is drawn from the given random number generator (the random
+   # module when it is not given), e.g. the generator of the game session.
+   # When a number is given, the tile is created with that number instead
+   # (e.g. when a saved game is restored) and no random number is drawn.
+   def __init__(self, rng=None, number=None):
+      if rng is None:
+         rng = rd
 
       # set the number on this tile
-      if (rd.random() < 0.5):
+      if number is not None:
+         self.number = number
+      elif (rng.random() < 0.5):
          self.number = 2
       else:
          self.number = 4
@@ -33,9 +58,49 @@ class Tile:
          self.background_color = Color(236, 224, 200)
          self.foreground_color = Color(138, 129, 120)
       self.box_color = Color(156, 146, 136) # box (boundary) color
+      # larger numbers have their own colors as the merged tiles
+      if self.number in Tile.colors and self.number > 4:
+         self.setNumber(self.number)
 
       self.position = Point()
 
+   # Copies this tile for copy.deepcopy. The colors are shared instead of
+   # copied as they are never modified, only replaced (see updateColor), which
+   # makes copying tetrominoes and their tiles much cheaper.
+   def __deepcopy__(self, memo):
+      tile = Tile.__new__(Tile)
+      tile.__dict__.update(self.__dict__)
+      tile.position = cp.copy(self.position)
+      return tile
+
+   # Returns a new tile with the given number (and its colors). The tile is
+   # copied from a prototype tile with the same number and shares its colors,
+   # which is much cheaper than creating the tile with the constructor (e.g.
+   # when a snapshot of the game is restored).
+   @staticmethod
+   def with_number(number):
+      prototype = Tile.prototype(number)
+      tile = Tile.__new__(Tile)
+      tile.__dict__ = dict(prototype.__dict__, position=Point())
+      return tile
+
+   # Returns the shared prototype tile with the given number
+   @staticmethod
+   def prototype(number):
+      prototype = Tile._prototypes.get(number)
+      if prototype is None:
+         prototype = Tile._prototypes[number] = Tile(number=number)
+      return prototype
+
+   # Changes the number of this tile to the given number and its colors to
+   # the colors of the prototype tile of the number (see with_number)
+   def renumber(self, number):
+      prototype = Tile.prototype(number)
+      self.number = number
+      self.background_color = prototype.background_color
+      self.foreground_color = prototype.foreground_color
+      self.box_color = prototype.box_color
+
    def move(self, dx, dy):
       self.position.x += dx
       self.position.y += dy
@@ -59,7 +124,12 @@ class Tile:
    # Setter for number property
    def setNumber(self, number):
       self.number = number
-      # Numara değiştirildiğinde background_color ve foreground_color değişkenlerinin de değiştirilmesi gerekiyor bu metod içinde.
+      # the colors change with the number (numbers without their own colors
+      # keep the current colors)
+      if number in Tile.colors:
+         color = Tile.colors[number]
+         self.background_color = Color(color[0], color[1], color[2])
+         self.foreground_color = Color(138, 129, 120)
 
    # Getter for number property
    def getNumber(self):
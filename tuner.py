@@ -0,0 +1,208 @@
+################################################################################
+#                                                                              #
+# Tuner: evolves the weights of the heuristic of the autoplayer                #
+#                                                                              #
+# Usage: python tuner.py CHECKPOINT [--generations 20] [--population 12]       #
+#                        [--games 8] [--max-locks 300] [--workers N]           #
+#                        [--seed 0] [--search greedy] [--budget 0]             #
+#        (continues the run saved in CHECKPOINT when the file exists)          #
+#                                                                              #
+################################################################################
+
+# The weights are tuned with an evolution strategy in the spirit of CMA-ES
+# with a diagonal covariance: each generation samples a population of weight
+# vectors around the mean (the mean itself is the first of them), plays the
+# same fixed set of seeds with each of them (common random numbers, so the
+# candidates are compared on the same games and the noise of the seeds
+# cancels out) and moves the mean and the step sizes towards the best quarter
+# of the population. As in CMA-ES, the step sizes follow the spread of the
+# best candidates at a small learning rate (the rank-mu update) and are
+# scaled up or down by the length of the evolution path of the mean
+# (cumulative step-size adaptation), so they do not collapse after a few
+# generations. The fitness of a candidate is its mean score over the seeds.
+# The games of all the candidates of a generation run at once in the same
+# pool of worker processes (see selfplay.py), which lives for the whole run,
+# in chunks of seeds of one candidate, so the weights are sent once per chunk
+# and a worker keeps its autoplayer for the games of a chunk. The state of the
+# run (the mean, the step sizes, the population and the fitness of its
+# evaluated candidates) is saved to the checkpoint after each candidate, so an
+# interrupted run continues where it stopped.
+
+import os
+import sys
+import json
+import math
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import autoplayer
+import selfplay
+from persistence import write_atomic  # the checkpoint survives crashes
+
+# the smallest step size of each weight
+MIN_SIGMA = 1e-3
+# the options that must not change when a run is continued
+RUN_OPTIONS = ("seed", "games", "max_locks", "search", "budget", "depth",
+               "population")
+
+
+# Returns the initial state of a run with the given options
+def new_run(options):
+   names = list(autoplayer.WEIGHTS)
+   mean = [autoplayer.WEIGHTS[name] for name in names]
+   return {"options": options, "names": names, "generation": 0,
+           "mean": mean, "sigma": [0.5 * abs(value) + 0.05 for value in mean],
+           "path": [0.0] * len(mean), "population": None, "fitness": None,
+           "best": None, "history": []}
+
+# Samples the population of the current generation of the given run (the
+# first candidate is the mean); the samples only depend on the seed of the
+# run and the generation, so a continued run samples the same population
+def sample_population(run):
+   rng = np.random.default_rng([run["options"]["seed"], run["generation"]])
+   size = run["options"]["population"]
+   mean, sigma = np.array(run["mean"]), np.array(run["sigma"])
+   population = mean + sigma * rng.standard_normal((size, len(mean)))
+   population[0] = mean
+   run["population"] = population.tolist()
+   run["fitness"] = [None] * size
+
+# Moves the mean and the step sizes of the given run towards the best
+# candidates of its evaluated population and starts the next generation
+def next_generation(run):
+   population = np.array(run["population"])
+   fitness = np.array(run["fitness"])
+   order = np.argsort(-fitness, kind="stable")
+   elite = max(1, len(population) // 4)
+   # the better candidates weigh more (as the recombination weights of CMA-ES)
+   ranks = np.log(elite + 0.5) - np.log(np.arange(1, elite + 1))
+   ranks /= ranks.sum()
+   selected = population[order[:elite]]
+   mean = ranks @ selected
+   n, mu_eff = len(mean), 1 / (ranks ** 2).sum()
+   previous, sigma = np.array(run["mean"]), np.array(run["sigma"])
+   # the step sizes move towards the spread of the best candidates around the
+   # previous mean at the learning rate of the rank-mu update of CMA-ES
+   # (larger by (n + 2) / 3 for a diagonal covariance)
+   rate = min(1.0, (n + 2) / 3 * 2 * (mu_eff - 2 + 1 / mu_eff) /
+              ((n + 2) ** 2 + mu_eff))
+   variance = ranks @ (selected - previous) ** 2
+   sigma = np.sqrt((1 - rate) * sigma ** 2 + rate * variance)
+   # and grow when the mean keeps moving in the same direction (the
+   # evolution path is longer than the path of random steps) or shrink when
+   # it goes back and forth (cumulative step-size adaptation)
+   c_s = (mu_eff + 2) / (n + mu_eff + 5)
+   d_s = 1 + 2 * max(0.0, np.sqrt((mu_eff - 1) / (n + 1)) - 1) + c_s
+   path = (1 - c_s) * np.array(run.get("path", [0.0] * n)) + \
+      np.sqrt(c_s * (2 - c_s) * mu_eff) * (mean - previous) / \
+      np.array(run["sigma"])
+   random_length = np.sqrt(n) * (1 - 1 / (4 * n) + 1 / (21 * n * n))
+   sigma *= np.exp(c_s / d_s * (np.linalg.norm(path) / random_length - 1))
+   run["mean"], run["path"] = mean.tolist(), path.tolist()
+   run["sigma"] = np.maximum(sigma, MIN_SIGMA).tolist()
+   best = int(order[0])
+   if run["best"] is None or fitness[best] > run["best"]["fitness"]:
+      run["best"] = {"fitness": float(fitness[best]),
+                     "weights": dict(zip(run["names"],
+                                         population[best].tolist()))}
+   run["history"].append({"generation": run["generation"],
+                          "best": float(fitness[best]),
+                          "mean": float(fitness.mean())})
+   run["generation"] += 1
+   run["population"], run["fitness"] = None, None
+
+# Saves the given run to the checkpoint at the given path
+def save_run(run, path):
+   write_atomic(path, json.dumps(run, indent=1).encode())
+
+# Returns the run saved in the checkpoint at the given path (None when there
+# is no checkpoint) after checking that it was run with the given options
+def load_run(path, options):
+   if not os.path.exists(path):
+      return None
+   with open(path) as checkpoint:
+      run = json.load(checkpoint)
+   for name in RUN_OPTIONS:
+      if run["options"][name] != options[name]:
+         raise ValueError("the checkpoint was run with %s=%r, not %r" % (
+            name, run["options"][name], options[name]))
+   return run
+
+# Evaluates the candidates of the current generation of the given run whose
+# fitness is not known yet with the given executor of the given number of
+# worker processes (see selfplay.init_worker) and saves the run after each
+# candidate. The seeds of each candidate are split in chunks played by one
+# worker each, small enough for all the workers to have a chunk.
+def evaluate_population(run, executor, workers, path):
+   options = run["options"]
+   games = options["games"]
+   pending = [candidate for candidate, fitness in enumerate(run["fitness"])
+              if fitness is None]
+   chunk = max(1, min(games, math.ceil(games * len(pending) / workers)))
+   seeds = [(index, selfplay.game_seed(options["seed"], index))
+            for index in range(games)]
+   scores = {}  # the scores of the candidates being evaluated
+   candidates = {}  # the candidate of each chunk
+   for candidate in pending:
+      weights = dict(zip(run["names"], run["population"][candidate]))
+      scores[candidate] = []
+      for start in range(0, games, chunk):
+         future = executor.submit(selfplay.play_seeds,
+                                  seeds[start:start + chunk], weights)
+         candidates[future] = candidate
+   for future in as_completed(candidates):
+      candidate = candidates[future]
+      scores[candidate] += [result.score for result in future.result()]
+      if len(scores[candidate]) == games:
+         run["fitness"][candidate] = float(np.mean(scores[candidate]))
+         save_run(run, path)
+
+def main(argv=None):
+   parser = argparse.ArgumentParser(description="Tetris 2048 weight tuner")
+   parser.add_argument("checkpoint", help="the checkpoint file of the run")
+   parser.add_argument("--generations", type=int, default=20,
+                       help="the number of generations to reach")
+   parser.add_argument("--population", type=int, default=12)
+   parser.add_argument("--games", type=int, default=8,
+                       help="the number of seeds each candidate plays")
+   parser.add_argument("--max-locks", type=int, default=300)
+   parser.add_argument("--workers", type=int, default=os.cpu_count())
+   parser.add_argument("--seed", type=int, default=0)
+   parser.add_argument("--search", choices=["greedy", "expectimax"],
+                       default="greedy")
+   parser.add_argument("--budget", type=float, default=0,
+                       help="time budget of a move in milliseconds (0 for no "
+                            "limit, which keeps the games deterministic)")
+   parser.add_argument("--depth", type=int, help="maximum depth of expectimax")
+   args = parser.parse_args(argv)
+   if args.games < 1 or args.population < 1:
+      parser.error("--games and --population must be at least 1")
+
+   options = {name: getattr(args, name) for name in RUN_OPTIONS}
+   run = load_run(args.checkpoint, options)
+   if run is None:
+      run = new_run(options)
+   else:
+      print("continuing at generation %d" % run["generation"])
+   with ProcessPoolExecutor(args.workers, initializer=selfplay.init_worker,
+                            initargs=(args.search, None, args.budget / 1000,
+                                      args.depth, args.max_locks or None)) \
+         as executor:
+      while run["generation"] < args.generations:
+         if run["population"] is None:
+            sample_population(run)
+            save_run(run, args.checkpoint)
+         evaluate_population(run, executor, args.workers, args.checkpoint)
+         next_generation(run)
+         save_run(run, args.checkpoint)
+         history = run["history"][-1]
+         print("generation %d: best %.1f, mean %.1f (best so far %.1f)" % (
+            history["generation"], history["best"], history["mean"],
+            run["best"]["fitness"]), flush=True)
+   if run["best"] is not None:
+      print("best weights: " + " ".join(
+         "--weight %s=%.4g" % item for item in run["best"]["weights"].items()))
+   return 0
+
+if __name__ == '__main__':
+   sys.exit(main())